@@ -0,0 +1,121 @@
+"""
+Generates synthetic mod projects for benchmarking bdist_wotmod.
+"""
+
+import json
+import os
+import random
+
+# Project sizes: number of modules, depth of package tree and data files as
+# (count, size in bytes) pairs
+PROJECTS = {
+    'small': {
+        'modules': 10,
+        'depth': 1,
+        'data_files': [(10, 1024)],
+    },
+    'medium': {
+        'modules': 1000,
+        'depth': 4,
+        'data_files': [(1000, 512), (100, 64 * 1024), (5, 10 * 1024 * 1024)],
+    },
+    'large': {
+        'modules': 10000,
+        'depth': 8,
+        'data_files': [(3000, 128), (1000, 64 * 1024), (20, 10 * 1024 * 1024), (1, 300 * 1024 * 1024)],
+    },
+}
+
+SETUP_PY = '''
+from setuptools import setup, find_packages
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod
+
+setup(
+    name='bench_%(name)s',
+    version='1.0.0',
+    description='Synthetic benchmark project',
+    author='benchmark',
+    packages=find_packages(),
+    data_files=%(data_files)r,
+    cmdclass={'bdist_wotmod': bdist_wotmod},
+)
+'''
+
+MODULE_TEMPLATE = '''
+import os
+
+CONSTANT_%(index)d = %(index)d
+
+class Module%(index)dHandler(object):
+
+    def __init__(self, value=CONSTANT_%(index)d):
+        self.value = value
+        self.items = [value * i for i in range(10)]
+
+    def handle(self, event):
+        if event is None:
+            return None
+        return os.path.join(str(self.value), str(event))
+
+def helper_%(index)d(first, second):
+    return dict(first=first, second=second, total=first + second)
+'''
+
+CHUNK_SIZE = 1024 * 1024
+
+def get_package_path(index, depth):
+    """
+    Returns package directory parts of module with given index, spreading
+    the modules to a tree of given depth.
+    """
+    parts = ['bench']
+    for level in range(depth - 1):
+        parts.append('pkg%d' % ((index >> (level * 2)) % 4))
+    return parts
+
+def write_data_file(path, size, rand):
+    block = bytes(bytearray(rand.getrandbits(8) for _ in range(min(size, CHUNK_SIZE))))
+    with open(path, 'wb') as data_file:
+        remaining = size
+        while remaining > 0:
+            data_file.write(block[:remaining])
+            remaining -= len(block)
+
+def generate_project(name, project_dir):
+    """
+    Generates project of given size to project_dir, unless it has already
+    been generated.
+    :return: path to project directory
+    """
+    spec = PROJECTS[name]
+    stamp_path = os.path.join(project_dir, 'generated.json')
+    if os.path.isfile(stamp_path):
+        with open(stamp_path) as stamp_file:
+            if json.load(stamp_file) == spec:
+                return project_dir
+    rand = random.Random(name)
+    for index in range(spec['modules']):
+        package_dir = project_dir
+        for part in get_package_path(index, spec['depth']):
+            package_dir = os.path.join(package_dir, part)
+            if not os.path.isdir(package_dir):
+                os.makedirs(package_dir)
+                with open(os.path.join(package_dir, '__init__.py'), 'w') as init_file:
+                    init_file.write('')
+        with open(os.path.join(package_dir, 'module%d.py' % index), 'w') as module_file:
+            module_file.write(MODULE_TEMPLATE % {'index': index})
+    data_files = {}
+    for count, size in spec['data_files']:
+        for index in range(count):
+            directory = 'data/%d/%d' % (size, index % 50)
+            path = os.path.join(project_dir, *directory.split('/'))
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            filename = '%s/file%d.bin' % (directory, index)
+            write_data_file(os.path.join(project_dir, *filename.split('/')), size, rand)
+            data_files.setdefault(directory, []).append(filename)
+    with open(os.path.join(project_dir, 'setup.py'), 'w') as setup_file:
+        setup_file.write(SETUP_PY % {'name': name, 'data_files': sorted(data_files.items())})
+    with open(stamp_path, 'w') as stamp_file:
+        json.dump(spec, stamp_file)
+    return project_dir
@@ -0,0 +1,160 @@
+"""
+Benchmarks bdist_wotmod with synthetic projects of increasing size.
+
+Usage:
+    python benchmarks/run.py [--projects small,medium] [--save results.json]
+                             [--compare baseline.json] [--threshold 0.2]
+
+Each project is built with every available compiler variant:
+
+    python27        Python 2.7 given with --python27 (or BDIST_WOTMOD_PYTHON27
+                    environment variable), using the compile server
+    python27-spawn  same interpreter, started for each compilation
+    host            the interpreter running the benchmark, only when it is
+                    Python 2.7 itself
+
+Wall time of the whole command and of each phase (from bdist_wotmod's
+--timings option) is stored, fastest of --repeat runs. With --compare the
+results are compared to earlier saved results and the script exits with
+status 1 if any of them is slower than the baseline by more than the
+threshold.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from projects import PROJECTS, generate_project
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+PROJECT_DIR = os.path.realpath(os.path.join(SCRIPT_DIR, '..'))
+
+# Measurements shorter than this are too noisy to be flagged as regressions
+MIN_COMPARED_TIME = 0.05
+
+def get_variants(python27):
+    variants = {}
+    if python27:
+        variants['python27'] = ['--python27=%s' % python27]
+        variants['python27-spawn'] = ['--python27=%s' % python27, '--compile-server-timeout=0']
+    if sys.version_info[:2] == (2, 7):
+        variants['host'] = []
+    return variants
+
+def build(project_dir, args, timings_path):
+    """
+    Builds project from scratch.
+    :return: tuple of (wall time, phase timings dict)
+    """
+    for name in ('build', 'dist'):
+        shutil.rmtree(os.path.join(project_dir, name), ignore_errors=True)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PROJECT_DIR, env.get('PYTHONPATH')]))
+    command = [sys.executable, 'setup.py', '-q', 'bdist_wotmod', '--timings=%s' % timings_path] + args
+    log_path = os.path.splitext(timings_path)[0] + '.log'
+    start_time = time.time()
+    with open(log_path, 'wb') as log_file:
+        code = subprocess.call(command, cwd=project_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    elapsed = time.time() - start_time
+    if code != 0:
+        raise RuntimeError('%s failed with error code %d, see %s' % (' '.join(command), code, log_path))
+    with open(timings_path) as timings_file:
+        timings = json.load(timings_file)
+    return elapsed, dict((phase['name'], phase['wall_time']) for phase in timings['phases'])
+
+def run_benchmarks(project_names, variants, work_dir, repeat):
+    results = {}
+    for name in project_names:
+        print('generating %s project' % name)
+        project_dir = generate_project(name, os.path.join(work_dir, name))
+        for variant, args in sorted(variants.items()):
+            key = '%s/%s' % (name, variant)
+            best = None
+            for _ in range(repeat):
+                total, phases = build(project_dir, args, os.path.join(work_dir, 'timings.json'))
+                if best is None or total < best['total']:
+                    best = {'total': total, 'phases': phases}
+            results[key] = best
+            print('%-24s %8.2f s' % (key, best['total']))
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Compares results to baseline.
+    :return: list of regression descriptions
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        measurements = [('total', result['total'], baseline[key]['total'])]
+        for phase, value in sorted(result['phases'].items()):
+            if phase in baseline[key]['phases']:
+                measurements.append((phase, value, baseline[key]['phases'][phase]))
+        for name, value, old_value in measurements:
+            change = (value - old_value) / old_value if old_value > 0 else 0
+            flag = ''
+            if value >= MIN_COMPARED_TIME and change > threshold:
+                flag = '  REGRESSION'
+                regressions.append('%s %s: %.2f s -> %.2f s' % (key, name, old_value, value))
+            print('%-24s %-26s %8.2f s %8.2f s %+7.1f%%%s' % (
+                key, name, old_value, value, change * 100, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks bdist_wotmod command.')
+    parser.add_argument('--projects', default='small,medium',
+                        help='comma separated project sizes from: %s [default: small,medium]'
+                        % ', '.join(sorted(PROJECTS)))
+    parser.add_argument('--python27', default=os.environ.get('BDIST_WOTMOD_PYTHON27'),
+                        help='path to Python 2.7 executable [default: BDIST_WOTMOD_PYTHON27 environment variable]')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per benchmark [default: 3]')
+    parser.add_argument('--work-dir', default=os.path.join(SCRIPT_DIR, '.work'),
+                        help='directory for generated projects [default: benchmarks/.work]')
+    parser.add_argument('--save', metavar='FILE', help='save results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare results to earlier saved FILE')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown flagged as regression [default: 0.2]')
+    args = parser.parse_args()
+
+    variants = get_variants(args.python27)
+    if not variants:
+        print('error: Python 2.7 interpreter is required, use --python27', file=sys.stderr)
+        return 2
+    project_names = [name.strip() for name in args.projects.split(',') if name.strip()]
+    for name in project_names:
+        if name not in PROJECTS:
+            print('error: unknown project %s' % name, file=sys.stderr)
+            return 2
+
+    results = run_benchmarks(project_names, variants, args.work_dir, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, results_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        print('')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('')
+            print('%d regressions:' % len(regressions))
+            for regression in regressions:
+                print('  %s' % regression)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,5 +21,8 @@ setup(
         "distutils.commands": [
             "bdist_wotmod = setuptools_wotmod.bdist_wotmod:bdist_wotmod",
         ],
+        "console_scripts": [
+            "wotmod = setuptools_wotmod.cli:main",
+        ],
     },
 )
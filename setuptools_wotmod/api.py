@@ -0,0 +1,136 @@
+"""
+Builds wotmod packages within the calling process, e.g. in a build service
+handling several builds concurrently:
+
+    from setuptools_wotmod.api import build_wotmod
+
+    result = build_wotmod('path/to/project', compression='deflate')
+    with open(result.metadata['filename'], 'wb') as package_file:
+        package_file.write(result.data)
+
+The same pipeline as in 'python setup.py bdist_wotmod' is run, but without
+changing the process's working directory and with build outputs in a
+temporary directory of each build. Only evaluating the project's setup.py
+needs the working directory and sys.argv, so it is serialized with a lock.
+"""
+
+from collections import namedtuple
+from distutils.core import run_setup
+from distutils.errors import DistutilsOptionError
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod
+
+# Options which only make sense for command line builds, or which create
+# several packages of the project
+UNSUPPORTED_OPTIONS = ('watch', 'watch_debounce', 'profile', 'matrix')
+
+_setup_lock = threading.Lock()
+
+# Result of a build. Data is contents of the built package, or None if it was
+# written to given output file or not created at all (unpacked deploy mode).
+# Dependencies maps file names of separately built dependency packages to
+# their contents.
+BuildResult = namedtuple('BuildResult', ['data', 'metadata', 'dependencies'])
+
+def get_option_names():
+    return set(option[0].rstrip('=').replace('-', '_') for option in bdist_wotmod.user_options)
+
+def load_distribution(project_dir):
+    """
+    Evaluates setup.py of a project, and setup.cfg if it has one.
+    :return: Distribution object with package directories made absolute
+    """
+    with _setup_lock:
+        old_cwd = os.getcwd()
+        old_path = sys.path[:]
+        os.chdir(project_dir)
+        sys.path.insert(0, project_dir)
+        try:
+            dist = run_setup('setup.py', stop_after='config')
+        finally:
+            os.chdir(old_cwd)
+            sys.path[:] = old_path
+    package_dir = dict((name, os.path.join(project_dir, path))
+                       for name, path in (dist.package_dir or {}).items())
+    package_dir.setdefault('', project_dir)
+    dist.package_dir = package_dir
+    dist.script_name = os.path.join(project_dir, 'setup.py')
+    return dist
+
+def build_wotmod(project_dir, output=None, **options):
+    """
+    Builds wotmod package of a project. Can be called from several threads
+    at a time.
+
+    :param project_dir: directory containing setup.py of the project
+    :param output: binary file-like object to write the package to, if not
+                   given the package is returned as bytes
+    :param options: bdist_wotmod options, with '-' in names replaced with
+                    '_', e.g. mod_version='1.2.3'
+    :return: BuildResult object
+    """
+    unknown = set(options) - get_option_names()
+    if unknown:
+        raise DistutilsOptionError('unknown options: %s' % ', '.join(sorted(unknown)))
+    unsupported = set(options) & set(UNSUPPORTED_OPTIONS)
+    if unsupported:
+        raise DistutilsOptionError('options not supported by build_wotmod(): %s'
+                                   % ', '.join(sorted(unsupported)))
+    project_dir = os.path.abspath(project_dir)
+    dist = load_distribution(project_dir)
+    work_dir = tempfile.mkdtemp(prefix='wotmod-build-')
+    try:
+        dist.cmdclass['bdist_wotmod'] = bdist_wotmod
+        dist.get_command_obj('build').build_base = os.path.join(work_dir, 'build')
+        cmd = dist.get_command_obj('bdist_wotmod')
+        cmd.project_dir = project_dir
+        cmd.bdist_dir = os.path.join(work_dir, 'bdist')
+        cmd.dist_dir = os.path.join(work_dir, 'dist')
+        for name, value in options.items():
+            setattr(cmd, name, value)
+        cmd.ensure_finalized()
+        cmd.run()
+        return get_result(cmd, output)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def get_result(cmd, output):
+    """
+    Collects built packages and metadata of a finished bdist_wotmod command.
+    """
+    package_path = cmd.get_output_file_path()
+    metadata = {
+        'id': '%s.%s' % (cmd.author_id, cmd.mod_id),
+        'version': cmd.mod_version,
+        'filename': None,
+        'size': None,
+        'sha256': None,
+        'timings': cmd.recorder.get_report(),
+    }
+    data = None
+    if package_path in cmd.package_paths:
+        digest = hashlib.sha256()
+        size = 0
+        with open(package_path, 'rb') as package_file:
+            if output is None:
+                data = package_file.read()
+                digest.update(data)
+                size = len(data)
+            else:
+                for chunk in iter(lambda: package_file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+        metadata.update(filename=os.path.basename(package_path), size=size, sha256=digest.hexdigest())
+    dependencies = {}
+    for path in cmd.package_paths:
+        if path != package_path:
+            with open(path, 'rb') as dependency_file:
+                dependencies[os.path.basename(path)] = dependency_file.read()
+    return BuildResult(data, metadata, dependencies)
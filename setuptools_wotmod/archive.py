@@ -0,0 +1,417 @@
+"""
+Low-level helpers for writing zip archives. The zipfile module lacks means to
+copy already compressed members between archives and to choose compression
+level per member, these functions implement that with zipfile's internals, in
+the same way as ZipFile.write() does.
+"""
+
+from collections import deque, namedtuple
+import hashlib
+from multiprocessing.pool import ThreadPool
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+# Compression methods by name, bzip2 and lzma are only available in Python 3
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': getattr(zipfile, 'ZIP_BZIP2', None),
+    'lzma': getattr(zipfile, 'ZIP_LZMA', None),
+}
+
+# Compression levels used when level is not given
+DEFAULT_LEVELS = {
+    zipfile.ZIP_STORED: 0,
+    zipfile.ZIP_DEFLATED: 6,
+    COMPRESSION_METHODS['bzip2']: 9,
+    COMPRESSION_METHODS['lzma']: 6,
+}
+
+# Id of an extra field which stores the compression level of a member, allows
+# telling if a member needs to be recompressed when updating a package
+LEVEL_EXTRA_ID = 0x6d77
+
+# Earliest timestamp a zip file can store
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+def parse_compression(value):
+    """
+    Parses compression spec, a method name optionally followed by a colon and
+    compression level, e.g. 'deflate:9'.
+    :return: tuple of (compression type, level)
+    """
+    method, _, level = value.strip().lower().partition(':')
+    if COMPRESSION_METHODS.get(method) is None:
+        raise ValueError('unsupported compression method %r' % method)
+    compress_type = COMPRESSION_METHODS[method]
+    if not level:
+        return compress_type, DEFAULT_LEVELS[compress_type]
+    level = int(level)
+    if compress_type == zipfile.ZIP_STORED:
+        raise ValueError('stored compression does not take a level')
+    if not (0 if compress_type != COMPRESSION_METHODS['bzip2'] else 1) <= level <= 9:
+        raise ValueError('invalid compression level %d for %s' % (level, method))
+    return compress_type, level
+
+class CompressionPolicy(object):
+    """
+    Decides how each package member is compressed, based on its file
+    extension.
+    """
+
+    def __init__(self, default='stored', overrides=''):
+        """
+        :param default: compression spec for members without an override
+        :param overrides: comma separated list of <extension>=<compression
+                          spec> pairs, e.g. '.pyc=stored,.xml=deflate:9'
+        """
+        self.default = parse_compression(default)
+        self.overrides = {}
+        for override in filter(None, (o.strip() for o in overrides.split(','))):
+            extension, sep, spec = override.partition('=')
+            if not sep:
+                raise ValueError('invalid compression override %r' % override)
+            extension = extension.strip().lower()
+            if not extension.startswith('.'):
+                extension = '.' + extension
+            self.overrides[extension] = parse_compression(spec)
+
+    def get(self, archive_path):
+        """
+        :return: tuple of (compression type, level) for a member
+        """
+        if archive_path.endswith('/'):
+            return zipfile.ZIP_STORED, 0
+        extension = os.path.splitext(archive_path)[1].lower()
+        return self.overrides.get(extension, self.default)
+
+def get_source_date_time():
+    """
+    Returns timestamp for reproducible packages, from SOURCE_DATE_EPOCH
+    environment variable if set.
+    """
+    if 'SOURCE_DATE_EPOCH' in os.environ:
+        return max(ZIP_EPOCH, time.gmtime(int(os.environ['SOURCE_DATE_EPOCH']))[0:6])
+    return ZIP_EPOCH
+
+def set_compression(zinfo, compress_type, level):
+    """
+    Sets compression type of a member, and its level as an extra field.
+    """
+    zinfo.compress_type = compress_type
+    if compress_type == zipfile.ZIP_STORED:
+        zinfo.extra = b''
+    else:
+        zinfo.extra = struct.pack('<HHB', LEVEL_EXTRA_ID, 1, level)
+
+def get_compression(zinfo):
+    """
+    :return: tuple of (compression type, level or None if unknown)
+    """
+    if zinfo.compress_type == zipfile.ZIP_STORED:
+        return zipfile.ZIP_STORED, 0
+    extra = zinfo.extra
+    while len(extra) >= 4:
+        field_id, size = struct.unpack('<HH', extra[:4])
+        if field_id == LEVEL_EXTRA_ID and size == 1:
+            return zinfo.compress_type, struct.unpack('<B', extra[4:5])[0]
+        extra = extra[4 + size:]
+    return zinfo.compress_type, None
+
+class LZMACompressor(object):
+    """
+    Like zipfile.LZMACompressor, but with configurable preset.
+    """
+
+    def __init__(self, preset):
+        import lzma
+        props = lzma._encode_filter_properties({'id': lzma.FILTER_LZMA1, 'preset': preset})
+        self.header = struct.pack('<BBH', 9, 4, len(props)) + props
+        self.compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[
+            lzma._decode_filter_properties(lzma.FILTER_LZMA1, props)
+        ])
+
+    def compress(self, data):
+        header, self.header = self.header, b''
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        header, self.header = self.header, b''
+        return header + self.compressor.flush()
+
+def get_compressor(compress_type, level):
+    """
+    :return: compressor object, or None for stored members
+    """
+    if compress_type == zipfile.ZIP_STORED:
+        return None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+    if compress_type == COMPRESSION_METHODS['bzip2']:
+        import bz2
+        return bz2.BZ2Compressor(level)
+    if compress_type == COMPRESSION_METHODS['lzma']:
+        return LZMACompressor(level)
+    raise ValueError('unsupported compression type %r' % compress_type)
+
+def get_file_crc(path):
+    """
+    Calculates CRC-32 of a file, reading it in chunks.
+    :return: tuple of (CRC, file size)
+    """
+    crc = 0
+    size = 0
+    with open(path, 'rb') as source_file:
+        while True:
+            chunk = source_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return crc & 0xffffffff, size
+
+def hash_file(path):
+    """
+    Calculates SHA-1 hex digest of a file, reading it in chunks.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_data_crc(data):
+    """
+    :return: tuple of (CRC, data size)
+    """
+    return zlib.crc32(data) & 0xffffffff, len(data)
+
+def zipinfo_from_file(path, archive_path):
+    """
+    Creates ZipInfo object for a file, equal to the one ZipFile.write()
+    creates.
+    """
+    st = os.stat(path)
+    zinfo = zipfile.ZipInfo(archive_path, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    return zinfo
+
+def zipinfo_for_directory(archive_path):
+    """
+    Creates ZipInfo object for a directory, equal to the one
+    ZipFile.writestr() creates.
+    """
+    zinfo = zipfile.ZipInfo(archive_path, time.localtime(time.time())[0:6])
+    zinfo.external_attr = 0o40775 << 16 | 0x10
+    zinfo.file_size = 0
+    return zinfo
+
+def zipinfo_from_data(archive_path, data):
+    """
+    Creates ZipInfo object for data, equal to the one ZipFile.writestr()
+    creates.
+    """
+    zinfo = zipfile.ZipInfo(archive_path, time.localtime(time.time())[0:6])
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = len(data)
+    return zinfo
+
+def iter_raw_member(zip, zinfo):
+    """
+    Reads compressed contents of a member without decompressing it.
+    :return: iterator of data chunks
+    """
+    zip.fp.seek(zinfo.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, zip.fp.read(zipfile.sizeFileHeader))
+    zip.fp.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        chunk = zip.fp.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipfile('Truncated member %s' % zinfo.filename)
+        remaining -= len(chunk)
+        yield chunk
+
+def copy_raw_member(source_zip, source_info, target_zip, zinfo):
+    """
+    Copies compressed contents of a member in source_zip to target_zip as is,
+    using given ZipInfo object for the new member.
+    """
+    zinfo.compress_type = source_info.compress_type
+    zinfo.CRC = source_info.CRC
+    zinfo.file_size = source_info.file_size
+    zinfo.compress_size = source_info.compress_size
+    write_raw_member(target_zip, zinfo, iter_raw_member(source_zip, source_info))
+
+# Member to write with write_members(). Contents are read from file in path,
+# or given as data, or copied as is from a (ZipFile, ZipInfo) tuple in raw.
+Member = namedtuple('Member', ['zinfo', 'path', 'data', 'raw'])
+
+def write_members(zip, members, threads=1, memory_limit=256 * 1024 * 1024):
+    """
+    Writes members to zip in given order. With several threads the members are
+    compressed in parallel (zlib, bz2 and lzma release the GIL while
+    compressing), while at most memory_limit bytes of them are held in memory
+    at a time. Members larger than that are compressed while writing them. The
+    output is identical to what one thread produces.
+    :return: total uncompressed size of the members
+    """
+    total_size = 0
+    if threads <= 1:
+        for member in members:
+            write_one_member(zip, member)
+            total_size += member.zinfo.file_size
+        return total_size
+
+    pool = ThreadPool(threads)
+    pending = deque()
+    in_flight = [0]
+
+    def submit(member):
+        size = member.zinfo.file_size
+        if member.raw is None and member.zinfo.compress_type != zipfile.ZIP_STORED and size <= memory_limit:
+            pending.append((member, pool.apply_async(compress_member, (member.zinfo, member.path, member.data)), size))
+            in_flight[0] += size
+        else:
+            pending.append((member, None, 0))
+
+    try:
+        members = iter(members)
+        next_member = next(members, None)
+        while pending or next_member is not None:
+            while next_member is not None and (not pending or in_flight[0] + next_member.zinfo.file_size <= memory_limit):
+                submit(next_member)
+                next_member = next(members, None)
+            member, result, size = pending.popleft()
+            if result is None:
+                write_one_member(zip, member)
+            else:
+                write_raw_member(zip, member.zinfo, result.get())
+                in_flight[0] -= size
+            total_size += member.zinfo.file_size
+    finally:
+        pool.close()
+        pool.join()
+    return total_size
+
+def write_one_member(zip, member):
+    if member.raw is not None:
+        copy_raw_member(member.raw[0], member.raw[1], zip, member.zinfo)
+    else:
+        write_member(zip, member.zinfo, member.path, member.data)
+
+def iter_source_chunks(path, data):
+    """
+    Returns contents of a file, or given data, in chunks of CHUNK_SIZE.
+    """
+    if path is None:
+        for offset in range(0, len(data or b''), CHUNK_SIZE):
+            yield data[offset:offset + CHUNK_SIZE]
+        return
+    with open(path, 'rb') as source_file:
+        while True:
+            chunk = source_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def compress_member(zinfo, path=None, data=None):
+    """
+    Compresses a member to memory, filling in CRC and sizes of zinfo. Feeds
+    the compressor with same chunks as write_member() does so that the
+    compressed output is the same.
+    :return: list of compressed chunks
+    """
+    compressor = get_compressor(*get_compression(zinfo))
+    crc = 0
+    file_size = 0
+    compressed = []
+    for chunk in iter_source_chunks(path, data):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        compressed.append(compressor.compress(chunk))
+    compressed.append(compressor.flush())
+    zinfo.CRC = crc & 0xffffffff
+    zinfo.file_size = file_size
+    zinfo.compress_size = sum(len(chunk) for chunk in compressed)
+    return compressed
+
+def write_member(zip, zinfo, path=None, data=None):
+    """
+    Compresses file in given path, or given data, to zip with compression type
+    and level given in zinfo. The file is read and written in chunks, so it
+    never needs to fit to memory.
+    """
+    compressor = get_compressor(*get_compression(zinfo))
+    state = {'crc': 0, 'file_size': 0, 'compress_size': 0}
+
+    def iter_compressed():
+        for chunk in iter_source_chunks(path, data):
+            state['crc'] = zlib.crc32(chunk, state['crc'])
+            state['file_size'] += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            state['compress_size'] += len(chunk)
+            yield chunk
+        if compressor is not None:
+            chunk = compressor.flush()
+            state['compress_size'] += len(chunk)
+            yield chunk
+
+    zinfo.CRC = 0
+    zinfo.compress_size = 0
+    zip64 = write_raw_member(zip, zinfo, iter_compressed())
+    zinfo.CRC = state['crc'] & 0xffffffff
+    zinfo.file_size = state['file_size']
+    zinfo.compress_size = state['compress_size']
+    if not zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+        raise zipfile.LargeZipFile('File size of %s has increased during writing' % zinfo.filename)
+    # Rewrite header now that CRC and sizes are known
+    end = zip.fp.tell()
+    zip.fp.seek(zinfo.header_offset)
+    zip.fp.write(zinfo.FileHeader(zip64))
+    zip.fp.seek(end)
+
+def write_raw_member(zip, zinfo, chunks):
+    """
+    Writes already compressed member to zip. The zinfo must have compression
+    type, CRC, file size and compressed size set.
+    :return: True if the member was written with zip64 extensions
+    """
+    zinfo.flag_bits = 0x00
+    if zinfo.compress_type == getattr(zipfile, 'ZIP_LZMA', None):
+        # LZMA data starts with an EOS marker flag
+        zinfo.flag_bits |= 0x02
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16
+    zip64 = zip._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    if hasattr(zip, 'start_dir'):
+        zip.fp.seek(zip.start_dir)
+    zinfo.header_offset = zip.fp.tell()
+    zip._writecheck(zinfo)
+    zip._didModify = True
+    zip.fp.write(zinfo.FileHeader(zip64))
+    for chunk in chunks:
+        zip.fp.write(chunk)
+    zip.filelist.append(zinfo)
+    zip.NameToInfo[zinfo.filename] = zinfo
+    if hasattr(zip, 'start_dir'):
+        zip.start_dir = zip.fp.tell()
+    return zip64
+
+def replace_file(source, target):
+    """
+    Atomically moves source over target.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    else:
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
@@ -0,0 +1,310 @@
+"""
+Builds wotmod packages of several setuptools projects concurrently.
+
+Usage: python -m setuptools_wotmod.batch projects.toml
+
+The projects file lists project directories and bdist_wotmod options for each
+of them. It can be either in TOML format (requires Python 3.11 or the toml
+package):
+
+    [batch]
+    dist_dir = "dist"
+    jobs = 4
+    python27 = "/usr/bin/python2"
+
+    [[project]]
+    path = "mods/helloworld"
+
+    [[project]]
+    name = "pydash"
+    path = "vendor/pydash-4.2.1"
+    options = { install_lib = "res/scripts/common", author_id = "com.github.dgilland" }
+
+Or in INI format (file extension .cfg or .ini), where each project has its own
+section and other keys than name and path are bdist_wotmod options:
+
+    [batch]
+    dist_dir = dist
+    jobs = 4
+
+    [project:pydash]
+    path = vendor/pydash-4.2.1
+    install_lib = res/scripts/common
+
+Projects are built in this process with build_wotmod() from
+setuptools_wotmod.api, on a pool of at most jobs threads, and share the same
+Python 2.7 compile servers and output directory. Output of each build goes to
+its own log file. A failing project does not stop the others from being
+built.
+"""
+
+from __future__ import print_function
+
+import argparse
+from distutils import log
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+import threading
+import time
+import traceback
+
+from setuptools_wotmod.api import build_wotmod
+from setuptools_wotmod.archive import replace_file
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod, get_temporary_path
+from setuptools_wotmod.compile_server import CompileServerError, get_compile_server
+
+try:
+    from configparser import RawConfigParser
+except ImportError:
+    from ConfigParser import RawConfigParser
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+class BatchConfigError(Exception):
+    pass
+
+def load_config(path):
+    """
+    Reads projects file.
+    :return: tuple of (batch settings dict, list of project dicts)
+    """
+    if os.path.splitext(path)[1].lower() in ('.cfg', '.ini'):
+        batch, projects = load_ini_config(path)
+    else:
+        batch, projects = load_toml_config(path)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for project in projects:
+        if 'path' not in project:
+            raise BatchConfigError('project %s has no path' % project.get('name', '?'))
+        project['path'] = os.path.join(base_dir, project['path'])
+        project.setdefault('name', os.path.basename(os.path.normpath(project['path'])))
+        project.setdefault('options', {})
+    if 'dist_dir' in batch:
+        batch['dist_dir'] = os.path.join(base_dir, batch['dist_dir'])
+    return batch, projects
+
+def load_toml_config(path):
+    try:
+        import tomllib
+        with open(path, 'rb') as config_file:
+            config = tomllib.load(config_file)
+    except ImportError:
+        try:
+            import toml
+        except ImportError:
+            raise BatchConfigError('reading %s requires Python 3.11 or the toml package, '
+                                   'use INI format (.cfg) instead' % path)
+        with open(path, 'r') as config_file:
+            config = toml.load(config_file)
+    projects = [dict(project) for project in config.get('project', [])]
+    return dict(config.get('batch', {})), projects
+
+def load_ini_config(path):
+    parser = RawConfigParser()
+    if not parser.read(path):
+        raise BatchConfigError('cannot read %s' % path)
+    batch = dict(parser.items('batch')) if parser.has_section('batch') else {}
+    projects = []
+    for section in parser.sections():
+        if not section.startswith('project'):
+            continue
+        project = {'options': {}}
+        if ':' in section:
+            project['name'] = section.split(':', 1)[1].strip()
+        for key, value in parser.items(section):
+            if key in ('name', 'path'):
+                project[key] = value
+            else:
+                project['options'][key] = value
+        projects.append(project)
+    return batch, projects
+
+class ThreadOutput(object):
+    """
+    Output stream which writes to a file set for the calling thread, and to
+    the wrapped stream in other threads. Lets each build running in the pool
+    write its output to its own log file.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def get_stream(self):
+        return getattr(self.local, 'file', None) or self.stream
+
+    def write(self, data):
+        self.get_stream().write(data)
+
+    def flush(self):
+        self.get_stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.get_stream(), name)
+
+def set_thread_output(output_file):
+    """
+    Redirects standard output and error of the calling thread to given file,
+    or back to the original streams if None.
+    """
+    for stream in (sys.stdout, sys.stderr):
+        if isinstance(stream, ThreadOutput):
+            stream.local.file = output_file
+
+def get_build_options(project, python27=None, jobs=None):
+    """
+    Returns bdist_wotmod options of a project as keyword arguments of
+    build_wotmod().
+    """
+    options = {}
+    for key, value in project['options'].items():
+        key = key.replace('-', '_')
+        # Values from INI files are strings
+        if key in bdist_wotmod.boolean_options and not isinstance(value, bool):
+            value = str(value).strip().lower() in TRUE_VALUES
+        if value is True:
+            options[key] = 1
+        elif value is not False and value is not None:
+            options[key] = str(value)
+    # Packages are always written to the batch's output directory
+    options.pop('dist_dir', None)
+    if python27 and 'python27' not in options:
+        options['python27'] = python27
+    if jobs and 'jobs' not in options:
+        options['jobs'] = str(jobs)
+    return options
+
+def save_packages(result, package_path, dist_dir):
+    """
+    Moves package written to package_path and writes packages of separately
+    built dependencies to dist_dir.
+    """
+    if result.metadata['filename']:
+        replace_file(package_path, os.path.join(dist_dir, result.metadata['filename']))
+    for filename, data in result.dependencies.items():
+        path = os.path.join(dist_dir, filename)
+        tmp_path = get_temporary_path(path)
+        with open(tmp_path, 'wb') as package_file:
+            package_file.write(data)
+        replace_file(tmp_path, path)
+
+def build_project(project, dist_dir, log_dir, python27=None, jobs=None):
+    """
+    Builds wotmod package of a project, writing its output to a log file.
+    :return: result dict with project name, status, duration and log path
+    """
+    log_path = os.path.join(log_dir, '%s.log' % project['name'])
+    package_path = get_temporary_path(os.path.join(dist_dir, project['name']))
+    start_time = time.time()
+    ok = False
+    with open(log_path, 'w') as log_file:
+        set_thread_output(log_file)
+        try:
+            with open(package_path, 'wb') as package_file:
+                result = build_wotmod(project['path'], package_file, **get_build_options(project, python27, jobs))
+            save_packages(result, package_path, dist_dir)
+            ok = True
+        except (Exception, SystemExit):
+            traceback.print_exc(file=log_file)
+        finally:
+            set_thread_output(None)
+            if os.path.exists(package_path):
+                os.remove(package_path)
+    return {
+        'name': project['name'],
+        'ok': ok,
+        'duration': time.time() - start_time,
+        'log': log_path,
+    }
+
+def start_compile_servers(python27, jobs, timeout):
+    """
+    Starts compile servers before the projects are built, so that concurrently
+    started projects don't each start their own servers.
+    """
+    for slot in range(jobs):
+        try:
+            get_compile_server(python27, 0, timeout, slot)
+        except CompileServerError as err:
+            print('warning: cannot start compile server: %s' % err, file=sys.stderr)
+            return
+
+def print_summary(results, out=sys.stdout):
+    width = max([len(result['name']) for result in results] + [7])
+    print('', file=out)
+    print('%-*s  %-6s  %8s' % (width, 'project', 'status', 'time'), file=out)
+    print('-' * (width + 18), file=out)
+    for result in results:
+        status = 'ok' if result['ok'] else 'FAILED'
+        print('%-*s  %-6s  %7.1fs' % (width, result['name'], status, result['duration']), file=out)
+    failed = [result for result in results if not result['ok']]
+    print('-' * (width + 18), file=out)
+    print('%d built, %d failed' % (len(results) - len(failed), len(failed)), file=out)
+    for result in failed:
+        print('see %s for output of %s' % (result['log'], result['name']), file=out)
+
+def run_batch(projects, dist_dir, jobs=None, python27=None, compile_jobs=None, server_timeout=300):
+    """
+    Builds given projects, at most jobs projects at a time.
+    :return: list of result dicts, in same order as the projects
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    dist_dir = os.path.abspath(dist_dir)
+    log_dir = os.path.join(dist_dir, 'logs')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    if python27:
+        start_compile_servers(python27, compile_jobs or 1, server_timeout)
+    print_lock = threading.Lock()
+
+    def build(project):
+        result = build_project(project, dist_dir, log_dir, python27, compile_jobs)
+        with print_lock:
+            print('%s %s (%.1fs)' % (result['name'], 'built' if result['ok'] else 'FAILED', result['duration']))
+        return result
+
+    old_streams = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+    # Log the same as 'python setup.py bdist_wotmod' would
+    old_threshold = log.set_threshold(log.INFO)
+    pool = ThreadPool(max(1, min(jobs, len(projects))))
+    try:
+        return pool.map(build, projects)
+    finally:
+        pool.close()
+        log.set_threshold(old_threshold)
+        sys.stdout, sys.stderr = old_streams
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m setuptools_wotmod.batch',
+        description='Builds wotmod packages of several projects concurrently.')
+    parser.add_argument('projects_file', help='TOML or INI (.cfg) file listing the projects')
+    parser.add_argument('--dist-dir', help='directory to put built packages in [default: dist]')
+    parser.add_argument('--jobs', type=int, help='number of projects built at a time [default: one per CPU]')
+    parser.add_argument('--compile-jobs', type=int,
+                        help='number of parallel byte-compile workers shared by the projects [default: 1]')
+    parser.add_argument('--python27', help='path to Python 2.7 executable '
+                        '[default: BDIST_WOTMOD_PYTHON27 environment variable]')
+    args = parser.parse_args(argv)
+
+    try:
+        batch, projects = load_config(args.projects_file)
+    except (BatchConfigError, ValueError, KeyError) as err:
+        print('error: %s' % err, file=sys.stderr)
+        return 2
+    python27 = args.python27 or batch.get('python27') or os.environ.get('BDIST_WOTMOD_PYTHON27')
+    results = run_batch(
+        projects,
+        dist_dir=args.dist_dir or batch.get('dist_dir') or 'dist',
+        jobs=args.jobs or int(batch.get('jobs', 0)),
+        python27=python27,
+        compile_jobs=args.compile_jobs or int(batch.get('compile_jobs', 1)),
+    )
+    print_summary(results)
+    return 0 if all(result['ok'] for result in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,24 +5,65 @@ wotmod package of them.
 """
 
 from distutils import log
+from distutils.dep_util import newer
 from distutils.dir_util import mkpath, remove_tree
+from distutils.errors import (DistutilsByteCompileError, DistutilsError, DistutilsExecError,
+                              DistutilsOptionError)
 from distutils.file_util import copy_file
 import distutils.util
+from distutils.util import change_root, convert_path
+from distutils.spawn import find_executable
 from setuptools import Command
 from setuptools.extern import packaging
+from setuptools.extern.packaging.utils import canonicalize_name
 
-from contextlib import contextmanager
+from setuptools_wotmod.archive import (CHUNK_SIZE, CompressionPolicy, Member, get_compression,
+                                       get_data_crc, get_file_crc, get_source_date_time, hash_file,
+                                       replace_file, set_compression, write_members, zipinfo_for_directory,
+                                       zipinfo_from_data, zipinfo_from_file)
+from setuptools_wotmod.compile_server import CompileServerError, get_compile_server
+from setuptools_wotmod.deploy import sync_entries
+from setuptools_wotmod.dependencies import (build_dependency, get_cache_dir, get_dependency_chain,
+                                            parse_requirements)
+from setuptools_wotmod.instrumentation import PhaseRecorder, get_files_stats
+from setuptools_wotmod.optimize import get_entry_size, log_size_report, optimize_entries, read_entry
+from setuptools_wotmod.prune import (GAME_MODS_DIR, Module, ModuleGraph, get_module_name, get_package_prefix,
+                                     is_entry_module, join_name, parse_keep_patterns, read_source)
+from setuptools_wotmod.pyc_cache import PycCache, get_interpreter_version
+from setuptools_wotmod.remote_cache import RemoteCache
+from setuptools_wotmod.resources import DIRECTORY, FILE, MANIFEST_NAME, ManifestEntry, format_manifest
+from setuptools_wotmod.watch import create_watcher, wait_for_changes
+
+import calendar
+from collections import namedtuple
+import cProfile
+import copy
+import fnmatch
 from functools import partial
+import hashlib
+import io
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import posixpath
 import re
+import shutil
 import struct
+import subprocess
+import sys
+import tempfile
 from tempfile import NamedTemporaryFile
+import threading
+import time
 import warnings
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import zipfile
 
+# Options which may differ between variants of a matrix build
+MATRIX_OPTIONS = ('author_id', 'mod_id', 'mod_description', 'install_lib', 'install_data', 'version_padding')
+
 class bdist_wotmod(Command):
 
     description = 'create .wotmod mod package for World of Tanks'
@@ -48,11 +89,101 @@ class bdist_wotmod(Command):
          "installation directory for module distributions [default: 'res/scripts/client/gui/mods']"),
         ('install-data=', None,
          "installation directory for data files [default: 'res/mods/<author_id>.<mod_id>']"),
+        ('matrix=', None,
+         "comma separated variants to package from the same build, each configured in "
+         "[bdist_wotmod:<variant>] section of setup.cfg with %s options"
+         % ', '.join(name.replace('_', '-') for name in MATRIX_OPTIONS)),
         ('python27=', None,
          "Path to Python 2.7 executable (required when command is executed with non-2.7 Python interpreter) "
          "[default: BDIST_WOTMOD_PYTHON27 environment variable]"),
+        ('compile-server-timeout=', None,
+         "seconds of inactivity after which the Python 2.7 compile server shuts down, "
+         "0 starts a new interpreter for each compilation instead [default: 300]"),
+        ('jobs=', None,
+         "number of parallel byte-compile workers, 0 uses one worker per CPU [default: 1]"),
+        ('incremental', None,
+         "byte-compile only modules which have changed since the previous build"),
+        ('direct', None,
+         "write build outputs straight into the package without staging them to bdist-dir"),
+        ('update', None,
+         "copy unchanged files from an existing package as is instead of writing them again"),
+        ('isolated', None,
+         "build and stage files in directories of this run only, removed afterwards, so that "
+         "several runs can build the same project at the same time"),
+        ('compression=', None,
+         "compression of package members: stored, deflate, bzip2 or lzma, optionally followed by "
+         "level, e.g. deflate:9 [default: stored]"),
+        ('compression-overrides=', None,
+         "comma separated per extension compressions, e.g. '.pyc=stored,.xml=deflate:9'"),
+        ('reproducible', None,
+         "create byte-for-byte reproducible package with sorted members, fixed timestamps "
+         "(SOURCE_DATE_EPOCH environment variable if set) and normalized permissions"),
+        ('pack-threads=', None,
+         "number of threads compressing package members, 0 uses one thread per CPU [default: 1]"),
+        ('pack-memory-limit=', None,
+         "megabytes of compressed members the threads may hold in memory at a time [default: 256]"),
+        ('dependency-dir=', None,
+         "directory of source packages from which install_requires dependencies are built, "
+         "nothing is downloaded"),
+        ('bundle-dependencies=', None,
+         "how dependencies are bundled: 'separate' packages or 'vendor' into this package "
+         "[default: separate]"),
+        ('dependency-install-lib=', None,
+         "installation directory for dependencies [default: 'res/scripts/common']"),
+        ('cache-dir=', None,
+         "directory for cached build artifacts [default: BDIST_WOTMOD_CACHE_DIR environment variable "
+         "or user's cache directory]"),
+        ('pyc-cache', None,
+         "reuse modules compiled by earlier builds of any project from cache-dir instead of "
+         "compiling them again"),
+        ('pyc-cache-size=', None,
+         "maximum size of the compiled modules cache in megabytes, least recently used modules "
+         "are evicted [default: 512]"),
+        ('remote-cache=', None,
+         "URL of a remote cache of compiled modules and packages shared by several machines, "
+         "e.g. http://cache.example.com:8080 [default: BDIST_WOTMOD_REMOTE_CACHE environment variable]"),
+        ('stage-links=', None,
+         "how data files are staged to bdist-dir: 'auto' uses reflinks or hard links where the "
+         "file system supports them, 'copy' always copies [default: auto]"),
+        ('prune', None,
+         "compile and package only modules reachable by imports from the mod_* entry modules "
+         "and from modules kept with prune-keep"),
+        ('prune-keep=', None,
+         "comma separated modules, or patterns like 'foo.plugins.*', to keep when pruning "
+         "together with modules they import"),
+        ('optimize=', None,
+         "byte-compile modules with optimization equivalent to python -O (1) or -OO (2), "
+         "packaged as .pyc files which the game loads [default: 0]"),
+        ('exclude-sources', None,
+         "leave sources of compiled modules out of the package"),
+        ('minify-data', None,
+         "remove comments and insignificant whitespace from XML and JSON files"),
+        ('size-report=', None,
+         "write package size before and after optimizations by directory and file type "
+         "as JSON to this file"),
+        ('resource-manifest', None,
+         "list path, size, CRC-32 and type of files in the package in %s in "
+         "install-data, for finding files without walking the game's file system" % MANIFEST_NAME),
+        ('timings=', None,
+         "write wall time, CPU time, file counts, bytes written and peak memory "
+         "of each build phase as JSON to this file"),
+        ('profile=', None,
+         "save cProfile statistics of the whole command to this file"),
+        ('deploy-dir=', None,
+         "copy built packages to this directory, e.g. game's mods/<version> directory"),
+        ('deploy-mode=', None,
+         "'package' copies built packages to deploy-dir, 'unpacked' syncs their contents to it "
+         "like to a res_mods directory, without creating packages [default: package]"),
+        ('watch', None,
+         "keep running and rebuild when sources, data files or documents change, "
+         "implies --incremental, --direct and --update"),
+        ('watch-debounce=', None,
+         "seconds to wait for further changes before rebuilding [default: 0.1]"),
     ]
 
+    boolean_options = ['incremental', 'direct', 'update', 'isolated', 'reproducible', 'watch', 'pyc_cache',
+                       'exclude_sources', 'minify_data', 'prune', 'resource_manifest']
+
     def initialize_options(self):
         self.bdist_dir       = None
         self.dist_dir        = None
@@ -64,15 +195,174 @@ class bdist_wotmod(Command):
         self.install_lib     = None
         self.install_data    = None
         self.python27        = None
+        self.compile_server_timeout = None
+        self.jobs            = None
+        self.incremental     = 0
+        self.direct          = 0
+        self.update          = 0
+        self.compression     = None
+        self.compression_overrides = None
+        self.reproducible    = 0
+        self.pack_threads    = None
+        self.pack_memory_limit = None
+        self.dependency_dir  = None
+        self.bundle_dependencies = None
+        self.dependency_install_lib = None
+        self.cache_dir       = None
+        self.pyc_cache       = 0
+        self.pyc_cache_size  = None
+        self.remote_cache    = None
+        self.stage_links     = None
+        self.prune           = 0
+        self.prune_keep      = None
+        self.optimize        = None
+        self.exclude_sources = 0
+        self.minify_data     = 0
+        self.resource_manifest = 0
+        self.matrix          = None
+        self.isolated        = 0
+        self.isolated_dir    = None
+        self.size_report     = None
+        self.timings         = None
+        self.profile         = None
+        self.deploy_dir      = None
+        self.deploy_mode     = None
+        self.watch           = 0
+        self.watch_debounce  = None
+        # Relative paths in setup are relative to this directory. Builds from
+        # command line run in the project directory, build_wotmod() API sets
+        # this instead of changing the process's working directory.
+        self.project_dir     = os.curdir
 
     def finalize_options(self):
         # Resolve install directory
         if self.bdist_dir is None:
             bdist_base = self.get_finalized_command('bdist').bdist_base
             self.bdist_dir = os.path.join(bdist_base, 'wotmod')
+        # Resolve identity and layout of the package, again for each variant
+        # of the matrix
+        self.package_options = dict((name, getattr(self, name)) for name in MATRIX_OPTIONS + ('mod_version',))
+        self.resolve_package_options()
+        if self.python27 is None and 'BDIST_WOTMOD_PYTHON27' in os.environ:
+            self.python27 = os.environ['BDIST_WOTMOD_PYTHON27']
+        # Resolve how long compile server is kept running
+        if self.compile_server_timeout is None:
+            self.compile_server_timeout = 300
+        self.compile_server_timeout = float(self.compile_server_timeout)
+        # Resolve number of byte-compile workers
+        if self.jobs is None:
+            self.jobs = 1
+        self.jobs = int(self.jobs)
+        if self.jobs <= 0:
+            self.jobs = multiprocessing.cpu_count()
+        # Resolve how package members are compressed
+        if self.compression is None:
+            self.compression = 'stored'
+        if self.compression_overrides is None:
+            self.compression_overrides = ''
+        try:
+            self.compression_policy = CompressionPolicy(self.compression, self.compression_overrides)
+        except ValueError as err:
+            raise DistutilsOptionError('invalid compression: %s' % err)
+        # Resolve number of compressing threads and their memory usage
+        if self.pack_threads is None:
+            self.pack_threads = 1
+        self.pack_threads = int(self.pack_threads)
+        if self.pack_threads <= 0:
+            self.pack_threads = multiprocessing.cpu_count()
+        if self.pack_memory_limit is None:
+            self.pack_memory_limit = 256
+        self.pack_memory_limit = int(self.pack_memory_limit)
+        # Resolve how dependencies are built
+        if self.dependency_dir is not None:
+            self.dependency_dir = os.path.abspath(self.dependency_dir)
+        if self.bundle_dependencies is None:
+            self.bundle_dependencies = 'separate'
+        if self.bundle_dependencies not in ('separate', 'vendor'):
+            raise DistutilsOptionError("bundle-dependencies must be either 'separate' or 'vendor'")
+        if self.dependency_install_lib is None:
+            self.dependency_install_lib = 'res/scripts/common'
+        if self.cache_dir is None:
+            self.cache_dir = get_cache_dir()
+        if self.pyc_cache_size is None:
+            self.pyc_cache_size = 512
+        self.pyc_cache_size = int(self.pyc_cache_size)
+        if self.remote_cache is None:
+            self.remote_cache = os.environ.get('BDIST_WOTMOD_REMOTE_CACHE')
+        self.remote = RemoteCache(self.remote_cache) if self.remote_cache else None
+        # Resolve how data files are staged
+        if self.stage_links is None:
+            self.stage_links = 'auto'
+        if self.stage_links not in ('auto', 'copy'):
+            raise DistutilsOptionError("stage-links must be either 'auto' or 'copy'")
+        # Resolve which modules are kept when pruning
+        self.prune_keep_patterns = parse_keep_patterns(self.prune_keep)
+        # Resolve package size optimizations
+        if self.optimize is None:
+            self.optimize = 0
+        self.optimize = int(self.optimize)
+        if self.optimize not in (0, 1, 2):
+            raise DistutilsOptionError("optimize must be 0, 1 or 2")
+        self.optimizing = bool(self.optimize or self.exclude_sources or self.minify_data or self.size_report)
+        # Expand glob patterns of data files to files they match, the
+        # patterns are kept for rebuilds in watch mode
+        self.data_file_specs = self.distribution.data_files
+        self.distribution.data_files = expand_data_files(self.data_file_specs, self.project_dir)
+        # Resolve how packages are deployed
+        if self.deploy_mode is None:
+            self.deploy_mode = 'package'
+        if self.deploy_mode not in ('package', 'unpacked'):
+            raise DistutilsOptionError("deploy-mode must be either 'package' or 'unpacked'")
+        if self.deploy_mode == 'unpacked' and not self.deploy_dir:
+            raise DistutilsOptionError("deploy-mode 'unpacked' requires deploy-dir")
+        # Resolve variants packaged from the same build
+        self.matrix_variants = [name.strip() for name in (self.matrix or '').split(',') if name.strip()]
+        for name in self.matrix_variants:
+            self.get_variant_options(name)
+        if self.matrix_variants and self.deploy_mode == 'unpacked':
+            raise DistutilsOptionError("matrix cannot be used with deploy-mode 'unpacked'")
+        if self.matrix_variants and self.distribution.has_headers():
+            raise DistutilsOptionError("matrix cannot be used with header files")
+        # Resolve watch mode, rebuilds skip unchanged work
+        if self.watch_debounce is None:
+            self.watch_debounce = 0.1
+        self.watch_debounce = float(self.watch_debounce)
+        if self.watch:
+            self.incremental = 1
+            self.direct = 1
+            self.update = 1
+
+        self.set_undefined_options('bdist', ('dist_dir', 'dist_dir'))
+
+    def create_isolated_dir(self):
+        """
+        Creates a directory for build outputs of this run within build base,
+        and points build command, and thereby bdist-dir unless it was given,
+        to it. Called when the run starts, so that nothing is left behind if
+        the command never runs.
+        :return: path to the created directory
+        """
+        default_bdist_dir = os.path.join(self.get_finalized_command('bdist').bdist_base, 'wotmod')
+        build_base = self.get_finalized_command('build').build_base
+        mkpath(build_base)
+        isolated_dir = tempfile.mkdtemp(prefix='wotmod-run-', dir=build_base)
+        build = self.reinitialize_command('build', reinit_subcommands=1)
+        build.build_base = os.path.join(isolated_dir, 'build')
+        self.reinitialize_command('bdist')
+        if self.bdist_dir == default_bdist_dir:
+            self.bdist_dir = os.path.join(self.get_finalized_command('bdist').bdist_base, 'wotmod')
+        log.info("building in %s", isolated_dir)
+        return isolated_dir
+
+    def resolve_package_options(self):
+        """
+        Resolves options which determine identity, version and layout of the
+        package.
+        """
         # Resolve version_padding
         if self.version_padding is None:
             self.version_padding = 2
+        self.version_padding = int(self.version_padding)
         # Resolve author_id
         if self.author_id is None:
             self.author_id = self.distribution.get_author()
@@ -120,24 +410,287 @@ class bdist_wotmod(Command):
         # Resolve where data files should be placed in
         if self.install_data is None:
             self.install_data = 'res/mods/%s.%s' % (self.author_id, self.mod_id)
-        if self.python27 is None and 'BDIST_WOTMOD_PYTHON27' in os.environ:
-            self.python27 = os.environ['BDIST_WOTMOD_PYTHON27']
-
-        self.set_undefined_options('bdist', ('dist_dir', 'dist_dir'))
 
     def run(self):
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            if self.isolated:
+                self.isolated_dir = self.create_isolated_dir()
+            self.build_package()
+            if self.watch:
+                self.watch_and_rebuild()
+        finally:
+            if self.isolated_dir and os.path.isdir(self.isolated_dir):
+                remove_tree(self.isolated_dir)
+            self.isolated_dir = None
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile)
+                log.info("wrote profile to %s", self.profile)
+
+    def build_package(self):
+        """
+        Builds the package(s) and deploys them if deploy-dir is set.
+        """
+        self.recorder = PhaseRecorder(self, track_memory=bool(self.timings))
+        self.recorder.start()
+        try:
+            self.run_phases()
+        finally:
+            self.recorder.stop()
+        if self.timings:
+            self.recorder.write(self.timings)
+            log.info("wrote timings to %s", self.timings)
+        if self.deploy_dir and self.deploy_mode == 'package':
+            for package_path in self.package_paths:
+                deploy_package(package_path, self.deploy_dir)
+
+    def get_watched_directories(self):
+        """
+        Returns directories containing sources, data files and other documents.
+        :return: list of (directory, recursive) tuples
+        """
+        directories = set([(os.curdir, False)])
+        for path in self.get_finalized_command('build_py').get_source_files():
+            directories.add((os.path.dirname(path) or os.curdir, False))
+        for data_file in self.data_file_specs or []:
+            paths = [data_file] if isinstance(data_file, str) else data_file[1]
+            for path in paths:
+                if has_glob(path):
+                    parts = path.split('/')
+                    base = parts[:[has_glob(part) for part in parts].index(True)]
+                    directories.add((os.path.join(*base) if base else os.curdir, True))
+                else:
+                    directories.add((os.path.dirname(convert_path(path)) or os.curdir, False))
+        return sorted(directories)
+
+    def watch_and_rebuild(self):
+        """
+        Rebuilds the package whenever watched files change, until interrupted.
+        """
+        watcher = create_watcher()
+        try:
+            for directory, recursive in self.get_watched_directories():
+                if os.path.isdir(directory):
+                    watcher.watch(directory, recursive)
+            while True:
+                log.info("watching for changes, press Ctrl+C to stop")
+                changed = wait_for_changes(watcher, self.watch_debounce)
+                log.info("%d changed: %s", len(changed), ', '.join(sorted(changed)[:5]))
+                start_time = time.time()
+                try:
+                    self.rebuild(changed)
+                except (DistutilsError, AssertionError, EnvironmentError) as err:
+                    log.error("rebuild failed: %s", err)
+                    continue
+                log.info("rebuilt in %.2f s", time.time() - start_time)
+                # Sources may have been added to new directories
+                for directory, recursive in self.get_watched_directories():
+                    if os.path.isdir(directory):
+                        watcher.watch(directory, recursive)
+        except KeyboardInterrupt:
+            log.info("stopped watching")
+        finally:
+            watcher.close()
+
+    def rebuild(self, changed=()):
+        """
+        Builds the package again within the same process. Commands run before
+        must be reinitialized as distutils runs each command only once.
+        :param changed: paths of changed files
+        """
+        self.remove_stale_build_files(changed)
+        self.distribution.data_files = expand_data_files(self.data_file_specs, self.project_dir)
+        self.reinitialize_command('build', reinit_subcommands=1)
+        self.build_package()
+
+    def remove_stale_build_files(self, changed):
+        """
+        Removes copies of changed modules and package data from build
+        directory. build_py compares modification times in whole seconds and
+        would not copy files which are saved again within the same second.
+        """
+        changed = set(os.path.abspath(path) for path in changed)
+        build_py = self.get_finalized_command('build_py')
+        outputs = []
+        for package, module, module_file in build_py.find_all_modules():
+            package = package.split('.') if package else []
+            outputs.append((module_file, build_py.get_module_outfile(build_py.build_lib, package, module)))
+        for package, src_dir, build_dir, filenames in build_py.data_files:
+            outputs.extend((os.path.join(src_dir, name), os.path.join(build_dir, name)) for name in filenames)
+        for source, output in outputs:
+            if os.path.abspath(source) in changed and os.path.isfile(output):
+                os.remove(output)
+
+    def run_phases(self):
         self.distribution.get_command_obj('install_data').warn_dir = 0
-        self.build_files()
-        self.verify_pyc_files()
-        self.install_files()
-        self.create_metaxml()
-        self.include_other_documents()
-        self.mkpath(self.dist_dir)
-        package_path = self.create_wotmod_package()
+        self.package_paths = []
+        package_key = None
+        if self.remote and self.is_package_cacheable():
+            with self.recorder.phase('fetch_cached_package') as stats:
+                package_key = self.get_package_cache_key()
+                package_path = self.fetch_cached_package(package_key)
+                if package_path:
+                    stats['files'], stats['bytes'] = 1, os.path.getsize(package_path)
+            if package_path:
+                self.package_paths.append(package_path)
+                self.distribution.dist_files.append(('bdist_wotmod', 'any', package_path))
+                return
+        with self.recorder.phase('build_files') as stats:
+            self.build_files()
+            stats['files'], stats['bytes'] = get_files_stats(self.get_finalized_command('build_py').get_outputs())
+        with self.recorder.phase('verify_pyc_files'):
+            self.verify_pyc_files()
+        vendored = []
+        with self.recorder.phase('build_dependencies') as stats:
+            dependency_paths = self.build_dependencies()
+            stats['files'], stats['bytes'] = get_files_stats(dependency_paths)
+        for dependency_path in dependency_paths:
+            if self.bundle_dependencies == 'vendor' or self.deploy_mode == 'unpacked':
+                vendored.append(dependency_path)
+            else:
+                self.mkpath(self.dist_dir)
+                copy_atomically(dependency_path, self.dist_dir)
+                self.package_paths.append(os.path.join(self.dist_dir, os.path.basename(dependency_path)))
+                self.distribution.dist_files.append(('bdist_wotmod', 'any', self.package_paths[-1]))
+        if self.matrix_variants:
+            with self.recorder.phase('create_variant_packages') as stats:
+                variants = self.get_matrix_variants()
+                package_paths = self.create_variant_packages(variants, vendored)
+                stats['files'], stats['bytes'] = get_files_stats(package_paths)
+                stats['variants'] = dict((name, variants[index].recorder.phases)
+                                         for index, name in enumerate(self.matrix_variants))
+            for package_path in package_paths:
+                self.package_paths.append(package_path)
+                self.distribution.dist_files.append(('bdist_wotmod', 'any', package_path))
+            if os.path.isdir(self.bdist_dir):
+                remove_tree(self.bdist_dir)
+            return
+        if self.deploy_mode == 'unpacked':
+            entries = self.process_entries(self.get_direct_entries() + self.extract_vendored_packages(vendored))
+            with self.recorder.phase('sync_unpacked') as stats:
+                result = sync_entries(entries, self.deploy_dir, '%s.%s' % (self.author_id, self.mod_id),
+                                      max(4, self.pack_threads))
+                stats['files'] = result['copied']
+                log.info("synced %s: %d copied, %d unchanged, %d removed", self.deploy_dir,
+                         result['copied'], result['skipped'], result['removed'])
+            if os.path.isdir(self.bdist_dir):
+                remove_tree(self.bdist_dir)
+            return
+        if self.direct and self.distribution.has_headers():
+            log.warn("header files cannot be packaged directly, staging files to %s", self.bdist_dir)
+            self.direct = 0
+        if self.direct:
+            self.mkpath(self.dist_dir)
+            entries = self.process_entries(self.get_direct_entries() + self.extract_vendored_packages(vendored))
+            with self.recorder.phase('create_wotmod_package') as stats:
+                package_path = self.create_wotmod_package(add_parent_directories(entries))
+                stats['files'], stats['bytes'] = len(entries), os.path.getsize(package_path)
+        else:
+            with self.recorder.phase('install_files') as stats:
+                self.install_files()
+                stats['files'], stats['bytes'] = get_files_stats(
+                    self.get_finalized_command('install').get_outputs())
+            with self.recorder.phase('create_metaxml') as stats:
+                self.create_metaxml()
+                stats['files'], stats['bytes'] = get_files_stats([os.path.join(self.bdist_dir, 'meta.xml')])
+            with self.recorder.phase('include_other_documents') as stats:
+                self.include_other_documents()
+                stats['files'], stats['bytes'] = get_files_stats(
+                    [os.path.join(self.bdist_dir, name) for name in self.get_other_documents()])
+            with self.recorder.phase('extract_vendored_packages'):
+                self.extract_vendored_packages(vendored)
+            entries = None
+            if self.prune or self.optimizing or self.resource_manifest:
+                entries = self.process_entries(self.get_staged_entries())
+            self.mkpath(self.dist_dir)
+            with self.recorder.phase('create_wotmod_package') as stats:
+                package_path = self.create_wotmod_package(entries)
+                stats['bytes'] = os.path.getsize(package_path)
+                with zipfile.ZipFile(package_path, 'r') as zip:
+                    stats['files'] = len(zip.infolist())
 
+        self.package_paths.append(package_path)
         self.distribution.dist_files.append(('bdist_wotmod', 'any', package_path))
         if os.path.isdir(self.bdist_dir):
             remove_tree(self.bdist_dir)
+        if package_key:
+            with open(package_path, 'rb') as package_file:
+                self.remote.put('package', package_key, package_file.read())
+        if self.remote:
+            log.info("remote cache: %d hits, %d misses, %d uploads",
+                     self.remote.hits, self.remote.misses, self.remote.uploads)
+
+    def is_package_cacheable(self):
+        """
+        Returns True if the whole package can be fetched from remote cache.
+        Builds with dependencies, header files or matrix variants, and
+        unpacked deploys, are always done locally.
+        """
+        return (self.dependency_dir is None and self.deploy_mode == 'package'
+                and not self.distribution.has_headers() and not self.matrix_variants)
+
+    def get_package_cache_key(self):
+        """
+        Returns key of the package in remote cache. It changes whenever
+        contents of the package might change: when sources, data files,
+        documents, metadata, options or the Python 2.7 interpreter change.
+        """
+        build_py = self.get_finalized_command('build_py')
+        files = []
+        for package, module, module_file in build_py.find_all_modules():
+            files.append(['module', package, module, hash_file(module_file)])
+        for package, src_dir, build_dir, filenames in build_py.data_files:
+            for name in filenames:
+                files.append(['package_data', package, name, hash_file(os.path.join(src_dir, name))])
+        for data_file in self.distribution.data_files or []:
+            directory, paths = ('', [data_file]) if isinstance(data_file, str) else data_file
+            for path in paths:
+                files.append(['data_file', directory, to_posix_separators(os.path.normpath(path)),
+                              hash_file(self.get_project_path(convert_path(path)))])
+            if not paths:
+                files.append(['data_dir', directory])
+        for path in self.get_other_documents():
+            files.append(['document', os.path.basename(path), hash_file(path)])
+        options = dict((name, getattr(self, name)) for name in PACKAGE_CACHE_OPTIONS)
+        if self.reproducible:
+            options['source_date_epoch'] = os.environ.get('SOURCE_DATE_EPOCH')
+        key = json.dumps({
+            'version': PACKAGE_CACHE_VERSION,
+            'interpreter': get_interpreter_version(self.python27 or sys.executable),
+            'options': options,
+            'metaxml': hashlib.sha1(self.get_metaxml_contents()).hexdigest(),
+            'files': sorted(files),
+        }, sort_keys=True)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def fetch_cached_package(self, key):
+        """
+        Fetches package from remote cache to dist-dir.
+        :return: path to the package, or None if it is not in the cache
+        """
+        data = self.remote.get('package', key)
+        if data is None:
+            return None
+        if not zipfile.is_zipfile(io.BytesIO(data)):
+            log.warn("ignoring invalid package from remote cache")
+            return None
+        package_path = self.get_output_file_path()
+        self.mkpath(self.dist_dir)
+        tmp_filename = get_temporary_path(package_path)
+        try:
+            with open(tmp_filename, 'wb') as package_file:
+                package_file.write(data)
+            replace_file(tmp_filename, package_path)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+        log.info("fetched '%s' from remote cache", package_path)
+        return package_path
 
     def build_files(self):
         """
@@ -147,17 +700,54 @@ class bdist_wotmod(Command):
         # a cache. Set compile=1 to force recreation of those files.
         build = self.reinitialize_command('build_py', reinit_subcommands=1)
         build.compile=1
+        # Optimized modules are compiled only at the requested level, to .pyo
+        # files which are packaged as .pyc in optimize_package phase
+        if self.optimize:
+            build.compile = 0
+        build.optimize = self.optimize
 
-        if self.python27:
-            # Monkey patch byte_compile() with custom function that delegates
+        byte_compile = None
+        if self.python27 or self.jobs > 1:
+            # Replace byte_compile() with custom function that delegates
             # the byte compilation to a separate Python 2.7 interpreter.
             # This is required when setuptools-wotmod is executed with Python
             # 3.x. The pyc files must still be Python 2.7 based for them to
             # succesfully load into World of Tanks's embedded Python interpreter.
-            with patch_func(distutils.util, 'byte_compile', partial(python27_byte_compile, self.python27)):
-                self.run_command('build')
-        else:
-            self.run_command('build')
+            # With several jobs the current interpreter is used as well, as
+            # byte-compiling within this process would be limited to one core.
+            byte_compile = partial(python27_byte_compile, self.python27 or sys.executable,
+                server_timeout=self.compile_server_timeout, jobs=self.jobs)
+        python = self.python27 or sys.executable
+        if (self.pyc_cache or self.remote) and is_python2(python):
+            # Cached modules are only valid for the Python 2.7 interpreter
+            # which compiled them, the cache is not used when compiling with
+            # Python 3. Remote cache is used through the local one.
+            cache = PycCache(self.cache_dir, self.pyc_cache_size * 1024 * 1024, self.remote)
+            byte_compile = partial(cached_byte_compile, cache, get_interpreter_version(python),
+                byte_compile or distutils.util.byte_compile)
+        keep = None
+        if self.prune:
+            # Compile only modules which end up in the package, or in any of
+            # the matrix variants as they may install modules elsewhere
+            build.ensure_finalized()
+            keep = set()
+            for command in self.get_matrix_variants() if self.matrix_variants else [self]:
+                keep.update(command.find_reachable_build_files(build))
+        if self.incremental:
+            # Pruned modules are still part of the build, only not compiled
+            manifest = CompileManifest(os.path.join(
+                self.get_finalized_command('build').build_base, 'wotmod-compile-manifest.json'))
+            byte_compile = partial(incremental_byte_compile, manifest,
+                get_interpreter_id(python), is_python2(python),
+                byte_compile or distutils.util.byte_compile, keep=keep)
+        elif keep is not None:
+            byte_compile = partial(pruned_byte_compile, keep, byte_compile or distutils.util.byte_compile)
+
+        if byte_compile:
+            # Replace the method of this command object only, so that other
+            # builds in the same process are not affected
+            build.byte_compile = partial(build_py_byte_compile, build, byte_compile)
+        self.run_command('build')
 
     def verify_pyc_files(self):
         """
@@ -165,7 +755,7 @@ class bdist_wotmod(Command):
         """
         for root, dirs, files in os.walk(self.get_finalized_command('build_py').build_lib):
             for filename in files:
-                if os.path.splitext(filename)[1] == '.pyc':
+                if os.path.splitext(filename)[1] in ('.pyc', '.pyo'):
                     filepath = os.path.join(root, filename)
                     assert is_python27_pyc_file(filepath), \
                         'File "%s" is not valid Python 2.7 byte-compiled ' \
@@ -173,6 +763,203 @@ class bdist_wotmod(Command):
                         'or env variable BDIST_WOTMOD_PYTHON27 points to ' \
                         'Python 2.7 interpreter' % filepath
 
+    def get_variant_options(self, name):
+        """
+        Returns options of a matrix variant from [bdist_wotmod:<name>] section
+        of setup.cfg.
+        :return: dict of option names to values
+        """
+        section = 'bdist_wotmod:%s' % name
+        if section not in self.distribution.command_options:
+            raise DistutilsOptionError("matrix variant '%s' has no [%s] section" % (name, section))
+        options = dict((option.replace('-', '_'), value)
+                       for option, (source, value) in self.distribution.command_options[section].items())
+        unknown = sorted(set(options) - set(MATRIX_OPTIONS))
+        if unknown:
+            raise DistutilsOptionError("options %s cannot vary in matrix variant '%s', only %s can"
+                                       % (', '.join(unknown), name, ', '.join(MATRIX_OPTIONS)))
+        return options
+
+    def get_matrix_variants(self):
+        """
+        Returns a copy of this command for each matrix variant, with the
+        variant's options resolved on top of the options of this command.
+        """
+        variants = []
+        output_paths = {}
+        for name in self.matrix_variants:
+            variant = copy.copy(self)
+            # Variants are packaged in parallel, so each records its phases
+            # separately. Peak memory is process wide and not tracked for them.
+            variant.recorder = PhaseRecorder(variant)
+            for option, value in self.package_options.items():
+                setattr(variant, option, value)
+            for option, value in self.get_variant_options(name).items():
+                setattr(variant, option, value)
+            variant.resolve_package_options()
+            output_path = variant.get_output_file_path()
+            if output_path in output_paths:
+                raise DistutilsOptionError("matrix variants '%s' and '%s' both create %s"
+                                           % (output_paths[output_path], name, os.path.basename(output_path)))
+            output_paths[output_path] = name
+            variants.append(variant)
+        return variants
+
+    def create_variant_packages(self, variants, vendored):
+        """
+        Packages each matrix variant in parallel from the shared build
+        directory, each with its own meta.xml and file name.
+        :param variants: commands returned by get_matrix_variants()
+        :param vendored: paths to dependency packages to vendor
+        :return: list of paths to wotmod package files
+        """
+        self.mkpath(self.dist_dir)
+        # Extracted once, as the variants are packaged at the same time
+        vendored_entries = self.extract_vendored_packages(vendored)
+        def create_package(variant):
+            entries = add_parent_directories(
+                variant.process_entries(variant.get_direct_entries() + vendored_entries))
+            with variant.recorder.phase('create_wotmod_package') as stats:
+                package_path = variant.create_wotmod_package(entries)
+                stats['files'], stats['bytes'] = len(entries), os.path.getsize(package_path)
+            return package_path
+        return run_in_parallel(create_package, variants)
+
+    def process_entries(self, entries):
+        """
+        Applies the optional stages which modify package contents to package
+        entries, in order: pruning, size optimizations and resource manifest.
+        :return: list of PackageEntry objects
+        """
+        if self.prune:
+            entries = self.prune_package(entries)
+        if self.optimizing:
+            entries = self.optimize_package(entries)
+        if self.resource_manifest:
+            entries = self.add_resource_manifest(entries)
+        return entries
+
+    def add_resource_manifest(self, entries):
+        """
+        Adds manifest of files and directories in the game's file system,
+        i.e. entries under res/, to install-data directory.
+        :return: list of PackageEntry objects
+        """
+        with self.recorder.phase('create_resource_manifest') as stats:
+            manifest_path = to_archive_path(self.install_data, MANIFEST_NAME)
+            entries = add_parent_directories(
+                [entry for entry in entries if entry.archive_path != manifest_path]
+                + [PackageEntry(manifest_path, None, b'')])
+            manifest_entries = []
+            for entry in entries:
+                if not entry.archive_path.startswith('res/') or entry.archive_path == manifest_path:
+                    continue
+                vfs_path = entry.archive_path[len('res/'):].rstrip('/')
+                if entry.archive_path.endswith('/'):
+                    manifest_entries.append(ManifestEntry(vfs_path, DIRECTORY, 0, 0))
+                else:
+                    if entry.path is not None:
+                        crc, size = get_file_crc(entry.path)
+                    else:
+                        crc, size = get_data_crc(entry.data)
+                    manifest_entries.append(ManifestEntry(vfs_path, FILE, size, crc))
+            if not manifest_path.startswith('res/'):
+                log.warn("install-data %s is not within res/, the game cannot read %s",
+                         self.install_data, manifest_path)
+            data = format_manifest(manifest_entries)
+            entries = [PackageEntry(manifest_path, None, data) if entry.archive_path == manifest_path else entry
+                       for entry in entries]
+            stats['files'], stats['bytes'] = 1, len(data)
+        log.info("listed %d files and directories in %s", len(manifest_entries), manifest_path)
+        return entries
+
+    def get_prune_roots(self, graph, entry_modules):
+        """
+        Returns names of modules from which pruning starts, all modules if
+        there are none.
+        """
+        roots = graph.get_roots(entry_modules, self.prune_keep_patterns)
+        if not roots:
+            log.warn("no mod_* entry modules in %s and no prune-keep modules, nothing is pruned",
+                     GAME_MODS_DIR)
+            return list(graph.modules)
+        return roots
+
+    def find_reachable_build_files(self, build_py):
+        """
+        Returns paths in build directory of the project's modules which are
+        reachable from the entry modules.
+        """
+        prefix = get_package_prefix(self.install_lib)
+        modules = []
+        outputs = {}
+        for package, module, module_file in build_py.find_all_modules():
+            is_package = module == '__init__'
+            name = join_name(prefix, package if is_package else '.'.join(filter(None, [package, module])))
+            modules.append(Module(name, is_package, partial(read_source, module_file)))
+            outputs[name] = os.path.normpath(build_py.get_module_outfile(
+                build_py.build_lib, package.split('.') if package else [], module))
+        graph = ModuleGraph(modules, [prefix])
+        entry_modules = [name for name in graph.modules if is_entry_module(name)]
+        reachable = graph.find_reachable(self.get_prune_roots(graph, entry_modules))
+        return set(outputs[name] for name in reachable)
+
+    def prune_package(self, entries):
+        """
+        Removes modules which are not reachable from the entry modules from
+        package entries, including modules of vendored dependencies.
+        :return: list of PackageEntry objects
+        """
+        with self.recorder.phase('prune_modules') as stats:
+            lib_dirs = [self.install_lib.strip('/')]
+            if self.dependency_install_lib.strip('/') not in lib_dirs:
+                lib_dirs.append(self.dependency_install_lib.strip('/'))
+            module_entries = {}
+            packages = set()
+            for entry in entries:
+                name, is_package = get_module_name(entry.archive_path, lib_dirs)
+                if name is None:
+                    continue
+                module_entries.setdefault(name, []).append(entry)
+                if is_package:
+                    packages.add(name)
+            modules = []
+            for name, module_files in module_entries.items():
+                sources = [entry for entry in module_files if entry.archive_path.endswith('.py')]
+                source = partial(read_entry, sources[0]) if sources else lambda: None
+                modules.append(Module(name, name in packages, source))
+            entry_modules = [name for name in module_entries if is_entry_module(name)]
+            graph = ModuleGraph(modules, [get_package_prefix(lib_dir) for lib_dir in lib_dirs])
+            reachable = graph.find_reachable(self.get_prune_roots(graph, entry_modules))
+            removed = sorted(set(module_entries) - reachable)
+            removed_paths = set(entry.archive_path for name in removed for entry in module_entries[name])
+            entries = remove_empty_directories(
+                [entry for entry in entries if entry.archive_path not in removed_paths], lib_dirs)
+            stats['files'] = len(removed_paths)
+            stats['bytes'] = sum(get_entry_size(entry) for name in removed for entry in module_entries[name])
+        for name in removed:
+            log.info("pruned module %s", name)
+        log.info("pruned %d of %d modules, %d files and %d bytes", len(removed), len(module_entries),
+                 stats['files'], stats['bytes'])
+        return entries
+
+    def optimize_package(self, entries):
+        """
+        Applies size optimizations to package entries and reports their
+        effect.
+        :return: list of PackageEntry objects
+        """
+        with self.recorder.phase('optimize_package') as stats:
+            entries, report = optimize_entries(entries, self.optimize, self.exclude_sources, self.minify_data)
+            stats['files'] = len([entry for entry in entries if not entry.archive_path.endswith('/')])
+            stats['bytes'] = report['total']['after']
+        log_size_report(report)
+        if self.size_report:
+            with open(self.size_report, 'w') as report_file:
+                json.dump(report, report_file, indent=2, sort_keys=True)
+            log.info("wrote size report to %s", self.size_report)
+        return entries
+
     def install_files(self):
         """
         Installs files defined in setup.py to bdist-dir.
@@ -189,9 +976,77 @@ class bdist_wotmod(Command):
         # No need for egg metadata and executable scripts in wotmod package
         install.sub_commands = [cmd for cmd in install.sub_commands if cmd[0] != 'install_egg_info']
         install.sub_commands = [cmd for cmd in install.sub_commands if cmd[0] != 'install_scripts']
+        # Data files can be large, link them instead of copying if possible.
+        # The command may have picked data files before patterns in them were
+        # expanded.
+        install_data = self.distribution.get_command_obj('install_data')
+        install_data.data_files = self.distribution.data_files
+        install_data.copy_file = self.stage_file
         log.info("installing to %s" % self.bdist_dir)
         self.run_command('install')
 
+    def stage_file(self, infile, outfile, preserve_mode=1, preserve_times=1, link=None, level=1):
+        """
+        Replacement of install_data's copy_file() which links infile to
+        outfile when stage-links is 'auto' and the file system allows it,
+        otherwise copies it.
+        """
+        infile = self.get_project_path(infile)
+        if os.path.isdir(outfile):
+            outfile = os.path.join(outfile, os.path.basename(infile))
+        if not self.dry_run and is_same_file(infile, outfile):
+            # Copying over a link left from an earlier build would truncate
+            # the source file
+            os.remove(outfile)
+        if self.stage_links == 'auto' and link is None and not self.dry_run:
+            method = link_file(infile, outfile)
+            if method:
+                log.info("%s %s -> %s", method, infile, os.path.dirname(outfile))
+                return outfile, 1
+        return copy_file(infile, outfile, preserve_mode, preserve_times, not self.force, link,
+                         dry_run=self.dry_run)
+
+    def build_dependencies(self):
+        """
+        Builds install_requires dependencies from sources in dependency-dir, in
+        parallel.
+        :return: list of paths to built wotmod packages
+        """
+        if self.dependency_dir is None:
+            return []
+        chain = get_dependency_chain()
+        requirements = [requirement for requirement in parse_requirements(self.distribution.install_requires)
+                        if canonicalize_name(requirement.name) not in chain]
+        if not requirements:
+            return []
+        options = {
+            'install_lib': self.dependency_install_lib,
+            'python27': self.python27,
+            'version_padding': self.version_padding,
+            'compression': self.compression,
+            'compression_overrides': self.compression_overrides,
+            'reproducible': bool(self.reproducible),
+            'jobs': self.jobs,
+            'dependency_dir': self.dependency_dir,
+            'bundle_dependencies': self.bundle_dependencies,
+            'dependency_install_lib': self.dependency_install_lib,
+            'cache_dir': self.cache_dir,
+            'optimize': self.optimize,
+            'exclude_sources': bool(self.exclude_sources),
+            'minify_data': bool(self.minify_data),
+        }
+        results = run_in_parallel(
+            lambda requirement: build_dependency(requirement, self.dependency_dir, self.cache_dir, options),
+            requirements)
+        return [path for paths in results for path in paths]
+
+    def extract_vendored_packages(self, package_paths):
+        """
+        Extracts contents of vendored dependency packages to bdist-dir.
+        :return: list of PackageEntry objects of the extracted files
+        """
+        return get_vendored_entries(package_paths, self.bdist_dir)
+
     def create_metaxml(self):
         """
         Creates meta.xml file to root of bdist-dir.
@@ -199,66 +1054,209 @@ class bdist_wotmod(Command):
         metaxml_path = os.path.join(self.bdist_dir, 'meta.xml')
         log.info("Writing %s", metaxml_path)
         with open(metaxml_path, 'wb') as metaxml_file:
-            root = ET.Element('root')
-            id = ET.SubElement(root, 'id')
-            id.text = '%s.%s' % (self.author_id, self.mod_id)
-            version = ET.SubElement(root, 'version')
-            version.text = self.mod_version
-            name = ET.SubElement(root, 'name')
-            name.text = self.distribution.get_name()
-            description = ET.SubElement(root, 'description')
-            description.text = self.distribution.get_description()
-            xml_contents = ET.tostring(root, encoding='utf-8')
-            xml_contents = minidom.parseString(xml_contents).toprettyxml(encoding='utf-8')
-            metaxml_file.write(xml_contents)
+            metaxml_file.write(self.get_metaxml_contents())
+
+    def get_metaxml_contents(self):
+        """
+        Returns contents of the meta.xml file.
+        """
+        root = ET.Element('root')
+        id = ET.SubElement(root, 'id')
+        id.text = '%s.%s' % (self.author_id, self.mod_id)
+        version = ET.SubElement(root, 'version')
+        version.text = self.mod_version
+        name = ET.SubElement(root, 'name')
+        name.text = self.distribution.get_name()
+        description = ET.SubElement(root, 'description')
+        description.text = self.distribution.get_description()
+        xml_contents = ET.tostring(root, encoding='utf-8')
+        return minidom.parseString(xml_contents).toprettyxml(encoding='utf-8')
 
     def include_other_documents(self):
         """
         Copies other documents (license, changelog, readme) files to root of
         bdist-dir.
         """
+        for match in self.get_other_documents():
+            copy_file(match, self.bdist_dir)
+
+    def get_other_documents(self):
+        """
+        Returns paths to other documents (license, changelog, readme) files.
+        """
         patterns = ['readme', 'license', 'changes']
-        entries = os.listdir('.')
+        entries = [self.get_project_path(e) for e in os.listdir(self.project_dir)]
         entries = filter(os.path.isfile, entries)
-        matches = filter(lambda e: any(p in e.lower() for p in patterns), entries)
-        for match in matches:
-            copy_file(match, self.bdist_dir)
+        return [e for e in entries if any(p in os.path.basename(e).lower() for p in patterns)]
+
+    def get_project_path(self, path):
+        """
+        Returns path to a file given relative to the project directory.
+        """
+        return os.path.normpath(os.path.join(self.project_dir, path))
 
-    def create_wotmod_package(self):
+    def get_direct_entries(self):
+        """
+        Resolves where in the package each file would end up if it was
+        installed to bdist-dir with install_lib and install_data commands.
+        :return: list of PackageEntry objects
         """
-        Inserts files from bdist-dir to .wotmod package and stores it to dist-dir.
+        entries = []
+        # Equivalent of install_lib, which copies whole build directory
+        build_lib = self.get_finalized_command('build').build_lib
+        if os.path.isdir(build_lib):
+            for dirpath, dirnames, filenames in os.walk(build_lib):
+                archive_dirpath = to_archive_path(self.install_lib, os.path.relpath(dirpath, build_lib))
+                entries.append(PackageEntry(archive_dirpath + '/', None, None))
+                for name in filenames:
+                    entries.append(PackageEntry(
+                        posixpath.join(archive_dirpath, name), os.path.join(dirpath, name), None))
+        # Equivalent of install_data
+        for data_file in self.distribution.data_files or []:
+            if isinstance(data_file, str):
+                path = self.get_project_path(convert_path(data_file))
+                entries.append(PackageEntry(
+                    to_archive_path(self.install_data, os.path.basename(path)), path, None))
+                continue
+            directory = convert_path(data_file[0])
+            if os.path.isabs(directory):
+                archive_dirpath = to_archive_path(change_root('', directory))
+            else:
+                archive_dirpath = to_archive_path(self.install_data, directory)
+            entries.append(PackageEntry(archive_dirpath + '/', None, None))
+            for data in data_file[1]:
+                path = self.get_project_path(convert_path(data))
+                entries.append(PackageEntry(
+                    posixpath.join(archive_dirpath, os.path.basename(path)), path, None))
+        # Other documents and meta.xml
+        for path in self.get_other_documents():
+            entries.append(PackageEntry(os.path.basename(path), path, None))
+        entries.append(PackageEntry('meta.xml', None, self.get_metaxml_contents()))
+        return add_parent_directories(entries)
+
+    def get_staged_entries(self):
+        """
+        Returns entries for files installed to bdist-dir.
+        :return: list of PackageEntry objects
+        """
+        entries = []
+        archive_root = to_posix_separators(self.bdist_dir)
+        for dirpath, dirnames, filenames in os.walk(archive_root):
+            dirpath = to_posix_separators(dirpath)
+
+            # Build relative path from bdist_dir forward
+            archive_dirpath = dirpath.replace(posixpath.commonprefix(
+                [dirpath, archive_root]), '').strip('/')
+
+            # Create files
+            for name in filenames:
+                archive_path = posixpath.join(archive_dirpath, name)
+                path = posixpath.normpath(posixpath.join(dirpath, name))
+                if posixpath.isfile(path):
+                    entries.append(PackageEntry(archive_path, path, None))
+
+            # Set correct flags for directories
+            for name in dirnames:
+                archive_path = posixpath.join(archive_dirpath, name) + '/'
+                entries.append(PackageEntry(archive_path, None, None))
+        return entries
+
+    def create_wotmod_package(self, entries=None):
+        """
+        Inserts files from bdist-dir, or given package entries, to .wotmod
+        package and stores it to dist-dir.
         :return: path to wotmod package file
         """
         zip_filename = self.get_output_file_path()
         mkpath(os.path.dirname(zip_filename))
 
-        log.info("creating '%s' and adding '%s' to it", zip_filename, self.bdist_dir)
+        if entries is None:
+            log.info("creating '%s' and adding '%s' to it", zip_filename, self.bdist_dir)
+            entries = self.get_staged_entries()
+        else:
+            log.info("creating '%s'", zip_filename)
 
-        archive_root = to_posix_separators(self.bdist_dir)
+        if self.reproducible:
+            entries = sorted(map(normalize_pyc_timestamp, entries), key=lambda entry: entry.archive_path)
 
-        with zipfile.ZipFile(zip_filename, 'w') as zip:
-            for dirpath, dirnames, filenames in os.walk(archive_root):
-                dirpath = to_posix_separators(dirpath)
+        start_time = time.time()
+        # Package is written to a temporary file and renamed in place, so
+        # concurrent runs and readers of dist-dir never see a partial package
+        tmp_filename = get_temporary_path(zip_filename)
+        try:
+            if self.update and os.path.isfile(zip_filename):
+                total_size = self.update_wotmod_package(zip_filename, tmp_filename, entries)
+            else:
+                with zipfile.ZipFile(tmp_filename, 'w', allowZip64=True) as zip:
+                    total_size = write_members(zip, self.iter_members(entries),
+                        self.pack_threads, self.pack_memory_limit * 1024 * 1024)
+            replace_file(tmp_filename, zip_filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+        elapsed = max(time.time() - start_time, 1e-6)
+        log.info("packed %.1f MB in %.2f s (%.1f MB/s)", total_size / 1e6, elapsed, total_size / 1e6 / elapsed)
 
-                # Build relative path from bdist_dir forward
-                archive_dirpath = dirpath.replace(posixpath.commonprefix(
-                    [dirpath, archive_root]), '').strip('/')
+        return zip_filename
 
-                # Create files
-                for name in filenames:
-                    archive_path = posixpath.join(archive_dirpath, name)
-                    path = posixpath.normpath(posixpath.join(dirpath, name))
-                    if posixpath.isfile(path):
-                        log.info("adding '%s'" % archive_path)
-                        zip.write(path, archive_path)
-
-                # Set correct flags for directories
-                for name in dirnames:
-                    archive_path = posixpath.join(archive_dirpath, name) + '/'
-                    log.info("adding '%s'" % archive_path)
-                    zip.writestr(archive_path, '')
+    def iter_members(self, entries, old_zip=None):
+        """
+        Returns members to write for given entries. When old_zip is given,
+        entries whose CRC, size and compression match those of the
+        corresponding member in old_zip are copied from it without
+        recompressing them.
+        """
+        for entry in entries:
+            zinfo = self.get_entry_zipinfo(entry)
+            old_info = get_zipinfo(old_zip, entry.archive_path) if old_zip else None
+            if old_info is not None and not entry.archive_path.endswith('/'):
+                if entry.path is not None:
+                    crc, size = get_file_crc(entry.path)
+                else:
+                    crc, size = get_data_crc(entry.data)
+                if ((old_info.CRC, old_info.file_size, get_compression(old_info)) ==
+                        (crc, size, get_compression(zinfo))):
+                    log.debug("keeping '%s'" % entry.archive_path)
+                    yield Member(zinfo, None, None, (old_zip, old_info))
+                    continue
+                log.info("updating '%s'" % entry.archive_path)
+            else:
+                log.info("adding '%s'" % entry.archive_path)
+            yield Member(zinfo, entry.path, entry.data, None)
 
-        return zip_filename
+    def update_wotmod_package(self, zip_filename, new_filename, entries):
+        """
+        Writes a new version of an existing package to new_filename, reusing
+        unchanged members of the existing package.
+        :return: total uncompressed size of the package members
+        """
+        with zipfile.ZipFile(zip_filename, 'r') as old_zip:
+            with zipfile.ZipFile(new_filename, 'w', allowZip64=True) as zip:
+                total_size = write_members(zip, self.iter_members(entries, old_zip),
+                    self.pack_threads, self.pack_memory_limit * 1024 * 1024)
+        log.info("updated '%s'", zip_filename)
+        return total_size
+
+    def get_entry_zipinfo(self, entry):
+        """
+        Creates ZipInfo object for a package entry, with compression and
+        reproducibility options applied.
+        """
+        if entry.archive_path.endswith('/'):
+            zinfo = zipinfo_for_directory(entry.archive_path)
+        elif entry.path is not None:
+            zinfo = zipinfo_from_file(entry.path, entry.archive_path)
+        else:
+            zinfo = zipinfo_from_data(entry.archive_path, entry.data)
+        set_compression(zinfo, *self.compression_policy.get(entry.archive_path))
+        if self.reproducible:
+            zinfo.date_time = get_source_date_time()
+            if entry.archive_path.endswith('/'):
+                zinfo.external_attr = 0o40755 << 16 | 0x10
+            else:
+                zinfo.external_attr = 0o100644 << 16
+        return zinfo
 
     def get_output_file_path(self):
         """
@@ -271,46 +1269,548 @@ class bdist_wotmod(Command):
             self.author_id, self.mod_id, self.mod_version)
         return os.path.abspath(os.path.join(self.dist_dir, zip_filename))
 
+# Options which affect contents of the package, part of its remote cache key
+PACKAGE_CACHE_OPTIONS = ('author_id', 'mod_id', 'mod_version', 'install_lib', 'install_data',
+                         'version_padding', 'compression', 'compression_overrides', 'reproducible',
+                         'optimize', 'exclude_sources', 'minify_data', 'prune', 'prune_keep',
+                         'resource_manifest')
+
+# Bump when the way packages are built changes
+PACKAGE_CACHE_VERSION = 1
+
+# ioctl request which clones file contents on Linux (btrfs, xfs)
+FICLONE = 0x40049409
+
+# File or directory within the package. Directory entries have archive_path
+# ending with '/', file entries have either path to file or its contents as
+# data.
+PackageEntry = namedtuple('PackageEntry', ['archive_path', 'path', 'data'])
+
+def get_vendored_entries(package_paths, extract_dir):
+    """
+    Extracts files in dependency packages, except those in the package root
+    (meta.xml and other documents), to extract_dir. Members are streamed in
+    chunks so that large members are never held in memory.
+    :return: list of PackageEntry objects of the extracted files
+    """
+    entries = []
+    seen = set()
+    for package_path in package_paths:
+        with zipfile.ZipFile(package_path, 'r') as zip:
+            for info in zip.infolist():
+                if info.filename.endswith('/') or '/' not in info.filename:
+                    continue
+                if info.filename in seen:
+                    log.warn("skipping '%s' from %s, already included by another dependency",
+                             info.filename, package_path)
+                    continue
+                seen.add(info.filename)
+                path = os.path.join(extract_dir, *info.filename.split('/'))
+                mkpath(os.path.dirname(path))
+                log.info("extracting %s", path)
+                with zip.open(info) as source_file:
+                    with open(path, 'wb') as target_file:
+                        shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                os.utime(path, (mtime, mtime))
+                entries.append(PackageEntry(info.filename, path, None))
+    return entries
+
+def normalize_pyc_timestamp(entry):
+    """
+    Replaces source modification time stored to header of a Python 2.7 pyc
+    file with the fixed timestamp of reproducible packages. The timestamp must
+    match date of the py file in the package for the pyc to be used. Member
+    dates are taken as UTC so that the output doesn't depend on the time zone
+    of the build machine.
+    """
+    if entry.path is None or not entry.archive_path.endswith('.pyc') or not is_python27_pyc_file(entry.path):
+        return entry
+    with open(entry.path, 'rb') as pyc_file:
+        data = pyc_file.read()
+    mtime = calendar.timegm(get_source_date_time() + (0, 0, 0))
+    return entry._replace(path=None, data=data[:4] + struct.pack('<I', mtime) + data[8:])
+
+def get_zipinfo(zip, name):
+    try:
+        return zip.getinfo(name)
+    except KeyError:
+        return None
+
+def copy_atomically(path, directory):
+    """
+    Copies file to directory, replacing an earlier copy atomically so that
+    readers never see a partially written file.
+    :return: path to the copy
+    """
+    mkpath(directory)
+    target = os.path.join(directory, os.path.basename(path))
+    with NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False) as tmp_file:
+        with open(path, 'rb') as source_file:
+            shutil.copyfileobj(source_file, tmp_file, CHUNK_SIZE)
+    shutil.copystat(path, tmp_file.name)
+    try:
+        replace_file(tmp_file.name, target)
+    except OSError:
+        os.remove(tmp_file.name)
+        raise
+    return target
+
+def get_temporary_path(path):
+    """
+    Returns path of a temporary file next to given path, unique to the
+    calling process and thread.
+    """
+    return '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+
+def deploy_package(package_path, deploy_dir):
+    """
+    Copies package to deploy_dir, replacing an earlier copy atomically so that
+    the game never sees a partially written package.
+    """
+    copy_atomically(package_path, deploy_dir)
+    log.info("deployed %s to %s", os.path.basename(package_path), deploy_dir)
+
+def has_glob(path):
+    return '*' in path or '?' in path
+
+def match_path_parts(pattern_parts, path_parts):
+    """
+    Matches path against pattern, both split to components. Pattern
+    component '**' matches any number of directories.
+    """
+    if not pattern_parts:
+        return not path_parts
+    if pattern_parts[0] == '**':
+        return any(match_path_parts(pattern_parts[1:], path_parts[index:])
+                   for index in range(len(path_parts) + 1))
+    return (bool(path_parts) and fnmatch.fnmatchcase(path_parts[0], pattern_parts[0])
+            and match_path_parts(pattern_parts[1:], path_parts[1:]))
+
+def glob_files(pattern, base_dir=os.curdir):
+    """
+    Finds files matching a '/' separated glob pattern, where '**' matches any
+    number of directories, e.g. 'assets/**/*.dds'.
+    :return: list of (directory relative to the pattern's base directory,
+             file path) tuples, base directory being the part of the pattern
+             preceding the first wildcard
+    :param base_dir: directory the pattern is relative to, returned file
+                     paths are relative to it as well
+    """
+    parts = pattern.split('/')
+    index = [has_glob(part) for part in parts].index(True)
+    base = os.path.join(*parts[:index]) if index else os.curdir
+    pattern_parts = parts[index:]
+    max_depth = None if '**' in pattern_parts else len(pattern_parts) - 1
+    matches = []
+    walk_dir = os.path.join(base_dir, base)
+    for dirpath, dirnames, filenames in os.walk(walk_dir):
+        relpath = os.path.relpath(dirpath, walk_dir)
+        rel_parts = [] if relpath == os.curdir else relpath.split(os.sep)
+        dirnames.sort()
+        if max_depth is not None and len(rel_parts) >= max_depth:
+            del dirnames[:]
+        for name in sorted(filenames):
+            if match_path_parts(pattern_parts, rel_parts + [name]):
+                matches.append(('/'.join(rel_parts), os.path.join(base, *(rel_parts + [name]))))
+    if not matches:
+        log.warn("data file pattern '%s' matches no files", pattern)
+    return matches
+
+def expand_data_files(data_files, base_dir=os.curdir):
+    """
+    Expands glob patterns in data_files spec. Files matched by a pattern keep
+    their directory structure below the pattern's base directory, e.g.
+    ('res/mods/foo', ['assets/**/*.dds']) installs 'assets/a/b.dds' to
+    'res/mods/foo/a/b.dds'.
+    :param base_dir: directory the paths are relative to
+    :return: data_files spec without patterns
+    """
+    if not data_files:
+        return data_files
+    result = []
+    for data_file in data_files:
+        if isinstance(data_file, str):
+            directory, files, is_string = '', [data_file], True
+        else:
+            directory, files, is_string = data_file[0], data_file[1], False
+        if not any(has_glob(path) for path in files):
+            result.append(data_file)
+            continue
+        subdirs = {'': []}
+        for path in files:
+            if not has_glob(path):
+                subdirs[''].append(path)
+                continue
+            for relpath, match in glob_files(path, base_dir):
+                subdirs.setdefault(relpath, []).append(match)
+        for relpath in sorted(subdirs):
+            if not subdirs[relpath]:
+                continue
+            if is_string and not relpath:
+                result.extend(subdirs[relpath])
+            else:
+                result.append((posixpath.join(directory, relpath) if relpath else directory, subdirs[relpath]))
+    return result
+
+def is_same_file(path1, path2):
+    if not os.path.exists(path1) or not os.path.exists(path2):
+        return False
+    if hasattr(os.path, 'samefile'):
+        return os.path.samefile(path1, path2)
+    return False
+
+def link_file(source, target):
+    """
+    Creates target as a reflink (copy-on-write clone) or a hard link of
+    source, if the file system supports either of them.
+    :return: 'reflinking' or 'linking' on success, None otherwise
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+    if sys.platform.startswith('linux'):
+        try:
+            import fcntl
+            with open(source, 'rb') as source_file:
+                with open(target, 'wb') as target_file:
+                    fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+            shutil.copystat(source, target)
+            return 'reflinking'
+        except (IOError, OSError):
+            if os.path.exists(target):
+                os.remove(target)
+    if hasattr(os, 'link'):
+        try:
+            os.link(source, target)
+            return 'linking'
+        except OSError:
+            pass
+    return None
+
 def to_posix_separators(win_path):
     return win_path.replace('\\', '/') if os.sep == '\\' else win_path
 
-@contextmanager
-def patch_func(module, function_name, replacement):
+def to_archive_path(*parts):
+    """
+    Joins native path fragments to a normalized path within the package.
+    """
+    return posixpath.normpath(posixpath.join(*map(to_posix_separators, parts))).strip('/')
+
+def add_parent_directories(entries):
     """
-    Helper function that patches a function in a module with a replacement
-    function. The returned value must be used in with-statement where the
-    patching will happen upon entering the inner block and the patching is
-    undone when execution leaves the block.
+    Adds directory entries for parent directories of each entry, as
+    installing files to bdist-dir creates those directories too.
+    :return: list of PackageEntry objects, without duplicate directories
+    """
+    result = []
+    seen = set()
+    for entry in entries:
+        parts = entry.archive_path.rstrip('/').split('/')
+        directories = ['/'.join(parts[:index]) + '/' for index in range(1, len(parts))]
+        if entry.archive_path.endswith('/'):
+            directories.append(entry.archive_path)
+        for directory in directories:
+            if directory != '/' and directory not in seen:
+                seen.add(directory)
+                result.append(PackageEntry(directory, None, None))
+        if not entry.archive_path.endswith('/'):
+            result.append(entry)
+    return result
+
+def pruned_byte_compile(keep, byte_compile, py_files, **kwargs):
+    """
+    Replacement function for distutils.util.byte_compile() which passes only
+    files in keep set to given byte_compile function.
+    """
+    byte_compile([path for path in py_files if os.path.normpath(path) in keep], **kwargs)
+
+def remove_empty_directories(entries, parent_dirs):
+    """
+    Removes directory entries within parent_dirs which have no files below
+    them.
+    """
+    files = [entry.archive_path for entry in entries if not entry.archive_path.endswith('/')]
+    def is_empty(directory):
+        return (any(directory.startswith(parent + '/') for parent in parent_dirs)
+                and not any(path.startswith(directory) for path in files))
+    return [entry for entry in entries if not (entry.archive_path.endswith('/') and is_empty(entry.archive_path))]
 
-    :param module: target module to modify
-    :param function_name: target function name to modify
-    :param replacement: replacement function
-    :return: context manager
+def build_py_byte_compile(build_py, byte_compile, files):
     """
-    original = getattr(module, function_name)
-    setattr(module, function_name, replacement)
+    Replacement of build_py command's byte_compile() method, which compiles
+    with given function instead of distutils.util.byte_compile().
+
+    :param build_py: build_py command object
+    :param byte_compile: function with signature of distutils.util.byte_compile()
+    :param files: files to compile
+    """
+    if sys.dont_write_bytecode:
+        build_py.warn('byte-compiling is disabled, skipping.')
+        return
+    prefix = build_py.build_lib
+    if prefix[-1] != os.sep:
+        prefix = prefix + os.sep
+    if build_py.compile:
+        byte_compile(files, optimize=0, force=build_py.force, prefix=prefix, dry_run=build_py.dry_run)
+    if build_py.optimize > 0:
+        byte_compile(files, optimize=build_py.optimize, force=build_py.force, prefix=prefix,
+                     dry_run=build_py.dry_run)
+
+# Script executed by external interpreter when compile server is not used.
+# Collects compile errors which byte_compile() would otherwise just print and
+# fails with non-zero exit status if there were any.
+BYTE_COMPILE_SCRIPT = """\
+import sys
+import py_compile
+from distutils.util import byte_compile
+errors = []
+def compile(file, cfile=None, dfile=None, doraise=False, _compile=py_compile.compile):
     try:
-        yield
-    finally:
-        setattr(module, function_name, original)
+        _compile(file, cfile, dfile, doraise=True)
+    except py_compile.PyCompileError as err:
+        errors.append(err.msg)
+py_compile.compile = compile
+files = [
+{files}
+]
+byte_compile(files, optimize={optimize!r}, force={force!r}, prefix={prefix!r})
+if errors:
+    sys.stderr.write('\\n'.join(errors) + '\\n')
+    sys.exit(1)
+"""
 
-def python27_byte_compile(python27, files, optimize, force, prefix, dry_run):
+def python27_byte_compile(python27, files, optimize, force, prefix, dry_run, server_timeout=0, jobs=1):
     """
     Replacement function for distutils.util.byte_compile() which delegates call
     to external Python interpreter, given as the first argument.
+    When server_timeout is non-zero, the files are compiled with a compile
+    server which is kept running for server_timeout seconds after the last
+    compilation, otherwise a new interpreter is started for this call only.
+    With jobs greater than one the files are split evenly between that many
+    interpreters running in parallel.
     """
-    with NamedTemporaryFile(suffix='.py', delete=False) as script_file:
-        script_file.write('\n'.join([
-            'from distutils.util import byte_compile',
-            'files = [',
-            ',\n'.join(map(repr, files)),
-            ']',
-            'byte_compile(files, optimize=%r, force=%r, prefix=%r)' % (optimize, force, prefix)
-        ]).encode('utf-8'))
+    # Like byte_compile(), ignore non-source files (e.g. package data)
+    files = [path for path in files if path.endswith('.py')]
+    if not files:
+        return
+    chunks = [chunk for chunk in (files[index::jobs] for index in range(jobs)) if chunk]
+    if server_timeout and not dry_run:
+        def compile_chunk(args):
+            slot, chunk = args
+            return server_byte_compile(python27, server_timeout, chunk, optimize, force, prefix, slot)
+        try:
+            results = run_in_parallel(compile_chunk, list(enumerate(chunks)), jobs)
+        except CompileServerError as err:
+            log.warn("compile server unavailable (%s), starting %s directly", err, python27)
+        else:
+            errors = ['%s: %s' % (path, error) for chunk in results for path, error in chunk if error]
+            if errors:
+                raise DistutilsByteCompileError('byte-compiling failed:\n  ' + '\n  '.join(errors))
+            return
+    script_paths = []
     try:
-        distutils.util.spawn([python27, script_file.name], dry_run=dry_run)
+        for chunk in chunks:
+            with NamedTemporaryFile(suffix='.py', delete=False) as script_file:
+                script_paths.append(script_file.name)
+                script_file.write(BYTE_COMPILE_SCRIPT.format(
+                    files=',\n'.join(map(repr, chunk)),
+                    optimize=optimize,
+                    force=force,
+                    prefix=prefix
+                ).encode('utf-8'))
+        if len(script_paths) == 1:
+            distutils.util.spawn([python27, script_paths[0]], dry_run=dry_run)
+        else:
+            spawn_in_parallel([[python27, path] for path in script_paths], dry_run=dry_run)
     finally:
-        distutils.util.execute(os.remove, (script_file.name,), "removing %s" % script_file.name, dry_run=dry_run)
+        for path in script_paths:
+            distutils.util.execute(os.remove, (path,), "removing %s" % path, dry_run=dry_run)
+
+def server_byte_compile(python, server_timeout, files, optimize, force, prefix, slot=0):
+    """
+    Compiles files with a compile server, starting the server if it is not
+    running yet. A server which has just shut down due to inactivity is
+    replaced with a new one.
+    :return: list of (file path, error message or None) tuples
+    """
+    # Server runs in a different working directory, give it absolute paths
+    abs_files = [os.path.abspath(path) for path in files]
+    if prefix:
+        prefix = os.path.join(os.path.abspath(prefix), '') if prefix.endswith(os.sep) else os.path.abspath(prefix)
+    try:
+        server = get_compile_server(python, optimize, server_timeout, slot)
+        results = server.compile(abs_files, force, prefix)
+    except CompileServerError:
+        server = get_compile_server(python, optimize, server_timeout, slot, reconnect=True)
+        results = server.compile(abs_files, force, prefix)
+    return [(path, error) for path, (_, error) in zip(files, results)]
+
+def run_in_parallel(func, items, threads=None):
+    """
+    Calls func for each item in a pool of threads.
+    :param threads: maximum number of threads, one per CPU by default
+    :return: list of return values, in same order as items
+    """
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(max(1, min(threads or multiprocessing.cpu_count(), len(items))))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+
+def spawn_in_parallel(commands, dry_run=0):
+    """
+    Like distutils.util.spawn(), but runs all given commands at the same time.
+    Raises DistutilsExecError once all commands have finished if any of them
+    failed.
+    """
+    for command in commands:
+        log.info(' '.join(command))
+    if dry_run:
+        return
+    try:
+        processes = [subprocess.Popen(command) for command in commands]
+    except OSError as err:
+        raise DistutilsExecError("command %r failed: %s" % (commands[0][0], err))
+    failures = []
+    for command, process in zip(commands, processes):
+        code = process.wait()
+        if code != 0:
+            failures.append("command %r failed with exit status %d" % (' '.join(command), code))
+    if failures:
+        raise DistutilsExecError('\n'.join(failures))
+
+class CompileManifest(object):
+    """
+    Remembers content hash, interpreter and optimization level of each
+    byte-compiled source file so that unchanged files need not be compiled
+    again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r') as manifest_file:
+                self.entries = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        mkpath(os.path.dirname(self.path))
+        with open(self.path, 'w') as manifest_file:
+            json.dump(self.entries, manifest_file, indent=1, sort_keys=True)
+
+    def get_stale_files(self, files, interpreter, optimize, python2):
+        """
+        Returns those files which have changed since they were last compiled,
+        together with their current states.
+        :return: list of (file path, state) tuples
+        """
+        stale = []
+        for path in files:
+            state = {'sha1': hash_file(path), 'interpreter': interpreter}
+            entry = self.entries.get(manifest_key(path, optimize))
+            if entry != state or not os.path.exists(get_compiled_path(path, optimize, python2)):
+                stale.append((path, state))
+        return stale
+
+    def remove_missing(self, files, optimize, python2, dry_run=0):
+        """
+        Forgets sources which are no longer part of the build and removes them
+        and their compiled files from the build directory.
+        """
+        current = set(manifest_key(path, optimize) for path in files)
+        for key in list(self.entries):
+            path, key_optimize = key.rsplit('|', 1)
+            if key_optimize != str(optimize) or key in current:
+                continue
+            for stale_path in (path, get_compiled_path(path, optimize, python2)):
+                if os.path.exists(stale_path):
+                    log.info("removing stale %s", stale_path)
+                    if not dry_run:
+                        os.remove(stale_path)
+            del self.entries[key]
+
+def manifest_key(path, optimize):
+    return '%s|%d' % (os.path.normpath(path), optimize)
+
+def incremental_byte_compile(manifest, interpreter, python2, byte_compile, py_files, optimize=0,
+                             force=0, prefix=None, dry_run=0, keep=None, **kwargs):
+    """
+    Replacement function for distutils.util.byte_compile() which passes only
+    files changed since previous build to given byte_compile function.
+    :param keep: set of files to compile when pruning, other files are left
+                 as they are in the build directory
+    """
+    py_files = [path for path in py_files if path.endswith('.py')]
+    manifest.remove_missing(py_files, optimize, python2, dry_run=dry_run)
+    if keep is not None:
+        py_files = [path for path in py_files if os.path.normpath(path) in keep]
+    if force:
+        stale = [(path, {'sha1': hash_file(path), 'interpreter': interpreter}) for path in py_files]
+    else:
+        stale = manifest.get_stale_files(py_files, interpreter, optimize, python2)
+    log.info("byte-compiling %d of %d modules, others are up-to-date", len(stale), len(py_files))
+    byte_compile([path for path, _ in stale], optimize=optimize, force=1, prefix=prefix, dry_run=dry_run)
+    if not dry_run:
+        for path, state in stale:
+            manifest.entries[manifest_key(path, optimize)] = state
+        manifest.save()
+
+def cached_byte_compile(cache, interpreter_version, byte_compile, py_files, optimize=0,
+                        force=0, prefix=None, dry_run=0, **kwargs):
+    """
+    Replacement function for distutils.util.byte_compile() which copies
+    modules found from given PycCache and passes only the others to given
+    byte_compile function, storing their results to the cache.
+    """
+    py_files = [path for path in py_files if path.endswith('.py')]
+    misses = []
+    for path in py_files:
+        cfile = get_compiled_path(path, optimize, True)
+        if not force and os.path.exists(cfile) and not newer(path, cfile):
+            continue
+        dfile = path
+        if prefix and path.startswith(prefix):
+            dfile = path[len(prefix):]
+        key = cache.get_key(hash_file(path), interpreter_version, optimize, dfile)
+        if dry_run or not cache.fetch(key, cfile, os.stat(path).st_mtime):
+            misses.append((path, cfile, key))
+    log.info("pyc cache: %d hits, %d misses", cache.hits, cache.misses)
+    byte_compile([path for path, _, _ in misses], optimize=optimize, force=1, prefix=prefix, dry_run=dry_run)
+    if not dry_run:
+        for path, cfile, key in misses:
+            if os.path.exists(cfile):
+                cache.store(key, cfile)
+        cache.evict()
+        cache.save_stats()
+
+def get_interpreter_id(python):
+    """
+    Returns string which changes when given Python interpreter is replaced
+    with another one (e.g. upgraded).
+    """
+    python = find_executable(python) or python
+    try:
+        return '%s@%d' % (os.path.realpath(python), os.stat(os.path.realpath(python)).st_mtime)
+    except OSError:
+        return python
+
+def is_python2(python):
+    # Interpreters other than the current one are given with --python27
+    if python == sys.executable:
+        return sys.version_info[0] == 2
+    return True
+
+def get_compiled_path(path, optimize, python2):
+    """
+    Returns path where byte_compile() writes compiled version of source file.
+    """
+    if python2:
+        return path + ('o' if optimize else 'c')
+    import importlib.util
+    return importlib.util.cache_from_source(path, optimization='' if optimize == 0 else optimize)
 
 def is_python27_pyc_file(filepath):
     with open(filepath, 'rb') as pyc_file:
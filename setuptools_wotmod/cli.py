@@ -0,0 +1,195 @@
+"""
+Command line tool for working with built wotmod packages.
+
+Usage: wotmod verify [--json] [--report=FILE] [--jobs=N] PACKAGE_OR_DIR...
+       wotmod conflicts [--json] [--index=FILE | --no-index] MODS_DIR
+       wotmod cache [--cache-dir=DIR] [--clear]
+       wotmod cache-server [--host=HOST] [--port=PORT] DIR
+       wotmod diff [--json] [--no-content] [--context=N] OLD_PACKAGE NEW_PACKAGE
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+from setuptools_wotmod.conflicts import analyze, get_index_path
+from setuptools_wotmod.dependencies import get_cache_dir
+from setuptools_wotmod.diff import diff_packages
+from setuptools_wotmod.pyc_cache import PycCache
+from setuptools_wotmod.remote_cache import CacheServer
+from setuptools_wotmod.verify import verify_packages
+
+def print_verify_results(results, out=sys.stdout):
+    for result in results:
+        print('%s: %s' % (result['path'], 'ok' if result['ok'] else 'FAILED'), file=out)
+        for error in result['errors']:
+            print('  error: %s' % error, file=out)
+        for warning in result['warnings']:
+            print('  warning: %s' % warning, file=out)
+    failed = [result for result in results if not result['ok']]
+    print('%d verified, %d failed' % (len(results) - len(failed), len(failed)), file=out)
+
+def write_report(results, path):
+    report = json.dumps({'packages': results}, indent=2, sort_keys=True)
+    if path == '-':
+        print(report)
+    else:
+        with open(path, 'w') as report_file:
+            report_file.write(report)
+
+def verify_command(args):
+    results = verify_packages(args.packages, args.jobs)
+    if args.json:
+        write_report(results, '-')
+    else:
+        print_verify_results(results)
+    if args.report:
+        write_report(results, args.report)
+    return 0 if all(result['ok'] for result in results) else 1
+
+def print_conflicts(report, out=sys.stdout):
+    for duplicate in report['duplicates']:
+        print('%s is installed in %d versions, %s is loaded:' % (
+            duplicate['id'], len(duplicate['packages']), duplicate['loaded']), file=out)
+        for path in duplicate['packages']:
+            print('  %s' % path, file=out)
+    for collision in report['collisions']:
+        print('%s is shipped by:' % collision['path'], file=out)
+        for path in collision['packages']:
+            print('  %s' % path, file=out)
+    for package in report['packages']:
+        if package['error']:
+            print('cannot read %s: %s' % (package['path'], package['error']), file=out)
+    width = max([len(mod['id']) for mod in report['mods']] + [3])
+    print('', file=out)
+    print('%-*s  %10s  %12s' % (width, 'mod', 'size', 'uncompressed'), file=out)
+    print('-' * (width + 26), file=out)
+    for mod in report['mods']:
+        print('%-*s  %10d  %12d' % (width, mod['id'], mod['size'], mod['uncompressed_size']), file=out)
+    print('-' * (width + 26), file=out)
+    print('%d packages, %d collisions, %d duplicate mods' % (
+        len(report['packages']), len(report['collisions']), len(report['duplicates'])), file=out)
+
+def conflicts_command(args):
+    index_path = None if args.no_index else (args.index or get_index_path())
+    report = analyze(args.mods_dir, index_path)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_conflicts(report)
+    return 0 if not report['collisions'] and not report['duplicates'] else 1
+
+def cache_command(args):
+    cache = PycCache(args.cache_dir or get_cache_dir(), 0)
+    if args.clear:
+        cache.clear()
+        print('cleared %s' % cache.directory)
+        return 0
+    stats = cache.get_stats()
+    lookups = stats['hits'] + stats['misses']
+    print('directory: %s' % cache.directory)
+    print('entries:   %d' % stats['entries'])
+    print('size:      %.1f MB' % (stats['size'] / 1024.0 / 1024.0))
+    print('hits:      %d' % stats['hits'])
+    print('misses:    %d' % stats['misses'])
+    print('hit rate:  %.1f %%' % (100.0 * stats['hits'] / lookups if lookups else 0))
+    return 0
+
+def cache_server_command(args):
+    server = CacheServer(args.directory, (args.host, args.port))
+    print('serving %s at %s' % (args.directory, server.get_url()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def print_diff(report, out=sys.stdout):
+    print('--- %s' % report['old'], file=out)
+    print('+++ %s' % report['new'], file=out)
+    for member in report['added']:
+        print('added:   %s (%d bytes)' % (member['path'], member['size']), file=out)
+    for member in report['removed']:
+        print('removed: %s (%d bytes)' % (member['path'], member['size']), file=out)
+    for member in report['changed']:
+        print('changed: %s (%d -> %d bytes)' % (member['path'], member['old_size'], member['new_size']), file=out)
+        for line in member['diff'] or []:
+            print('  %s' % line, file=out)
+    size = report['size']
+    print('%d added, %d removed, %d changed, %d unchanged; contents %+d bytes, package %+d bytes' % (
+        len(report['added']), len(report['removed']), len(report['changed']), report['unchanged'],
+        size['delta'], size['package_delta']), file=out)
+
+def diff_command(args):
+    report = diff_packages(args.old, args.new, content=not args.no_content, context=args.context)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_diff(report)
+    return 1 if report['added'] or report['removed'] or report['changed'] else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wotmod', description='Tools for wotmod packages.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    verify_parser = subparsers.add_parser(
+        'verify', help='check built packages without extracting them')
+    verify_parser.add_argument('packages', nargs='+', metavar='PACKAGE',
+                               help='wotmod file, or directory of wotmod files')
+    verify_parser.add_argument('--jobs', type=int,
+                               help='number of packages checked at a time [default: one per CPU]')
+    verify_parser.add_argument('--json', action='store_true',
+                               help='print JSON report instead of human readable results')
+    verify_parser.add_argument('--report', metavar='FILE', help='write JSON report to FILE')
+    verify_parser.set_defaults(func=verify_command)
+
+    conflicts_parser = subparsers.add_parser(
+        'conflicts', help='find files shadowed by other packages in a mods directory')
+    conflicts_parser.add_argument('mods_dir', metavar='MODS_DIR', help='directory of installed wotmod files')
+    conflicts_parser.add_argument('--json', action='store_true',
+                                  help='print JSON report instead of human readable results')
+    conflicts_parser.add_argument('--index', metavar='FILE',
+                                  help='index cache file [default: conflicts-index.json in cache directory]')
+    conflicts_parser.add_argument('--no-index', action='store_true', help='do not use index cache')
+    conflicts_parser.set_defaults(func=conflicts_command)
+
+    cache_parser = subparsers.add_parser(
+        'cache', help='show statistics of the compiled modules cache')
+    cache_parser.add_argument('--cache-dir', metavar='DIR',
+                              help='cache directory [default: BDIST_WOTMOD_CACHE_DIR environment variable '
+                              'or user\'s cache directory]')
+    cache_parser.add_argument('--clear', action='store_true', help='remove all cached modules')
+    cache_parser.set_defaults(func=cache_command)
+
+    server_parser = subparsers.add_parser(
+        'cache-server', help='run reference remote cache server for bdist_wotmod --remote-cache')
+    server_parser.add_argument('directory', metavar='DIR', help='directory to store cache entries to')
+    server_parser.add_argument('--host', default='127.0.0.1',
+                               help='address to listen to, 0.0.0.0 for all interfaces [default: 127.0.0.1]')
+    server_parser.add_argument('--port', type=int, default=8080, help='port to listen to [default: 8080]')
+    server_parser.set_defaults(func=cache_server_command)
+
+    diff_parser = subparsers.add_parser(
+        'diff', help='show what changed between two packages, e.g. two releases of a mod')
+    diff_parser.add_argument('old', metavar='OLD_PACKAGE', help='wotmod file to compare from')
+    diff_parser.add_argument('new', metavar='NEW_PACKAGE', help='wotmod file to compare to')
+    diff_parser.add_argument('--json', action='store_true',
+                             help='print JSON report instead of human readable results')
+    diff_parser.add_argument('--no-content', action='store_true',
+                             help='compare only sizes and CRCs, do not decompress changed files')
+    diff_parser.add_argument('--context', type=int, default=3, metavar='N',
+                             help='lines of context in text diffs [default: 3]')
+    diff_parser.set_defaults(func=diff_command)
+
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Implements a long-lived byte-compile server.
+Starting a Python 2.7 interpreter for each byte_compile() call is slow, so
+instead bdist_wotmod starts this module as a script with the Python 2.7
+interpreter and keeps sending batches of files to it over a local socket. The
+server is shared by all bdist_wotmod runs of the same user and shuts itself
+down after it has been idle long enough.
+
+This file is executed by the Python 2.7 interpreter, so the server part of it
+must import only standard library modules.
+"""
+
+import binascii
+import errno
+import json
+import os
+import py_compile
+import socket
+import sys
+import threading
+import time
+
+# Increase when the protocol changes, prevents clients from talking to a server
+# started by an older version of this module
+PROTOCOL_VERSION = 1
+
+class CompileServerError(Exception):
+    pass
+
+class CompileServer(object):
+    """
+    Accepts compile requests from clients until no requests have been received
+    for idle_timeout seconds.
+    """
+
+    def __init__(self, address_file, idle_timeout):
+        self.address_file = address_file
+        self.idle_timeout = idle_timeout
+        self.token = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.lock = threading.Lock()
+        self.active_connections = 0
+        self.last_activity = time.time()
+
+    def serve_forever(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(16)
+        sock.settimeout(1.0)
+        port = sock.getsockname()[1]
+        write_address_file(self.address_file, {
+            'port': port,
+            'token': self.token,
+            'pid': os.getpid(),
+        })
+        try:
+            while not self.is_idle():
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                with self.lock:
+                    self.active_connections += 1
+                    self.last_activity = time.time()
+                thread = threading.Thread(target=self.handle_connection, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            sock.close()
+            address = read_address_file(self.address_file)
+            if address is not None and address.get('port') == port:
+                remove_file(self.address_file)
+
+    def is_idle(self):
+        with self.lock:
+            return (self.active_connections == 0 and
+                    time.time() - self.last_activity > self.idle_timeout)
+
+    def handle_connection(self, conn):
+        try:
+            conn.settimeout(None)
+            stream = conn.makefile('rwb')
+            request = json.loads(stream.readline().decode('utf-8'))
+            if request.get('token') != self.token:
+                response = {'error': 'invalid token'}
+            else:
+                response = self.handle_request(request)
+            stream.write(json.dumps(response).encode('utf-8') + b'\n')
+            stream.flush()
+            stream.close()
+        except Exception:
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                self.active_connections -= 1
+                self.last_activity = time.time()
+
+    def handle_request(self, request):
+        if request.get('command') == 'version':
+            return {'version': sys.version}
+        results = []
+        for path in request['files']:
+            try:
+                compile_file(path, request.get('force'), request.get('prefix'))
+                results.append({'file': path, 'error': None})
+            except Exception as err:
+                results.append({'file': path, 'error': getattr(err, 'msg', None) or str(err)})
+        return {'results': results}
+
+def compile_file(path, force, prefix):
+    """
+    Byte-compiles a single file the same way as distutils.util.byte_compile()
+    does. The optimization level is determined by flags given to the
+    interpreter running the server.
+    """
+    if sys.version_info[0] >= 3:
+        import importlib.util
+        optimization = '' if sys.flags.optimize == 0 else sys.flags.optimize
+        cfile = importlib.util.cache_from_source(path, optimization=optimization)
+    else:
+        cfile = path + (__debug__ and 'c' or 'o')
+    dfile = path
+    if prefix:
+        if path[:len(prefix)] != prefix:
+            raise ValueError('invalid prefix: filename %r doesn\'t start with %r' % (path, prefix))
+        dfile = dfile[len(prefix):]
+    if force or not os.path.exists(cfile) or os.stat(path).st_mtime > os.stat(cfile).st_mtime:
+        py_compile.compile(path, cfile, dfile, doraise=True)
+
+def write_address_file(path, address):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as address_file:
+        json.dump(address, address_file)
+    if os.name == 'nt':
+        remove_file(path)
+    os.rename(tmp_path, path)
+
+def read_address_file(path):
+    try:
+        with open(path, 'r') as address_file:
+            return json.load(address_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+# Client side
+
+_clients = {}
+_client_locks = {}
+_clients_lock = threading.Lock()
+
+class CompileServerClient(object):
+    """
+    Connection details to a running compile server.
+    """
+
+    def __init__(self, address_file, address):
+        self.address_file = address_file
+        self.port = address['port']
+        self.token = address['token']
+
+    def request(self, request):
+        request = dict(request, token=self.token)
+        try:
+            conn = socket.create_connection(('127.0.0.1', self.port), timeout=5.0)
+        except socket.error as err:
+            raise CompileServerError('cannot connect to compile server: %s' % err)
+        try:
+            # Compiling a large batch may take a while
+            conn.settimeout(None)
+            stream = conn.makefile('rwb')
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+            stream.close()
+        except socket.error as err:
+            raise CompileServerError('compile server connection failed: %s' % err)
+        finally:
+            conn.close()
+        if not line:
+            raise CompileServerError('compile server closed connection')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise CompileServerError('compile server refused request: %s' % response['error'])
+        return response
+
+    def compile(self, files, force, prefix):
+        """
+        Byte-compiles given files.
+        :return: list of (file path, error message or None) tuples
+        """
+        response = self.request({'files': list(files), 'force': bool(force), 'prefix': prefix})
+        return [(result['file'], result['error']) for result in response['results']]
+
+    def get_version(self):
+        return self.request({'command': 'version'})['version']
+
+def get_address_file_path(python, optimize, slot=0):
+    import getpass
+    import hashlib
+    import tempfile
+    key = '|'.join([
+        os.path.realpath(python),
+        str(optimize),
+        str(slot),
+        str(PROTOCOL_VERSION),
+        getpass.getuser(),
+    ])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), 'setuptools-wotmod-compile-%s.json' % digest)
+
+def get_compile_server(python, optimize, idle_timeout, slot=0, reconnect=False):
+    """
+    Returns client of a compile server running with given interpreter and
+    optimization level. Connects to an already running server if one exists,
+    otherwise starts a new one.
+
+    :param python: path to Python interpreter running the server
+    :param optimize: optimization level (0, 1 or 2)
+    :param idle_timeout: seconds of inactivity after which a started server exits
+    :param slot: index of the server, allows running several servers with
+                 same interpreter and optimization level
+    :param reconnect: ignore previously returned client, e.g. after its
+                      server has stopped responding
+    :return: CompileServerClient object
+    """
+    from setuptools_wotmod.locking import FileLock
+    address_file = get_address_file_path(python, optimize, slot)
+    with _clients_lock:
+        lock = _client_locks.setdefault(address_file, threading.Lock())
+    # Lock per server so that several servers can be started in parallel
+    with lock:
+        client = _clients.get(address_file)
+        if reconnect or client is None or read_address_file(address_file) is None:
+            # Concurrent builds must not both start a server for the same
+            # address file
+            with FileLock(address_file + '.lock'):
+                client = _connect(address_file)
+                if client is None:
+                    client = _start_server(python, optimize, idle_timeout, address_file)
+            _clients[address_file] = client
+        return client
+
+def _connect(address_file):
+    address = read_address_file(address_file)
+    if address is None:
+        return None
+    client = CompileServerClient(address_file, address)
+    try:
+        client.get_version()
+    except CompileServerError:
+        return None
+    return client
+
+def _start_server(python, optimize, idle_timeout, address_file):
+    import subprocess
+    script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    if not os.path.isfile(script):
+        raise CompileServerError('compile server script %s not found' % script)
+    remove_file(address_file)
+    args = [python] + ['-O'] * optimize + [script, address_file, str(idle_timeout)]
+    kwargs = {}
+    if os.name == 'nt':
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+        kwargs['creationflags'] = 0x00000008 | 0x00000200
+    else:
+        kwargs['close_fds'] = True
+        if sys.version_info[0] >= 3:
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+    with open(os.devnull, 'r+b') as devnull:
+        try:
+            process = subprocess.Popen(args, stdin=devnull, stdout=devnull, stderr=devnull, **kwargs)
+        except OSError as err:
+            raise CompileServerError('cannot start compile server %s: %s' % (python, err))
+    deadline = time.time() + 15.0
+    while time.time() < deadline:
+        client = _connect(address_file)
+        if client is not None:
+            return client
+        if process.poll() is not None:
+            raise CompileServerError('compile server exited with code %d' % process.returncode)
+        time.sleep(0.05)
+    raise CompileServerError('compile server did not start in time')
+
+if __name__ == '__main__':
+    CompileServer(sys.argv[1], float(sys.argv[2])).serve_forever()
@@ -0,0 +1,202 @@
+"""
+Finds conflicts between wotmod packages installed to a game's mods directory.
+The game overlays all packages into one virtual file system, so a file shipped
+by two packages silently shadows the other one.
+
+Packages are indexed by reading only their zip central directories. The index
+is cached on disk and a package is indexed again only if its size or
+modification time has changed.
+"""
+
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+from setuptools_wotmod.archive import replace_file
+from setuptools_wotmod.dependencies import get_cache_dir
+
+# Bump when contents of index entries change
+INDEX_VERSION = 1
+
+def get_index_path():
+    """
+    Returns default path of the index cache file.
+    """
+    return os.path.join(get_cache_dir(), 'conflicts-index.json')
+
+def find_wotmod_files(mods_dir):
+    """
+    Returns paths to all wotmod files within mods_dir and its subdirectories.
+    """
+    packages = []
+    for root, dirs, files in os.walk(mods_dir):
+        dirs.sort()
+        packages.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.wotmod'))
+    return packages
+
+def split_package_name(filename):
+    """
+    Splits package file name '<id>_<version>.wotmod' to id and version.
+    :return: tuple of (id, version), version is None if not found
+    """
+    match = re.match(r'^(.+)_([^_]+)\.wotmod$', filename, re.IGNORECASE)
+    if not match:
+        return os.path.splitext(filename)[0], None
+    return match.group(1), match.group(2)
+
+def index_package(path):
+    """
+    Reads package's central directory.
+    :return: index entry dict
+    """
+    mod_id, version = split_package_name(os.path.basename(path))
+    entry = {
+        'id': mod_id,
+        'version': version,
+        'files': {},
+        'error': None,
+    }
+    try:
+        with zipfile.ZipFile(path, 'r') as zip:
+            for info in zip.infolist():
+                if not info.filename.endswith('/'):
+                    entry['files'][info.filename] = info.file_size
+    except (IOError, OSError, zipfile.BadZipfile, zipfile.LargeZipFile) as err:
+        entry['error'] = str(err)
+    return entry
+
+class PackageIndex(object):
+    """
+    Cache of indexed packages, keyed by package path and invalidated by
+    package's size and modification time.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r') as index_file:
+                    data = json.load(index_file)
+                if data.get('version') == INDEX_VERSION:
+                    self.entries = data['packages']
+            except (IOError, OSError, ValueError, KeyError):
+                self.entries = {}
+
+    def get(self, path):
+        """
+        Returns index entry of a package, indexing it if not cached or if
+        the package has changed.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.entries.get(key)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = index_package(path)
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime
+            self.entries[key] = entry
+            self.changed = True
+        return entry
+
+    def prune(self, mods_dir, paths):
+        """
+        Drops entries of packages within mods_dir which no longer exist. The
+        index may also contain packages of other mods directories.
+        """
+        prefix = os.path.join(os.path.abspath(mods_dir), '')
+        keep = set(os.path.abspath(path) for path in paths)
+        for key in list(self.entries):
+            if key.startswith(prefix) and key not in keep:
+                del self.entries[key]
+                self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump({'version': INDEX_VERSION, 'packages': self.entries}, index_file)
+        replace_file(tmp_path, self.path)
+        self.changed = False
+
+def analyze(mods_dir, index_path=None):
+    """
+    Indexes packages in mods_dir and finds path collisions between different
+    mods and mods installed in several versions.
+
+    :param mods_dir: directory to scan for wotmod files
+    :param index_path: path of index cache file, or None to not use a cache
+    :return: report dict with 'packages', 'mods', 'collisions' and
+             'duplicates' lists
+    """
+    paths = find_wotmod_files(mods_dir)
+    index = PackageIndex(index_path)
+    index.prune(mods_dir, paths)
+    entries = [index.get(path) for path in paths]
+    index.save()
+
+    packages = []
+    for path, entry in zip(paths, entries):
+        packages.append({
+            'path': path,
+            'id': entry['id'],
+            'version': entry['version'],
+            'file_count': len(entry['files']),
+            'size': entry['size'],
+            'uncompressed_size': sum(entry['files'].values()),
+            'error': entry['error'],
+        })
+
+    # Installed versions of each mod id, WoT picks the package whose name is
+    # greatest by strcmp()
+    by_id = {}
+    for package in packages:
+        by_id.setdefault(package['id'], []).append(package)
+    duplicates = []
+    for mod_id, mod_packages in sorted(by_id.items()):
+        if len(mod_packages) > 1:
+            names = sorted(os.path.basename(package['path']) for package in mod_packages)
+            duplicates.append({
+                'id': mod_id,
+                'packages': [package['path'] for package in mod_packages],
+                'versions': sorted(package['version'] for package in mod_packages if package['version']),
+                'loaded': names[-1],
+            })
+
+    mods = []
+    for mod_id, mod_packages in sorted(by_id.items()):
+        mods.append({
+            'id': mod_id,
+            'size': sum(package['size'] for package in mod_packages),
+            'uncompressed_size': sum(package['uncompressed_size'] for package in mod_packages),
+        })
+
+    # Files shipped by more than one mod, versions of the same mod are
+    # already reported as duplicates. Files in package root (meta.xml and
+    # documents) are not part of the virtual file system.
+    owners = {}
+    for path, entry in zip(paths, entries):
+        for name in entry['files']:
+            if '/' in name:
+                owners.setdefault(name, []).append((entry['id'], path))
+    collisions = []
+    for name, name_owners in sorted(owners.items()):
+        if len(set(mod_id for mod_id, _ in name_owners)) > 1:
+            collisions.append({
+                'path': name,
+                'packages': [path for _, path in name_owners],
+            })
+
+    return {
+        'packages': packages,
+        'mods': mods,
+        'collisions': collisions,
+        'duplicates': duplicates,
+    }
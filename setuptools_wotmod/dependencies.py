@@ -0,0 +1,255 @@
+"""
+Bundles dependencies listed in install_requires into wotmod packages. Sources
+of the dependencies are looked up from a local directory, nothing is
+downloaded. Each dependency is built with bdist_wotmod in a separate process
+and the built packages are cached, so that a dependency shared by several mods
+is built only once.
+"""
+
+from distutils import log
+from distutils.errors import DistutilsError
+from setuptools.extern.packaging.requirements import Requirement
+from setuptools.extern.packaging.utils import canonicalize_name
+from setuptools.extern.packaging.version import InvalidVersion, Version
+
+from setuptools_wotmod.locking import FileLock
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+
+# Source archive types found from a dependency directory
+SOURCE_EXTENSIONS = ('.tar.gz', '.tgz', '.tar.bz2', '.zip')
+
+# Environment used for evaluating requirement markers, World of Tanks runs
+# Python 2.7 on Windows
+TARGET_ENVIRONMENT = {
+    'implementation_name': 'cpython',
+    'implementation_version': '2.7.18',
+    'os_name': 'nt',
+    'platform_machine': 'AMD64',
+    'platform_python_implementation': 'CPython',
+    'platform_system': 'Windows',
+    'python_full_version': '2.7.18',
+    'python_version': '2.7',
+    'sys_platform': 'win32',
+}
+
+# Names of dependencies being built by parent processes, prevents endless
+# recursion with circular dependencies
+CHAIN_ENV_VARIABLE = 'BDIST_WOTMOD_DEPENDENCY_CHAIN'
+
+class DependencyError(DistutilsError):
+    pass
+
+def get_cache_dir():
+    """
+    Returns user level cache directory of setuptools-wotmod.
+    """
+    if 'BDIST_WOTMOD_CACHE_DIR' in os.environ:
+        return os.environ['BDIST_WOTMOD_CACHE_DIR']
+    if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
+        return os.path.join(os.environ['LOCALAPPDATA'], 'setuptools-wotmod', 'cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'setuptools-wotmod')
+
+def parse_requirements(install_requires):
+    """
+    Parses install_requires, dropping requirements whose markers don't match
+    the game's Python environment.
+    :return: list of Requirement objects
+    """
+    if isinstance(install_requires, str):
+        install_requires = install_requires.splitlines()
+    requirements = []
+    for line in install_requires or []:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        requirement = Requirement(line)
+        if requirement.marker is not None and not requirement.marker.evaluate(TARGET_ENVIRONMENT):
+            continue
+        requirements.append(requirement)
+    return requirements
+
+def split_source_name(filename):
+    """
+    Splits source archive or directory name to project name and version, e.g.
+    'pydash-4.2.1.tar.gz' to ('pydash', Version('4.2.1')).
+    :return: tuple of (canonical name, version), or None if not recognized
+    """
+    for extension in SOURCE_EXTENSIONS:
+        if filename.lower().endswith(extension):
+            filename = filename[:-len(extension)]
+            break
+    match = re.match(r'^(.+?)-(\d[^-]*)$', filename)
+    if not match:
+        return None
+    try:
+        return canonicalize_name(match.group(1)), Version(match.group(2))
+    except InvalidVersion:
+        return None
+
+def find_source(dependency_dir, requirement):
+    """
+    Finds newest source archive or unpacked source directory matching a
+    requirement from dependency_dir, or its per-project subdirectory like in
+    a file based package index.
+    :return: tuple of (version, path)
+    """
+    name = canonicalize_name(requirement.name)
+    candidates = []
+    for directory in (dependency_dir, os.path.join(dependency_dir, name)):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            parsed = split_source_name(entry)
+            if parsed is None or parsed[0] != name:
+                continue
+            if os.path.isdir(path) and not os.path.isfile(os.path.join(path, 'setup.py')):
+                continue
+            if requirement.specifier.contains(parsed[1], prereleases=True):
+                candidates.append((parsed[1], path))
+    if not candidates:
+        raise DependencyError('no source for %s found from %s' % (requirement, dependency_dir))
+    return max(candidates)
+
+def hash_source(path):
+    """
+    Returns hash of a source archive, or of files in a source directory.
+    """
+    digest = hashlib.sha1()
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(os.path.join(root, name) for root, dirs, files in os.walk(path) for name in files)
+    for file_path in paths:
+        digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+        with open(file_path, 'rb') as source_file:
+            for chunk in iter(lambda: source_file.read(65536), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_source(path, target_dir):
+    """
+    Extracts source archive to target_dir.
+    :return: path to the directory containing setup.py
+    """
+    if os.path.isdir(path):
+        project_dir = os.path.join(target_dir, os.path.basename(path))
+        shutil.copytree(path, project_dir)
+        return project_dir
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            check_member_paths(archive.namelist(), path)
+            archive.extractall(target_dir)
+    else:
+        archive = tarfile.open(path)
+        try:
+            check_member_paths(archive.getnames(), path)
+            archive.extractall(target_dir)
+        finally:
+            archive.close()
+    for root, dirs, files in os.walk(target_dir):
+        dirs.sort()
+        if 'setup.py' in files:
+            return root
+    raise DependencyError('%s does not contain setup.py' % path)
+
+def check_member_paths(names, archive_path):
+    for name in names:
+        normalized = os.path.normpath(name)
+        if os.path.isabs(normalized) or normalized.split(os.sep)[0] == '..':
+            raise DependencyError('%s contains unsafe path %s' % (archive_path, name))
+
+def get_build_args(options):
+    """
+    Converts bdist_wotmod options dict to command line arguments.
+    """
+    args = []
+    for key, value in sorted(options.items()):
+        option = '--' + key.replace('_', '-')
+        if value is True:
+            args.append(option)
+        elif value not in (None, False, ''):
+            args.append('%s=%s' % (option, value))
+    return args
+
+def build_dependency(requirement, dependency_dir, cache_dir, options):
+    """
+    Builds wotmod package(s) of a dependency, or returns them from the cache
+    if the same version has already been built with same options.
+
+    :param requirement: Requirement object
+    :param dependency_dir: directory to look up dependency sources from
+    :param cache_dir: directory for storing built packages
+    :param options: dict of bdist_wotmod options for building the dependency
+    :return: list of paths to built wotmod packages in the cache
+    """
+    version, source_path = find_source(dependency_dir, requirement)
+    name = canonicalize_name(requirement.name)
+    key = hashlib.sha1(json.dumps({
+        'name': name,
+        'version': str(version),
+        'source': hash_source(source_path),
+        'options': options,
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+    entry_dir = os.path.join(cache_dir, 'dependencies', '%s-%s-%s' % (name, version, key[:16]))
+    # Concurrent builds wait for the one building the same dependency, and
+    # then use its cached packages
+    with FileLock(entry_dir + '.lock'):
+        if os.path.isdir(entry_dir):
+            log.info("using cached build of %s %s", name, version)
+            return get_packages(entry_dir)
+
+        log.info("building dependency %s %s from %s", name, version, source_path)
+        work_dir = tempfile.mkdtemp(prefix='wotmod-dependency-')
+        try:
+            project_dir = extract_source(source_path, os.path.join(work_dir, 'source'))
+            dist_dir = os.path.join(work_dir, 'dist')
+            env = dict(os.environ)
+            chain = [n for n in env.get(CHAIN_ENV_VARIABLE, '').split(',') if n]
+            env[CHAIN_ENV_VARIABLE] = ','.join(chain + [name])
+            # Make the command available even if setuptools-wotmod isn't installed
+            package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+            args = [sys.executable, 'setup.py', '--command-packages=setuptools_wotmod', 'bdist_wotmod',
+                    '--dist-dir=%s' % dist_dir] + get_build_args(options)
+            process = subprocess.Popen(args, cwd=project_dir, env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = process.communicate()[0]
+            if process.returncode != 0:
+                raise DependencyError('building dependency %s %s failed:\n%s' % (
+                    name, version, output.decode('utf-8', 'replace')))
+            if not get_packages(dist_dir):
+                raise DependencyError('building dependency %s %s produced no packages' % (name, version))
+            # Move completed build to cache in one step, so that concurrent builds
+            # never see a partial cache entry
+            tmp_entry_dir = entry_dir + '.%d.tmp' % os.getpid()
+            if not os.path.isdir(os.path.dirname(entry_dir)):
+                os.makedirs(os.path.dirname(entry_dir))
+            shutil.move(dist_dir, tmp_entry_dir)
+            try:
+                os.rename(tmp_entry_dir, entry_dir)
+            except OSError:
+                # Another build stored the same dependency first
+                shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return get_packages(entry_dir)
+
+def get_packages(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.wotmod'))
+
+def get_dependency_chain():
+    return [name for name in os.environ.get(CHAIN_ENV_VARIABLE, '').split(',') if name]
@@ -0,0 +1,181 @@
+"""
+Syncs package contents unpacked to a directory, such as the game's
+res_mods/<version> directory, which the game loads loose files from.
+
+Files under 'res/' in the package are written to the target directory
+without the 'res/' prefix, as res_mods mirrors the game's res directory.
+Package root files (meta.xml and documents) are written to
+'.wotmod/<mod id>/' within the target directory.
+
+State of each sync is stored to '.wotmod/<mod id>.json' in the target
+directory. It records size, modification time and hash of each file's source
+and of the written file, so that unchanged files are skipped without reading
+them, and files written by an earlier sync which are no longer in the package
+are removed. Files not written by the sync are never touched.
+"""
+
+from distutils import log
+from multiprocessing.pool import ThreadPool
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from setuptools_wotmod.archive import CHUNK_SIZE, hash_file, replace_file
+
+STATE_VERSION = 1
+
+# Files larger than this are copied in parallel
+PARALLEL_COPY_SIZE = 1024 * 1024
+
+def get_target_path(archive_path, mod_id):
+    """
+    Returns path relative to target directory for a package member.
+    """
+    if archive_path.startswith('res/'):
+        return archive_path[len('res/'):]
+    return '.wotmod/%s/%s' % (mod_id, archive_path)
+
+def get_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+def load_state(path):
+    try:
+        with open(path, 'r') as state_file:
+            state = json.load(state_file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if state.get('version') != STATE_VERSION:
+        return {}
+    return state.get('files', {})
+
+def save_state(path, files):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as state_file:
+        json.dump({'version': STATE_VERSION, 'files': files}, state_file, sort_keys=True)
+    replace_file(tmp_path, path)
+
+def write_target(target, path=None, data=None):
+    """
+    Writes file contents atomically to target, so that the game never reads
+    partially written files.
+    """
+    directory = os.path.dirname(target)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created concurrently by another copying thread
+            if not os.path.isdir(directory):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as target_file:
+            if path is not None:
+                with open(path, 'rb') as source_file:
+                    shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+            else:
+                target_file.write(data)
+        if path is not None:
+            shutil.copystat(path, tmp_path)
+        replace_file(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def remove_empty_parents(path, root):
+    """
+    Removes empty directories from path's parent up to, but not including,
+    root.
+    """
+    directory = os.path.dirname(path)
+    while os.path.abspath(directory) != os.path.abspath(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+def sync_entries(entries, target_dir, mod_id, threads=4):
+    """
+    Syncs package entries to target_dir.
+
+    :param entries: list of PackageEntry objects
+    :param target_dir: directory to sync the entries to
+    :param mod_id: identifier of the mod, '<author_id>.<mod_id>'
+    :param threads: number of threads copying large files
+    :return: dict with counts of 'copied', 'skipped' and 'removed' files
+    """
+    state_path = os.path.join(target_dir, '.wotmod', '%s.json' % mod_id)
+    old_files = load_state(state_path)
+    new_files = {}
+    small_copies = []
+    large_copies = []
+    skipped = 0
+
+    for entry in entries:
+        if entry.archive_path.endswith('/'):
+            continue
+        relpath = get_target_path(entry.archive_path, mod_id)
+        target = os.path.join(target_dir, *relpath.split('/'))
+        old = old_files.get(relpath)
+        target_stat = get_stat(target)
+        target_intact = old is not None and target_stat == old['target']
+        if entry.path is not None:
+            source_stat = get_stat(entry.path)
+            if target_intact and source_stat == old['source']:
+                new_files[relpath] = old
+                skipped += 1
+                continue
+            digest = hash_file(entry.path)
+        else:
+            source_stat = None
+            digest = hashlib.sha1(entry.data).hexdigest()
+        if target_intact and digest == old['hash']:
+            new_files[relpath] = dict(old, source=source_stat)
+            skipped += 1
+            continue
+        new_files[relpath] = {'source': source_stat, 'hash': digest}
+        size = source_stat[0] if source_stat else len(entry.data)
+        copies = large_copies if size > PARALLEL_COPY_SIZE else small_copies
+        copies.append((relpath, target, entry))
+
+    def copy(item):
+        relpath, target, entry = item
+        log.info("copying %s -> %s", entry.path or entry.archive_path, target)
+        write_target(target, entry.path, entry.data)
+        new_files[relpath]['target'] = get_stat(target)
+
+    for item in small_copies:
+        copy(item)
+    if large_copies:
+        pool = ThreadPool(max(1, min(threads, len(large_copies))))
+        try:
+            pool.map(copy, large_copies)
+        finally:
+            pool.close()
+
+    # Remove files which earlier syncs wrote but which are no longer in the
+    # package, unless they have been changed since
+    removed = 0
+    for relpath, old in old_files.items():
+        if relpath in new_files:
+            continue
+        target = os.path.join(target_dir, *relpath.split('/'))
+        if get_stat(target) == old.get('target'):
+            log.info("removing %s", target)
+            os.remove(target)
+            remove_empty_parents(target, target_dir)
+            removed += 1
+
+    if not os.path.isdir(os.path.dirname(state_path)):
+        os.makedirs(os.path.dirname(state_path))
+    save_state(state_path, new_files)
+    return {'copied': len(small_copies) + len(large_copies), 'skipped': skipped, 'removed': removed}
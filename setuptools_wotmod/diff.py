@@ -0,0 +1,193 @@
+"""
+Compares two wotmod packages, e.g. a release candidate with the previous
+release. Members are compared by path, size and CRC-32 from the zip central
+directories, so nothing is decompressed for unchanged members and even very
+large packages are compared quickly. Only changed text members, such as
+meta.xml, are decompressed for a line diff, and changed pyc files for
+comparing their code objects.
+"""
+
+import difflib
+import os
+import zipfile
+
+from setuptools_wotmod.marshal27 import Code27, MarshalError, load_pyc
+
+TEXT_EXTENSIONS = ('.xml', '.json', '.txt', '.py', '.cfg', '.ini', '.md', '.csv', '.yml', '.yaml', '.html')
+
+# Larger text members are reported as changed without a line diff
+MAX_TEXT_DIFF_SIZE = 4 * 1024 * 1024
+
+def read_central_directory(zip):
+    """
+    :return: dict of member paths to ZipInfo objects, directories excluded
+    """
+    return dict((info.filename, info) for info in zip.infolist() if not info.filename.endswith('/'))
+
+def is_text_member(path):
+    return path.lower().endswith(TEXT_EXTENSIONS) or os.path.basename(path) == 'meta.xml'
+
+def decode_text(data):
+    """
+    :return: list of lines, or None if data is not text
+    """
+    if b'\0' in data:
+        return None
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return text.splitlines()
+
+def diff_text(path, old_data, new_data, context=3):
+    """
+    :return: unified diff as list of lines, or None if either is not text
+    """
+    old_lines = decode_text(old_data)
+    new_lines = decode_text(new_data)
+    if old_lines is None or new_lines is None:
+        return None
+    return list(difflib.unified_diff(old_lines, new_lines, 'a/' + path, 'b/' + path, n=context, lineterm=''))
+
+def iter_code_objects(code, name='<module>', prefix=''):
+    """
+    Yields (qualified name, Code27) tuples of code object and code objects
+    nested in its constants, e.g. 'Foo.bar' for method bar of class Foo.
+    Code objects with the same qualified name, e.g. lambdas, are numbered in
+    order of appearance.
+    """
+    yield name, code
+    counts = {}
+    for const in code.consts:
+        if isinstance(const, Code27):
+            child = prefix + const.name.decode('utf-8', 'replace')
+            counts[child] = counts.get(child, 0) + 1
+            if counts[child] > 1:
+                child += '#%d' % counts[child]
+            for item in iter_code_objects(const, child, child + '.'):
+                yield item
+
+def get_code_differences(old, new):
+    """
+    Lists attributes in which two code objects differ, ignoring nested code
+    objects which are compared separately.
+    """
+    def consts(code):
+        return [('<code %s>' % const.name) if isinstance(const, Code27) else (type(const).__name__, const)
+                for const in code.consts]
+    differences = []
+    if old.code != new.code:
+        differences.append('bytecode')
+    if consts(old) != consts(new):
+        differences.append('constants')
+    if (old.names, old.varnames, old.freevars, old.cellvars) != (new.names, new.varnames, new.freevars,
+                                                                 new.cellvars):
+        differences.append('names')
+    if (old.argcount, old.nlocals, old.stacksize, old.flags) != (new.argcount, new.nlocals, new.stacksize,
+                                                                 new.flags):
+        differences.append('signature')
+    if not differences and (old.firstlineno, old.lnotab) != (new.firstlineno, new.lnotab):
+        differences.append('line numbers')
+    if not differences and old.filename != new.filename:
+        differences.append('file name')
+    return differences
+
+def diff_pyc(old_data, new_data):
+    """
+    Compares code objects of two pyc files.
+    :return: list of difference description lines, or None if either file
+             cannot be decoded
+    """
+    try:
+        old_header, old_code = load_pyc(old_data)
+        new_header, new_code = load_pyc(new_data)
+    except MarshalError:
+        return None
+    old_objects = dict(iter_code_objects(old_code))
+    new_objects = dict(iter_code_objects(new_code))
+    lines = []
+    for name in sorted(set(old_objects) | set(new_objects)):
+        if name not in new_objects:
+            lines.append('code removed: %s' % name)
+        elif name not in old_objects:
+            lines.append('code added: %s' % name)
+        else:
+            differences = get_code_differences(old_objects[name], new_objects[name])
+            if differences:
+                lines.append('code changed: %s (%s)' % (name, ', '.join(differences)))
+    if not lines:
+        if old_header[:4] != new_header[:4]:
+            lines.append('code identical, magic number differs')
+        else:
+            lines.append('code identical, only modification time in header differs')
+    return lines
+
+def diff_packages(old_path, new_path, content=True, context=3):
+    """
+    Compares two wotmod packages.
+
+    :param content: decompress changed text and pyc members to show their
+                    differences
+    :param context: lines of context in text diffs
+    :return: report dict with 'added', 'removed' and 'changed' members,
+             number of 'unchanged' members and 'size' deltas
+    """
+    with zipfile.ZipFile(old_path, 'r') as old_zip:
+        with zipfile.ZipFile(new_path, 'r') as new_zip:
+            old_infos = read_central_directory(old_zip)
+            new_infos = read_central_directory(new_zip)
+            added = []
+            removed = []
+            changed = []
+            unchanged = 0
+            for path in sorted(set(old_infos) | set(new_infos)):
+                old_info = old_infos.get(path)
+                new_info = new_infos.get(path)
+                if old_info is None:
+                    added.append({'path': path, 'size': new_info.file_size})
+                elif new_info is None:
+                    removed.append({'path': path, 'size': old_info.file_size})
+                elif (old_info.CRC, old_info.file_size) == (new_info.CRC, new_info.file_size):
+                    unchanged += 1
+                else:
+                    change = {
+                        'path': path,
+                        'old_size': old_info.file_size,
+                        'new_size': new_info.file_size,
+                        'diff': None,
+                    }
+                    if content:
+                        change['diff'] = diff_member(old_zip, old_info, new_zip, new_info, context)
+                    changed.append(change)
+    old_size = sum(info.file_size for info in old_infos.values())
+    new_size = sum(info.file_size for info in new_infos.values())
+    old_package_size = os.path.getsize(old_path)
+    new_package_size = os.path.getsize(new_path)
+    return {
+        'old': old_path,
+        'new': new_path,
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'unchanged': unchanged,
+        'size': {
+            'old': old_size,
+            'new': new_size,
+            'delta': new_size - old_size,
+            'old_package': old_package_size,
+            'new_package': new_package_size,
+            'package_delta': new_package_size - old_package_size,
+        },
+    }
+
+def diff_member(old_zip, old_info, new_zip, new_info, context=3):
+    """
+    :return: list of lines describing the change, or None if the member
+             cannot be compared by content
+    """
+    path = new_info.filename
+    if path.endswith('.pyc'):
+        return diff_pyc(old_zip.read(old_info), new_zip.read(new_info))
+    if is_text_member(path) and max(old_info.file_size, new_info.file_size) <= MAX_TEXT_DIFF_SIZE:
+        return diff_text(path, old_zip.read(old_info), new_zip.read(new_info), context)
+    return None
@@ -0,0 +1,123 @@
+"""
+Measures phases of bdist_wotmod command and lets third-party code hook into
+their start and end.
+
+A hook is a callable taking arguments (event, phase, command, stats), where
+event is either 'start' or 'end', phase is name of the phase, command is the
+running bdist_wotmod command and stats is dict of measurements of the phase
+(complete only at the end):
+
+    from setuptools_wotmod.instrumentation import add_phase_hook
+
+    def print_phase(event, phase, command, stats):
+        if event == 'end':
+            print('%s took %.2f s' % (phase, stats['wall_time']))
+
+    add_phase_hook(print_phase)
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_phase_hooks = []
+
+def add_phase_hook(hook):
+    """
+    Registers hook which is called at start and end of each phase.
+    """
+    if hook not in _phase_hooks:
+        _phase_hooks.append(hook)
+
+def remove_phase_hook(hook):
+    if hook in _phase_hooks:
+        _phase_hooks.remove(hook)
+
+def call_phase_hooks(event, phase, command, stats):
+    for hook in list(_phase_hooks):
+        hook(event, phase, command, stats)
+
+def get_cpu_times():
+    """
+    Returns tuple of (CPU time of this process, CPU time of waited child
+    processes), e.g. Python 2.7 compilers. Child times are zero on Windows.
+    """
+    times = os.times()
+    return times[0] + times[1], times[2] + times[3]
+
+class PhaseRecorder(object):
+    """
+    Records wall time, CPU time, file counts, bytes written and, optionally,
+    peak memory use of phases.
+    """
+
+    def __init__(self, command, track_memory=False):
+        self.command = command
+        self.track_memory = track_memory and tracemalloc is not None
+        self.phases = []
+        self.started_tracing = False
+
+    def start(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measures code executed within the with-block as phase of given name.
+        The block may add 'files' and 'bytes' written to yielded stats dict.
+        """
+        stats = {
+            'name': name,
+            'files': 0,
+            'bytes': 0,
+        }
+        call_phase_hooks('start', name, self.command, stats)
+        if self.track_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start_wall = timeit.default_timer()
+        start_cpu, start_child_cpu = get_cpu_times()
+        try:
+            yield stats
+        finally:
+            end_cpu, end_child_cpu = get_cpu_times()
+            stats['wall_time'] = timeit.default_timer() - start_wall
+            stats['cpu_time'] = end_cpu - start_cpu
+            stats['child_cpu_time'] = end_child_cpu - start_child_cpu
+            if self.track_memory and tracemalloc.is_tracing():
+                stats['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            self.phases.append(stats)
+            call_phase_hooks('end', name, self.command, stats)
+
+    def get_report(self):
+        keys = ('wall_time', 'cpu_time', 'child_cpu_time', 'files', 'bytes')
+        report = {
+            'phases': self.phases,
+            'total': dict((key, sum(phase.get(key, 0) for phase in self.phases)) for key in keys),
+        }
+        if self.track_memory:
+            report['total']['peak_memory'] = max([phase.get('peak_memory', 0) for phase in self.phases] + [0])
+        return report
+
+    def write(self, path):
+        with open(path, 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent=2, sort_keys=True)
+
+def get_files_stats(paths):
+    """
+    Returns tuple of (file count, total size) of existing files in paths.
+    """
+    files = [path for path in paths if os.path.isfile(path)]
+    return len(files), sum(os.path.getsize(path) for path in files)
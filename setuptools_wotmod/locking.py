@@ -0,0 +1,85 @@
+"""
+Advisory file locks for caches shared by concurrent builds on one machine,
+e.g. several CI jobs building in the same checkout. The locks are taken on
+separate lock files which are never removed, as removing them would let two
+processes hold locks on different files of the same name.
+"""
+
+from distutils import log
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+class LockTimeout(EnvironmentError):
+    pass
+
+class FileLock(object):
+    """
+    Exclusive advisory lock on a file, usable as a context manager. Excludes
+    other processes as well as other threads of the same process.
+
+    :param path: path of the lock file, created if missing
+    :param timeout: seconds to wait for the lock, None to wait forever
+    """
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.lock_file = None
+
+    def try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def acquire(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        self.lock_file = open(self.path, 'a+b')
+        start_time = time.time()
+        waiting = False
+        while not self.try_lock():
+            if self.timeout is not None and time.time() - start_time >= self.timeout:
+                self.lock_file.close()
+                self.lock_file = None
+                raise LockTimeout('timed out waiting for lock %s' % self.path)
+            if not waiting:
+                log.info("waiting for lock %s held by another build", self.path)
+                waiting = True
+            time.sleep(0.05)
+
+    def release(self):
+        if self.lock_file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,139 @@
+"""
+Decodes Python 2.7 marshal data, i.e. contents of .pyc files compiled for the
+game, on any Python version. The marshal module of Python 3 cannot read code
+objects of Python 2.7.
+
+Strings are decoded to bytes and unicode strings to text, code objects to
+Code27 tuples.
+"""
+
+from collections import namedtuple
+import struct
+
+# Header of a Python 2.7 pyc file: magic number and source modification time
+PYC_HEADER_SIZE = 8
+
+Code27 = namedtuple('Code27', ['argcount', 'nlocals', 'stacksize', 'flags', 'code', 'consts', 'names',
+                               'varnames', 'freevars', 'cellvars', 'filename', 'name', 'firstlineno',
+                               'lnotab'])
+
+class MarshalError(ValueError):
+    pass
+
+# Terminates members of a dict
+_NULL = object()
+
+class Reader(object):
+    """
+    Reads objects from marshal data.
+    """
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+        self.interned = []
+
+    def read(self, size):
+        if self.offset + size > len(self.data):
+            raise MarshalError('marshal data truncated at offset %d' % self.offset)
+        value = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return value
+
+    def read_int(self):
+        return struct.unpack('<i', self.read(4))[0]
+
+    def read_long(self):
+        size = self.read_int()
+        value = 0
+        for index in range(abs(size)):
+            value |= struct.unpack('<h', self.read(2))[0] << (15 * index)
+        return -value if size < 0 else value
+
+    def read_float_string(self):
+        return float(self.read(ord(self.read(1))).decode('ascii'))
+
+    def read_sequence(self):
+        return [self.read_object() for _ in range(self.read_int())]
+
+    def read_object(self):
+        code = self.read(1)
+        if code == b'0':
+            return _NULL
+        if code == b'N':
+            return None
+        if code == b'F':
+            return False
+        if code == b'T':
+            return True
+        if code == b'S':
+            return StopIteration
+        if code == b'.':
+            return Ellipsis
+        if code == b'i':
+            return self.read_int()
+        if code == b'I':
+            return struct.unpack('<q', self.read(8))[0]
+        if code == b'l':
+            return self.read_long()
+        if code == b'f':
+            return self.read_float_string()
+        if code == b'g':
+            return struct.unpack('<d', self.read(8))[0]
+        if code == b'x':
+            real = self.read_float_string()
+            return complex(real, self.read_float_string())
+        if code == b'y':
+            return complex(*struct.unpack('<dd', self.read(16)))
+        if code in (b's', b't'):
+            value = self.read(self.read_int())
+            if code == b't':
+                self.interned.append(value)
+            return value
+        if code == b'R':
+            index = self.read_int()
+            if not 0 <= index < len(self.interned):
+                raise MarshalError('invalid string reference %d' % index)
+            return self.interned[index]
+        if code == b'u':
+            return self.read(self.read_int()).decode('utf-8')
+        if code == b'(':
+            return tuple(self.read_sequence())
+        if code == b'[':
+            return self.read_sequence()
+        if code == b'{':
+            value = {}
+            while True:
+                key = self.read_object()
+                if key is _NULL:
+                    return value
+                value[key] = self.read_object()
+        if code == b'<':
+            return set(self.read_sequence())
+        if code == b'>':
+            return frozenset(self.read_sequence())
+        if code == b'c':
+            header = [self.read_int() for _ in range(4)]
+            members = [self.read_object() for _ in range(8)]
+            firstlineno = self.read_int()
+            return Code27(*(header + members + [firstlineno, self.read_object()]))
+        raise MarshalError('unknown marshal type %r at offset %d' % (code, self.offset - 1))
+
+def loads(data):
+    """
+    Decodes an object from Python 2.7 marshal data.
+    """
+    value = Reader(data).read_object()
+    if value is _NULL:
+        raise MarshalError('marshal data contains no object')
+    return value
+
+def load_pyc(data):
+    """
+    Decodes code object of a Python 2.7 pyc file.
+    :return: tuple of (header bytes, Code27 object)
+    """
+    code = Reader(data, PYC_HEADER_SIZE).read_object()
+    if not isinstance(code, Code27):
+        raise MarshalError('pyc file does not contain a code object')
+    return data[:PYC_HEADER_SIZE], code
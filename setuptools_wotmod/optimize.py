@@ -0,0 +1,154 @@
+"""
+Optimizes size of package contents: packages optimized modules as the
+compiled modules which the game loads, leaves out sources of compiled modules and minifies XML
+and JSON files. Reports sizes before and after by directory and file type.
+"""
+
+from collections import OrderedDict
+from distutils import log
+import io
+import json
+import os
+import posixpath
+import xml.etree.ElementTree as ET
+
+MINIFIED_EXTENSIONS = ('.xml', '.json')
+
+def minify_xml(data):
+    """
+    Removes comments and whitespace between elements from XML document.
+    Text content of elements is kept as is.
+    :return: minified document, or None if it cannot be minified safely
+    """
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        # E.g. binary packed XML files of the game
+        return None
+    for element in root.iter():
+        if not callable(element.tag) and element.tag.startswith('{'):
+            # Namespace prefixes would not survive serialization
+            return None
+        if len(element) and element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+    output = io.BytesIO()
+    ET.ElementTree(root).write(output, encoding='utf-8', xml_declaration=False)
+    return output.getvalue()
+
+def minify_json(data):
+    """
+    Removes whitespace from JSON document, keeping order of object members.
+    :return: minified document, or None if it is not valid JSON
+    """
+    try:
+        value = json.loads(data.decode('utf-8'), object_pairs_hook=OrderedDict)
+    except ValueError:
+        return None
+    text = json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return text
+
+def minify_data(archive_path, data):
+    """
+    :return: minified data, or None if the file is not minified
+    """
+    if archive_path.endswith('.xml'):
+        return minify_xml(data)
+    if archive_path.endswith('.json'):
+        return minify_json(data)
+    return None
+
+def get_entry_size(entry):
+    if entry.path is not None:
+        return os.path.getsize(entry.path)
+    return len(entry.data)
+
+def read_entry(entry):
+    if entry.path is None:
+        return entry.data
+    with open(entry.path, 'rb') as entry_file:
+        return entry_file.read()
+
+def optimize_entries(entries, optimize=0, exclude_sources=False, minify=False):
+    """
+    Applies optimizations to package entries.
+
+    :param entries: list of PackageEntry objects
+    :param optimize: when non-zero, optimized modules (.pyo files) are
+                     packaged as .pyc files, replacing compiled modules left
+                     next to them by earlier builds
+    :param exclude_sources: leave out sources of compiled modules
+    :param minify: minify XML and JSON files, except meta.xml
+    :return: tuple of (list of PackageEntry objects, size report)
+    """
+    files = dict((entry.archive_path, entry) for entry in entries if not entry.archive_path.endswith('/'))
+    compiled_exts = ('.pyc', '.pyo') if optimize else ('.pyc',)
+    compiled = set(posixpath.splitext(path)[0] for path in files if posixpath.splitext(path)[1] in compiled_exts)
+    sizes = []
+    result = []
+    for entry in entries:
+        archive_path = entry.archive_path
+        if archive_path.endswith('/'):
+            result.append(entry)
+            continue
+        root, ext = posixpath.splitext(archive_path)
+        if ext == '.pyo' and not optimize:
+            # Optimized module is not part of the package without this stage
+            # either
+            continue
+        if ext == '.pyc' and optimize and root + '.pyo' in files:
+            continue
+        before = get_entry_size(entry)
+        if ext == '.pyo':
+            # The game loads only .pyc files
+            archive_path = root + '.pyc'
+            entry = entry._replace(archive_path=archive_path)
+        elif ext == '.py' and exclude_sources and root in compiled:
+            sizes.append((archive_path, before, 0))
+            continue
+        elif minify and ext in MINIFIED_EXTENSIONS and archive_path != 'meta.xml':
+            data = minify_data(archive_path, read_entry(entry))
+            if data is not None and len(data) < before:
+                entry = entry._replace(path=None, data=data)
+        sizes.append((archive_path, before, get_entry_size(entry)))
+        result.append(entry)
+    return result, get_size_report(sizes)
+
+def get_size_report(sizes):
+    """
+    Sums sizes by directory and by file type.
+    :param sizes: list of (archive path, size before, size after) tuples
+    :return: dict of 'total', 'directories' and 'types', each with sizes as
+             {'before': ..., 'after': ..., 'saved': ...} dicts
+    """
+    def add(group, key, before, after):
+        sums = group.setdefault(key, {'before': 0, 'after': 0, 'saved': 0})
+        sums['before'] += before
+        sums['after'] += after
+        sums['saved'] += before - after
+    report = {'total': {'before': 0, 'after': 0, 'saved': 0}, 'directories': {}, 'types': {}}
+    for archive_path, before, after in sizes:
+        report['total']['before'] += before
+        report['total']['after'] += after
+        report['total']['saved'] += before - after
+        add(report['directories'], posixpath.dirname(archive_path) or '.', before, after)
+        add(report['types'], posixpath.splitext(archive_path)[1] or '(none)', before, after)
+    return report
+
+def log_size_report(report, limit=10):
+    """
+    Logs totals by file type, and the directories with most bytes saved.
+    """
+    def log_rows(title, rows):
+        log.info("%-50s %12s %12s %12s", title, 'before', 'after', 'saved')
+        for name, sums in rows:
+            log.info("%-50s %12d %12d %12d", name, sums['before'], sums['after'], sums['saved'])
+    log_rows('file type', sorted(report['types'].items(), key=lambda item: -item[1]['saved']))
+    directories = sorted(report['directories'].items(), key=lambda item: -item[1]['saved'])
+    log_rows('directory', [item for item in directories[:limit] if item[1]['saved']])
+    total = report['total']
+    log.info("package contents %d -> %d bytes, saved %d bytes (%.1f %%)", total['before'], total['after'],
+             total['saved'], 100.0 * total['saved'] / total['before'] if total['before'] else 0)
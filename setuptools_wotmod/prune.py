@@ -0,0 +1,348 @@
+"""
+Finds modules reachable by imports from the entry modules of a mod, so that
+modules which are never imported can be left out of the package.
+
+The game imports mod_*.py modules from res/scripts/client/gui/mods as
+gui.mods.mod_*, those are the entry modules. Modules are named as the game
+imports them, relative to the script directories in the game's sys.path, so
+that both 'import helper' and 'import gui.mods.helper' in gui.mods.mod_foo
+resolve to gui.mods.helper. Imports are found statically from module sources with
+the tokenizer, which also accepts Python 2 only syntax, and resolved with
+Python 2 rules, including implicit relative imports. Imports of string
+literals with __import__() and importlib.import_module() are found as well,
+other dynamic imports are not, modules imported that way must be kept
+explicitly.
+"""
+
+from collections import namedtuple
+from distutils import log
+import fnmatch
+import io
+import posixpath
+import re
+import tokenize
+
+# Directory whose mod_*.py modules the game loads, and its package
+GAME_MODS_DIR = 'res/scripts/client/gui/mods'
+GAME_MODS_PACKAGE = 'gui.mods'
+
+ENTRY_MODULE_PATTERN = 'mod_*'
+
+# Directories of a package which are in the game's sys.path
+SCRIPT_PATH_DIRS = ('res/scripts/client', 'res/scripts/common')
+
+# Import statement: module name, number of leading dots and imported names
+# (None for 'import module' statements)
+ImportRef = namedtuple('ImportRef', ['module', 'level', 'names'])
+
+# Module in a ModuleGraph. Source is a function returning the module's source
+# code, or None if the module is available only in compiled form.
+Module = namedtuple('Module', ['name', 'is_package', 'source'])
+
+DYNAMIC_IMPORT_FUNCTIONS = ('__import__', 'import_module')
+
+IMPORT_LINE = re.compile(r'^\s*(?:from\s+(\.*)([\w.]*)\s+import\s+([\w\s,.*()]+)|import\s+([\w\s,.]+))')
+
+def read_source(path):
+    with open(path, 'rb') as source_file:
+        return source_file.read()
+
+def decode_source(source):
+    if isinstance(source, bytes):
+        return source.decode('utf-8', 'replace')
+    return source
+
+def parse_string_literal(token):
+    value = token.lstrip('bBuUrR')
+    for quote in ('"""', "'''", '"', "'"):
+        if value.startswith(quote) and value.endswith(quote) and len(value) >= 2 * len(quote):
+            return value[len(quote):-len(quote)]
+    return None
+
+def iter_statements(source):
+    """
+    Splits source to simple statements.
+    :return: iterator of lists of (token type, token string) tuples
+    """
+    statement = []
+    depth = 0
+    readline = io.StringIO(decode_source(source)).readline
+    for token in tokenize.generate_tokens(readline):
+        token_type, string = token[0], token[1]
+        if token_type in (tokenize.COMMENT, tokenize.NL):
+            continue
+        if token_type == tokenize.OP and string in ('(', '[', '{'):
+            depth += 1
+        elif token_type == tokenize.OP and string in (')', ']', '}'):
+            depth = max(0, depth - 1)
+        # Compound statement headers end at ':', e.g. 'if x: import y'
+        if (token_type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER)
+                or (token_type == tokenize.OP and string in (';', ':') and depth == 0)):
+            if statement:
+                yield statement
+            statement = []
+            continue
+        statement.append((token_type, string))
+    if statement:
+        yield statement
+
+def parse_dotted_name(tokens, index):
+    """
+    :return: tuple of (dotted name, index after it)
+    """
+    parts = []
+    while index < len(tokens) and tokens[index][0] == tokenize.NAME and tokens[index][1] != 'import':
+        parts.append(tokens[index][1])
+        index += 1
+        if index < len(tokens) and tokens[index][1] == '.':
+            index += 1
+        else:
+            break
+    return '.'.join(parts), index
+
+def parse_import_statement(tokens):
+    """
+    :return: list of ImportRef objects
+    """
+    refs = []
+    if tokens[0][1] == 'import':
+        index = 1
+        while index < len(tokens):
+            name, index = parse_dotted_name(tokens, index)
+            if name:
+                refs.append(ImportRef(name, 0, None))
+            # Skip 'as alias' up to next ','
+            while index < len(tokens) and tokens[index][1] != ',':
+                index += 1
+            index += 1
+        return refs
+    # from [dots]module import names
+    index = 1
+    level = 0
+    while index < len(tokens) and tokens[index][1] in ('.', '...'):
+        level += len(tokens[index][1])
+        index += 1
+    module, index = parse_dotted_name(tokens, index)
+    if index >= len(tokens) or tokens[index][1] != 'import':
+        return refs
+    names = []
+    expect_name = True
+    for token_type, string in tokens[index + 1:]:
+        if string == ',':
+            expect_name = True
+        elif expect_name and (token_type == tokenize.NAME or string == '*'):
+            names.append(string)
+            expect_name = False
+    refs.append(ImportRef(module, level, names))
+    return refs
+
+def parse_dynamic_imports(tokens):
+    refs = []
+    for index in range(len(tokens) - 2):
+        if (tokens[index][1] in DYNAMIC_IMPORT_FUNCTIONS and tokens[index + 1][1] == '('
+                and tokens[index + 2][0] == tokenize.STRING):
+            name = parse_string_literal(tokens[index + 2][1])
+            if name:
+                refs.append(ImportRef(name, 0, None))
+    return refs
+
+def scan_imports_from_lines(source):
+    """
+    Finds import statements line by line, for sources which the tokenizer
+    does not accept.
+    """
+    refs = []
+    for line in decode_source(source).splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        dots, module, names, imports = match.groups()
+        if imports is not None:
+            for part in imports.split(','):
+                words = part.split()
+                if words:
+                    refs.append(ImportRef(words[0], 0, None))
+        else:
+            names = [name.split()[0] for name in names.strip('() ').split(',') if name.split()]
+            refs.append(ImportRef(module, len(dots), names))
+    return refs
+
+def scan_imports(source):
+    """
+    Finds imports from module source.
+    :return: tuple of (list of ImportRef objects, True if the module uses
+             absolute imports)
+    """
+    refs = []
+    try:
+        for tokens in iter_statements(source):
+            if tokens[0][1] in ('import', 'from'):
+                refs.extend(parse_import_statement(tokens))
+            refs.extend(parse_dynamic_imports(tokens))
+    except (tokenize.TokenError, SyntaxError) as err:
+        log.debug("cannot tokenize module (%s), scanning its lines instead", err)
+        refs = scan_imports_from_lines(source)
+    absolute_import = any(ref.module == '__future__' and 'absolute_import' in (ref.names or [])
+                          for ref in refs)
+    return refs, absolute_import
+
+class ModuleGraph(object):
+    """
+    Import graph of a set of modules.
+
+    :param modules: list of Module objects
+    :param prefixes: packages which modules were installed to, e.g.
+                     'gui.mods', names relative to these are matched
+                     against keep patterns and are the top level packages
+                     of modules
+    """
+
+    def __init__(self, modules, prefixes=()):
+        self.modules = dict((module.name, module) for module in modules)
+        self.prefixes = sorted(set(prefix for prefix in prefixes if prefix), key=len, reverse=True)
+
+    def strip_prefix(self, name):
+        """
+        :return: tuple of (prefix, name relative to it)
+        """
+        for prefix in self.prefixes:
+            if name.startswith(prefix + '.'):
+                return prefix, name[len(prefix) + 1:]
+        return '', name
+
+    def get_top_package(self, name):
+        prefix, name = self.strip_prefix(name)
+        return join_name(prefix, name.split('.')[0])
+
+    def get_parents(self, name):
+        parts = name.split('.')
+        return ['.'.join(parts[:index]) for index in range(1, len(parts))]
+
+    def get_submodules(self, package):
+        prefix = package + '.'
+        return [name for name in self.modules if name.startswith(prefix) and '.' not in name[len(prefix):]]
+
+    def resolve(self, module, ref, absolute_import):
+        """
+        Resolves an import of module to modules in this graph.
+        :return: list of module names
+        """
+        package = module.name if module.is_package else module.name.rpartition('.')[0]
+        if ref.level:
+            parts = package.split('.') if package else []
+            if ref.level - 1 >= len(parts):
+                return []
+            base = parts[:len(parts) - (ref.level - 1)]
+            target = '.'.join(base + ([ref.module] if ref.module else []))
+        else:
+            target = ref.module
+            # Python 2 tries the module relative to the importing package first
+            if package and not absolute_import:
+                relative = '%s.%s' % (package, ref.module)
+                if '%s.%s' % (package, ref.module.split('.')[0]) in self.modules:
+                    target = relative
+        if not target:
+            return []
+        found = [name for name in self.get_parents(target) + [target] if name in self.modules]
+        for name in ref.names or []:
+            if name == '*':
+                found.extend(self.get_submodules(target))
+            elif '%s.%s' % (target, name) in self.modules:
+                found.append('%s.%s' % (target, name))
+        return found
+
+    def get_imports(self, name):
+        """
+        :return: list of names of modules imported by given module, or None
+                 if the module has no source
+        """
+        module = self.modules[name]
+        source = module.source()
+        if source is None:
+            return None
+        refs, absolute_import = scan_imports(source)
+        imports = []
+        for ref in refs:
+            imports.extend(self.resolve(module, ref, absolute_import))
+        return imports
+
+    def find_reachable(self, roots):
+        """
+        Returns names of modules reachable from given root modules. When a
+        reachable module has no source its imports are unknown, and all
+        modules of its top level package are kept.
+        """
+        reachable = set()
+        pending = [name for name in roots if name in self.modules]
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            imports = self.get_imports(name)
+            if imports is None:
+                top = self.get_top_package(name)
+                imports = [other for other in self.modules if other == top or other.startswith(top + '.')]
+            pending.extend(parent for parent in self.get_parents(name) if parent in self.modules)
+            pending.extend(imports)
+        return reachable
+
+    def get_roots(self, entry_modules, keep_patterns):
+        """
+        Returns names of entry modules and modules matching keep patterns.
+        """
+        roots = [name for name in self.modules if name in entry_modules]
+        for pattern in keep_patterns:
+            for name in self.modules:
+                # Patterns may name modules with or without their prefix
+                for candidate in (name, self.strip_prefix(name)[1]):
+                    if fnmatch.fnmatchcase(candidate, pattern) or candidate.startswith(pattern + '.'):
+                        roots.append(name)
+                        break
+        return roots
+
+def join_name(package, name):
+    return '%s.%s' % (package, name) if package else name
+
+def is_entry_module(name):
+    """
+    Returns True if the game imports module of given name by itself.
+    """
+    package, _, module = name.rpartition('.')
+    return package == GAME_MODS_PACKAGE and fnmatch.fnmatchcase(module, ENTRY_MODULE_PATTERN)
+
+def get_package_prefix(lib_dir):
+    """
+    Returns name of the package which modules installed to lib_dir are
+    imported from, e.g. 'gui.mods' for res/scripts/client/gui/mods.
+    """
+    lib_dir = lib_dir.strip('/')
+    for script_dir in SCRIPT_PATH_DIRS:
+        if lib_dir.startswith(script_dir + '/'):
+            return lib_dir[len(script_dir) + 1:].replace('/', '.')
+    return ''
+
+def get_module_name(archive_path, lib_dirs):
+    """
+    Returns name of module from its path in package.
+    :param lib_dirs: directories of the package which modules are installed
+                     to
+    :return: tuple of (module name, True if module is a package), or
+             (None, False) if the path is not a module
+    """
+    root, ext = posixpath.splitext(archive_path)
+    if ext not in ('.py', '.pyc', '.pyo'):
+        return None, False
+    for lib_dir in lib_dirs:
+        if root.startswith(lib_dir + '/'):
+            parts = root[len(lib_dir) + 1:].split('/')
+            prefix = get_package_prefix(lib_dir)
+            if parts[-1] == '__init__':
+                if len(parts) == 1:
+                    return None, False
+                return join_name(prefix, '.'.join(parts[:-1])), True
+            return join_name(prefix, '.'.join(parts)), False
+    return None, False
+
+def parse_keep_patterns(value):
+    return [pattern.strip() for pattern in (value or '').split(',') if pattern.strip()]
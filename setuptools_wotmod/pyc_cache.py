@@ -0,0 +1,217 @@
+"""
+User level cache of compiled Python 2.7 modules, shared by all projects built
+by the same user. Entries are keyed by hash of the source, version of the
+compiling interpreter, optimize flag and the file name embedded in the
+compiled code, so identical modules vendored by several mods are compiled
+only once.
+
+Entries are written atomically, so concurrent builds can share the cache.
+Eviction and statistics updates are serialized with a lock file.
+The cache is kept under a size cap by evicting least recently used entries.
+With a remote cache, modules missing from this cache are fetched from it and
+compiled modules are uploaded to it.
+"""
+
+from distutils import log
+import hashlib
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+
+from setuptools_wotmod.archive import replace_file
+from setuptools_wotmod.locking import FileLock
+
+# Bump when format of cache entries changes
+CACHE_VERSION = 1
+
+# Offset of source modification time in Python 2 pyc header
+PYC_MTIME_OFFSET = 4
+
+_interpreter_versions = {}
+
+def get_interpreter_version(python):
+    """
+    Returns full version string of given Python interpreter.
+    """
+    if python == sys.executable:
+        return sys.version
+    if python not in _interpreter_versions:
+        output = subprocess.check_output([python, '-c', 'import sys; sys.stdout.write(sys.version)'])
+        _interpreter_versions[python] = output.decode('utf-8', 'replace')
+    return _interpreter_versions[python]
+
+def set_pyc_mtime(data, mtime):
+    """
+    Returns Python 2 pyc data with source modification time in its header
+    replaced with given time.
+    """
+    return (data[:PYC_MTIME_OFFSET] + struct.pack('<I', int(mtime) & 0xffffffff)
+            + data[PYC_MTIME_OFFSET + 4:])
+
+def write_atomically(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        replace_file(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class PycCache(object):
+    """
+    Cache of compiled modules in directory/pyc.
+
+    :param directory: cache directory
+    :param max_size: maximum total size of the entries in bytes
+    :param remote: optional RemoteCache object
+    """
+
+    def __init__(self, directory, max_size, remote=None):
+        self.directory = os.path.join(directory, 'pyc')
+        self.max_size = max_size
+        self.remote = remote
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, source_hash, interpreter_version, optimize, dfile):
+        return hashlib.sha1(json.dumps([
+            CACHE_VERSION, source_hash, interpreter_version, optimize, dfile.replace(os.sep, '/'),
+        ]).encode('utf-8')).hexdigest()
+
+    def lock(self):
+        return FileLock(os.path.join(self.directory, 'cache.lock'))
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pyc')
+
+    def fetch(self, key, cfile, source_mtime):
+        """
+        Writes cached module to cfile, with given source modification time.
+        :return: True on hit, False on miss
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as cached_file:
+                data = cached_file.read()
+        except (IOError, OSError):
+            data = self.remote.get('pyc', key) if self.remote else None
+            if data is None:
+                self.misses += 1
+                return False
+            write_atomically(path, data)
+        write_atomically(cfile, set_pyc_mtime(data, source_mtime))
+        try:
+            # Modification time of an entry tells when it was last used
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return True
+
+    def store(self, key, cfile):
+        """
+        Stores compiled module to the cache.
+        """
+        with open(cfile, 'rb') as compiled_file:
+            data = set_pyc_mtime(compiled_file.read(), 0)
+        write_atomically(self.get_path(key), data)
+        if self.remote:
+            self.remote.put('pyc', key, data)
+
+    def get_entries(self):
+        """
+        :return: list of (last use time, size, path) tuples
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith('.pyc'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache is below 90 % of
+        its maximum size.
+        :return: number of removed entries
+        """
+        with self.lock():
+            entries = self.get_entries()
+            total_size = sum(size for _, size, _ in entries)
+            if total_size <= self.max_size:
+                return 0
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Removed by 'wotmod cache --clear'
+                    pass
+                total_size -= size
+                removed += 1
+        log.info("evicted %d entries from pyc cache", removed)
+        return removed
+
+    def get_stats_path(self):
+        return os.path.join(self.directory, 'stats.json')
+
+    def load_stats(self):
+        try:
+            with open(self.get_stats_path(), 'r') as stats_file:
+                return json.load(stats_file)
+        except (IOError, OSError, ValueError):
+            return {'hits': 0, 'misses': 0}
+
+    def save_stats(self):
+        """
+        Adds hits and misses of this build to cumulative statistics.
+        """
+        with self.lock():
+            stats = self.load_stats()
+            stats['hits'] = stats.get('hits', 0) + self.hits
+            stats['misses'] = stats.get('misses', 0) + self.misses
+            write_atomically(self.get_stats_path(), json.dumps(stats).encode('utf-8'))
+
+    def get_stats(self):
+        """
+        :return: dict with cumulative hits and misses, and number and total
+                 size of entries
+        """
+        entries = self.get_entries()
+        stats = self.load_stats()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(size for _, size, _ in entries)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def clear(self):
+        with self.lock():
+            for _, _, path in self.get_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if os.path.exists(self.get_stats_path()):
+                os.remove(self.get_stats_path())
@@ -0,0 +1,185 @@
+"""
+Remote cache of build artifacts shared by several machines, e.g. CI agents.
+
+The protocol is plain HTTP: an entry is fetched with 'GET <url>/<namespace>/<key>'
+(404 when it is missing) and stored with 'PUT <url>/<namespace>/<key>'.
+Namespaces are 'pyc' for compiled modules and 'package' for finished
+packages, keys are hex digests. Any HTTP server accepting PUT requests can
+act as the cache, a reference server is included:
+
+    wotmod cache-server --port 8080 /var/cache/wotmod
+
+Failures never fail the build. If the cache cannot be reached it is disabled
+for the rest of the build and everything is built locally.
+"""
+
+from distutils import log
+import os
+import re
+import threading
+
+try:
+    from http.client import HTTPException
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPException
+    from SocketServer import ThreadingMixIn
+    from urllib2 import HTTPError, Request, urlopen
+
+from setuptools_wotmod.pyc_cache import write_atomically
+
+NAMESPACES = ('pyc', 'package')
+
+ENTRY_PATH = re.compile(r'^/(%s)/([0-9a-f]{16,128})$' % '|'.join(NAMESPACES))
+
+# Largest entry the reference server accepts
+MAX_ENTRY_SIZE = 1024 * 1024 * 1024
+
+class RemoteCache(object):
+    """
+    Client of a remote cache.
+
+    :param url: base URL of the cache, e.g. 'http://cache.example.com:8080'
+    :param timeout: seconds to wait for the server
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self.lock = threading.Lock()
+
+    def get_url(self, namespace, key):
+        return '%s/%s/%s' % (self.url, namespace, key)
+
+    def count(self, counter):
+        """
+        Increments counter attribute of given name, requests are made from
+        several threads.
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def disable(self, err):
+        with self.lock:
+            if self.enabled:
+                log.warn("remote cache %s unavailable (%s), building locally", self.url, err)
+            self.enabled = False
+
+    def get(self, namespace, key):
+        """
+        :return: contents of the entry, or None if it is not available
+        """
+        if not self.enabled:
+            return None
+        try:
+            response = urlopen(self.get_url(namespace, key), timeout=self.timeout)
+            try:
+                data = response.read()
+            finally:
+                response.close()
+        except HTTPError as err:
+            if err.code != 404:
+                self.disable(err)
+            self.count('misses')
+            return None
+        except (EnvironmentError, HTTPException) as err:
+            self.disable(err)
+            self.count('misses')
+            return None
+        self.count('hits')
+        return data
+
+    def put(self, namespace, key, data):
+        """
+        Stores an entry to the cache.
+        :return: True if the entry was stored
+        """
+        if not self.enabled:
+            return False
+        request = Request(self.get_url(namespace, key), data=data)
+        request.add_header('Content-Type', 'application/octet-stream')
+        request.get_method = lambda: 'PUT'
+        try:
+            urlopen(request, timeout=self.timeout).close()
+        except HTTPError as err:
+            # Server may refuse e.g. too large entries, keep using it
+            log.warn("remote cache refused %s/%s: %s", namespace, key, err)
+            return False
+        except (EnvironmentError, HTTPException) as err:
+            self.disable(err)
+            return False
+        self.count('uploads')
+        return True
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves entries stored as files in server's directory.
+    """
+
+    def get_entry_path(self):
+        match = ENTRY_PATH.match(self.path)
+        if match is None:
+            return None
+        namespace, key = match.groups()
+        return os.path.join(self.server.directory, namespace, key[:2], key)
+
+    def do_GET(self):
+        path = self.get_entry_path()
+        if path is None:
+            self.send_error(400, 'invalid entry path')
+            return
+        try:
+            with open(path, 'rb') as entry_file:
+                data = entry_file.read()
+        except (IOError, OSError):
+            self.send_error(404, 'not found')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        path = self.get_entry_path()
+        if path is None:
+            self.send_error(400, 'invalid entry path')
+            return
+        length = int(self.headers.get('Content-Length') or -1)
+        if length < 0 or length > MAX_ENTRY_SIZE:
+            self.send_error(413 if length > 0 else 411, 'invalid content length')
+            return
+        data = self.rfile.read(length)
+        if len(data) != length:
+            self.send_error(400, 'incomplete content')
+            return
+        write_atomically(path, data)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        log.info("%s - %s", self.address_string(), format % args)
+
+class CacheServer(ThreadingMixIn, HTTPServer):
+    """
+    Reference cache server, storing entries to a directory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, directory, address=('127.0.0.1', 8080)):
+        HTTPServer.__init__(self, address, CacheRequestHandler)
+        self.directory = directory
+
+    def get_url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
@@ -0,0 +1,173 @@
+"""
+Runtime helper for finding and reading files of a wotmod package through the
+resource manifest which bdist_wotmod writes with --resource-manifest.
+
+Listing directories with ResMgr is slow in the game client when a mod has
+thousands of files, as every call opens sections of the virtual file system.
+The manifest lists each file and directory of the package once, so listing
+and existence queries are answered from memory, and only reading file
+contents goes to ResMgr. Read contents are kept in a LRU cache.
+
+This module has no dependencies other than the game's ResMgr module, copy it
+to your mod's package to use it in the game:
+
+    from mymod import resources
+
+    manifest = resources.open_manifest('mods/johndoe.mymod/resources.manifest')
+    for name in manifest.list_directory('mods/johndoe.mymod/icons'):
+        data = manifest.read_file('mods/johndoe.mymod/icons/' + name)
+
+Paths are virtual file system paths, i.e. paths within the package without
+the leading 'res/'.
+
+Licensed under WTFPL (see www.wtfpl.net).
+"""
+
+from collections import namedtuple, OrderedDict
+
+MANIFEST_NAME = 'resources.manifest'
+
+MANIFEST_HEADER = b'wotmod-manifest 1'
+
+FILE = 'f'
+DIRECTORY = 'd'
+
+# Entry of the manifest. Size and CRC-32 of directories are zero.
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'type', 'size', 'crc'])
+
+def format_manifest(entries):
+    """
+    Serializes manifest entries. Each entry is a line of tab separated
+    type, size, CRC-32 as hex and path, after a header line.
+    :param entries: list of ManifestEntry objects
+    :return: manifest contents as bytes
+    """
+    lines = [MANIFEST_HEADER]
+    for entry in sorted(entries, key=lambda entry: entry.path):
+        line = u'%s\t%d\t%08x\t%s' % (entry.type, entry.size, entry.crc & 0xffffffff, entry.path)
+        lines.append(line.encode('utf-8'))
+    return b'\n'.join(lines) + b'\n'
+
+def parse_manifest(data):
+    """
+    :param data: manifest contents as bytes
+    :return: list of ManifestEntry objects
+    """
+    lines = data.splitlines()
+    if not lines or lines[0].strip() != MANIFEST_HEADER:
+        raise ValueError('not a resource manifest')
+    entries = []
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        entry_type, size, crc, path = line.decode('utf-8').split(u'\t', 3)
+        entries.append(ManifestEntry(path, str(entry_type), int(size), int(crc, 16)))
+    return entries
+
+def read_vfs_file(vfs_path):
+    """
+    Reads a file from the game's virtual file system.
+    :return: file contents, or None if there is no such file
+    """
+    import ResMgr
+    vfs_file = ResMgr.openSection(vfs_path)
+    if vfs_file is not None and ResMgr.isFile(vfs_path):
+        return str(vfs_file.asBinary)
+    return None
+
+def normalize_path(path):
+    return '/'.join(part for part in path.replace('\\', '/').split('/') if part and part != '.')
+
+class ResourceManifest(object):
+    """
+    Answers queries about files of a package from its manifest.
+
+    :param entries: list of ManifestEntry objects
+    :param reader: function returning contents of a file by its path, reads
+                   the game's virtual file system by default
+    :param cache_size: maximum total size in bytes of cached file contents
+    """
+
+    def __init__(self, entries, reader=read_vfs_file, cache_size=16 * 1024 * 1024):
+        self.entries = {}
+        self.children = {}
+        self.reader = reader
+        self.cache_size = cache_size
+        self.cached_size = 0
+        self.cache = OrderedDict()
+        for entry in entries:
+            path = normalize_path(entry.path)
+            self.entries[path] = entry._replace(path=path)
+            parts = path.split('/')
+            # Parents of files are directories even if not listed themselves
+            for index in range(len(parts)):
+                self.children.setdefault('/'.join(parts[:index]), set()).add(parts[index])
+            if entry.type == DIRECTORY:
+                self.children.setdefault(path, set())
+
+    def exists(self, path):
+        path = normalize_path(path)
+        return path in self.entries or path in self.children
+
+    def is_file(self, path):
+        entry = self.entries.get(normalize_path(path))
+        return entry is not None and entry.type == FILE
+
+    def is_dir(self, path):
+        return normalize_path(path) in self.children
+
+    def get_entry(self, path):
+        """
+        :return: ManifestEntry of a file or directory, or None
+        """
+        return self.entries.get(normalize_path(path))
+
+    def list_directory(self, path):
+        """
+        :return: sorted list of names in a directory, empty if there is no
+                 such directory
+        """
+        return sorted(self.children.get(normalize_path(path), ()))
+
+    def walk(self, path):
+        """
+        :return: sorted list of paths of all files below a directory
+        """
+        prefix = normalize_path(path) + '/'
+        return sorted(name for name, entry in self.entries.items()
+                      if entry.type == FILE and name.startswith(prefix))
+
+    def read_file(self, path):
+        """
+        Reads contents of a file, from the cache if it has been read before.
+        :return: file contents, or None if the file is not in the manifest
+        """
+        path = normalize_path(path)
+        if not self.is_file(path):
+            return None
+        if path in self.cache:
+            data = self.cache.pop(path)
+            self.cache[path] = data
+            return data
+        data = self.reader(path)
+        if data is not None and len(data) <= self.cache_size:
+            self.cache[path] = data
+            self.cached_size += len(data)
+            while self.cached_size > self.cache_size:
+                _, old_data = self.cache.popitem(last=False)
+                self.cached_size -= len(old_data)
+        return data
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cached_size = 0
+
+def open_manifest(vfs_path, reader=read_vfs_file, cache_size=16 * 1024 * 1024):
+    """
+    Loads manifest from a file in the virtual file system.
+    :return: ResourceManifest object
+    """
+    data = reader(vfs_path)
+    if data is None:
+        raise IOError('resource manifest %s not found' % vfs_path)
+    return ResourceManifest(parse_manifest(data), reader, cache_size)
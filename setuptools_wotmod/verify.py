@@ -0,0 +1,147 @@
+"""
+Audits built wotmod packages without extracting them. Everything is checked
+from the zip central directory, only meta.xml and the first bytes of each pyc
+file are read from the package.
+"""
+
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+PYTHON27_MAGIC = b'\x03\xf3\x0d\x0a'
+
+# meta.xml elements which WoT requires
+METAXML_FIELDS = ('id', 'version', 'name', 'description')
+
+# Directory flags of an entry's external attributes, MS-DOS and Unix variants
+MSDOS_DIRECTORY = 0x10
+UNIX_DIRECTORY = 0o40000 << 16
+
+def expand_package_paths(paths):
+    """
+    Expands directories in paths to wotmod files within them.
+    :return: list of package paths
+    """
+    packages = []
+    for path in paths:
+        if os.path.isdir(path):
+            packages.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                   if name.lower().endswith('.wotmod')))
+        else:
+            packages.append(path)
+    return packages
+
+def verify_package(path):
+    """
+    Verifies one wotmod package.
+    :return: result dict with package path, ok status, and lists of errors
+             and warnings
+    """
+    errors = []
+    warnings = []
+    try:
+        with zipfile.ZipFile(path, 'r') as zip:
+            infos = zip.infolist()
+            check_entries(infos, errors, warnings)
+            check_pyc_files(zip, infos, errors)
+            check_metaxml(zip, os.path.basename(path), errors)
+    except (IOError, OSError, zipfile.BadZipfile, zipfile.LargeZipFile) as err:
+        errors.append('cannot read package: %s' % err)
+    return {
+        'path': path,
+        'ok': not errors,
+        'errors': errors,
+        'warnings': warnings,
+    }
+
+def check_entries(infos, errors, warnings):
+    """
+    Checks names, directory flags and layout of package entries.
+    """
+    names = set()
+    directories = set()
+    for info in infos:
+        if info.filename in names:
+            errors.append('%s: duplicate entry' % info.filename)
+        names.add(info.filename)
+        if info.filename.startswith('/') or '\\' in info.filename or '..' in info.filename.split('/'):
+            errors.append('%s: invalid entry name' % info.filename)
+        if info.filename.endswith('/'):
+            directories.add(info.filename)
+            if not info.external_attr & (MSDOS_DIRECTORY | UNIX_DIRECTORY):
+                errors.append('%s: directory entry has no directory flag' % info.filename)
+            if info.file_size:
+                errors.append('%s: directory entry has contents' % info.filename)
+        if '/' in info.filename and not info.filename.startswith('res/'):
+            errors.append('%s: outside of res/ directory' % info.filename)
+        if info.filename.endswith(('.py', '.pyc')) and not info.filename.startswith('res/scripts/'):
+            warnings.append('%s: Python module outside of res/scripts/ directory' % info.filename)
+    for name in names:
+        parts = name.rstrip('/').split('/')
+        for index in range(1, len(parts)):
+            parent = '/'.join(parts[:index]) + '/'
+            if parent not in directories:
+                errors.append('%s: parent directory entry %s is missing' % (name, parent))
+                break
+
+def check_pyc_files(zip, infos, errors):
+    """
+    Checks that pyc files have Python 2.7 magic number, reading only the
+    first bytes of each file.
+    """
+    for info in infos:
+        if not info.filename.endswith('.pyc'):
+            continue
+        with zip.open(info) as pyc_file:
+            magic = pyc_file.read(4)
+        if magic != PYTHON27_MAGIC:
+            errors.append('%s: not a Python 2.7 byte-compiled file' % info.filename)
+
+def check_metaxml(zip, filename, errors):
+    """
+    Checks that meta.xml is well-formed, has the required fields and that the
+    id and version match package's file name, i.e. '<id>_<version>.wotmod'.
+    """
+    try:
+        contents = zip.read('meta.xml')
+    except KeyError:
+        errors.append('meta.xml: missing')
+        return
+    try:
+        root = ET.fromstring(contents)
+    except ET.ParseError as err:
+        errors.append('meta.xml: not well-formed: %s' % err)
+        return
+    if root.tag != 'root':
+        errors.append("meta.xml: root element is '%s' instead of 'root'" % root.tag)
+    for field in METAXML_FIELDS:
+        if not (root.findtext(field) or '').strip():
+            errors.append('meta.xml: %s is missing or empty' % field)
+    match = re.match(r'^(.+)_([^_]+)\.wotmod$', filename, re.IGNORECASE)
+    if not match:
+        errors.append("%s: file name is not in format '<id>_<version>.wotmod'" % filename)
+        return
+    mod_id = (root.findtext('id') or '').strip()
+    version = (root.findtext('version') or '').strip()
+    if mod_id and mod_id != match.group(1):
+        errors.append("meta.xml: id '%s' does not match file name %s" % (mod_id, filename))
+    if version and version != match.group(2):
+        errors.append("meta.xml: version '%s' does not match file name %s" % (version, filename))
+
+def verify_packages(paths, jobs=None):
+    """
+    Verifies packages in parallel.
+    :param jobs: number of packages verified at a time [default: one per CPU]
+    :return: list of result dicts, in same order as the paths
+    """
+    paths = expand_package_paths(paths)
+    if not paths:
+        return []
+    pool = ThreadPool(max(1, min(jobs or multiprocessing.cpu_count(), len(paths))))
+    try:
+        return pool.map(verify_package, paths)
+    finally:
+        pool.close()
@@ -0,0 +1,211 @@
+"""
+Watches source directories for changes. Uses inotify on Linux and falls back
+to polling file modification times elsewhere.
+"""
+
+from distutils import log
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Files and directories whose changes never require a rebuild: editor swap
+# and backup files, compiled files and build outputs
+IGNORED_SUFFIXES = ('.pyc', '.pyo', '.swp', '.swx', '.tmp', '~')
+IGNORED_NAMES = ('__pycache__', 'build', 'dist', '.git', '4913')
+
+def is_ignored(path):
+    name = os.path.basename(path)
+    return (name.endswith(IGNORED_SUFFIXES) or name in IGNORED_NAMES or name.startswith('.#')
+            or name.endswith('.egg-info'))
+
+class PollingWatcher(object):
+    """
+    Detects changes by comparing modification times and sizes of files in
+    watched directories at fixed intervals.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.directories = {}
+        self.snapshot = {}
+
+    def watch(self, directory, recursive=False):
+        directory = os.path.abspath(directory)
+        if self.directories.get(directory) is None or (recursive and not self.directories[directory]):
+            self.directories[directory] = recursive
+            self.snapshot.update(self.take_snapshot(directory, recursive))
+
+    def take_snapshot(self, directory, recursive):
+        snapshot = {}
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [name for name in dirnames if not is_ignored(name)] if recursive else []
+            for name in filenames + dirnames:
+                path = os.path.join(dirpath, name)
+                if is_ignored(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def poll(self):
+        """
+        :return: set of changed paths since previous call
+        """
+        snapshot = {}
+        for directory, recursive in self.directories.items():
+            snapshot.update(self.take_snapshot(directory, recursive))
+        changed = set(path for path in set(snapshot) | set(self.snapshot)
+                      if snapshot.get(path) != self.snapshot.get(path))
+        self.snapshot = snapshot
+        return changed
+
+    def read(self, timeout):
+        """
+        Waits at most timeout seconds (forever if None) for changes.
+        :return: set of changed paths, empty on timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            if deadline is not None and time.time() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else
+                       max(0, min(self.interval, deadline - time.time())))
+
+    def close(self):
+        pass
+
+class InotifyWatcher(object):
+    """
+    Receives changes from Linux kernel with inotify. Directories added with
+    recursive=True are watched with all their subdirectories, including ones
+    created later.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        self.recursive = {}
+
+    def watch(self, directory, recursive=False):
+        directory = os.path.abspath(directory)
+        directories = [directory]
+        if recursive:
+            for dirpath, dirnames, filenames in os.walk(directory):
+                dirnames[:] = [name for name in dirnames if not is_ignored(name)]
+                directories.extend(os.path.join(dirpath, name) for name in dirnames)
+        for path in directories:
+            if path in self.recursive and (self.recursive[path] or not recursive):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, path.encode(sys.getfilesystemencoding()), WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code == errno.ENOSPC:
+                    raise OSError(code, 'inotify watch limit reached, increase fs.inotify.max_user_watches')
+                continue
+            self.directories[wd] = path
+            self.recursive[path] = recursive
+
+    def read(self, timeout):
+        """
+        Waits at most timeout seconds (forever if None) for changes.
+        :return: set of changed paths, empty on timeout
+        """
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as err:
+            if err.errno == errno.EAGAIN:
+                return set()
+            raise
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(sys.getfilesystemencoding())
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, report all watched directories as changed
+                changed.update(self.directories.values())
+                continue
+            if mask & IN_IGNORED:
+                path = self.directories.pop(wd, None)
+                self.recursive.pop(path, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if is_ignored(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self.recursive.get(directory):
+                self.watch(path, True)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def create_watcher():
+    """
+    Returns inotify based watcher on Linux, polling watcher elsewhere.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as err:
+            log.warn("inotify not available (%s), polling for changes instead", err)
+    return PollingWatcher()
+
+def wait_for_changes(watcher, debounce=0.1):
+    """
+    Waits until something changes, and then until no further changes arrive
+    within debounce seconds, so that a burst of saves causes one rebuild.
+    :return: set of changed paths
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.read(None)
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed.update(more)
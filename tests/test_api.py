@@ -0,0 +1,78 @@
+"""
+Unit tests for in-process build API.
+"""
+
+import unittest
+import io
+import os
+import sys
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+from distutils.errors import DistutilsOptionError
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.api import build_wotmod
+
+SETUP_PY = '''
+from setuptools import setup
+setup(name=%r, version='1.0', author='tester', description='test', py_modules=['%s'],
+      data_files=[('assets', ['assets/*.txt'])])
+'''
+
+class BuildWotmodTestCase(TempdirManager, unittest.TestCase):
+
+    def create_project(self, name):
+        project_dir = self.mkdtemp()
+        self.write_file((project_dir, 'setup.py'), SETUP_PY % (name, name))
+        self.write_file((project_dir, '%s.py' % name), 'NAME = %r\n' % name)
+        self.write_file((project_dir, 'README'), 'readme of %s' % name)
+        os.mkdir(os.path.join(project_dir, 'assets'))
+        self.write_file((project_dir, 'assets', 'data.txt'), 'data of %s' % name)
+        return project_dir
+
+    def read_package(self, data):
+        with zipfile.ZipFile(io.BytesIO(data), 'r') as zip_file:
+            return dict((name, zip_file.read(name)) for name in zip_file.namelist())
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_concurrent_builds(self):
+        names = ['mod%d' % index for index in range(4)]
+        projects = [self.create_project(name) for name in names]
+        cwd = os.getcwd()
+        pool = ThreadPool(len(projects))
+        try:
+            results = pool.map(lambda project_dir: build_wotmod(project_dir, author_id='service'), projects)
+        finally:
+            pool.close()
+        assert_equal(os.getcwd(), cwd)
+        for name, project_dir, result in zip(names, projects, results):
+            assert_equal(result.metadata['id'], 'service.%s' % name)
+            assert_equal(result.metadata['filename'], 'service.%s_01.00.00.wotmod' % name)
+            assert_equal(result.metadata['size'], len(result.data))
+            contents = self.read_package(result.data)
+            assert_equal(contents['res/scripts/client/gui/mods/%s.py' % name], ('NAME = %r\n' % name).encode('ascii'))
+            self.assertIn('res/scripts/client/gui/mods/%s.pyc' % name, contents)
+            assert_equal(contents['res/mods/service.%s/assets/data.txt' % name], ('data of %s' % name).encode('ascii'))
+            assert_equal(contents['README'], ('readme of %s' % name).encode('ascii'))
+            # Build outputs are not left to the project directory
+            self.assertFalse(os.path.exists(os.path.join(project_dir, 'build')))
+            self.assertFalse(os.path.exists(os.path.join(project_dir, 'dist')))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_writes_package_to_file_object(self):
+        output = io.BytesIO()
+        result = build_wotmod(self.create_project('foo'), output, direct=1)
+        assert_equal(result.data, None)
+        assert_equal(result.metadata['size'], len(output.getvalue()))
+        self.assertIn('res/scripts/client/gui/mods/foo.pyc', self.read_package(output.getvalue()))
+
+    def test_rejects_unknown_and_unsupported_options(self):
+        project_dir = self.create_project('foo')
+        self.assertRaises(DistutilsOptionError, build_wotmod, project_dir, no_such_option=1)
+        self.assertRaises(DistutilsOptionError, build_wotmod, project_dir, watch=1)
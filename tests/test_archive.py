@@ -0,0 +1,125 @@
+"""
+Unit tests for zip archive helpers.
+"""
+
+import unittest
+import os
+import sys
+import zipfile
+
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.archive import (CompressionPolicy, Member, copy_raw_member, get_compression,
+                                       parse_compression, set_compression, write_member, write_members,
+                                       zipinfo_from_data, zipinfo_from_file)
+
+class CompressionPolicyTestCase(unittest.TestCase):
+
+    def test_default_is_stored(self):
+        assert_equal(CompressionPolicy().get('foo.xml'), (zipfile.ZIP_STORED, 0))
+
+    def test_parses_method_and_level(self):
+        assert_equal(parse_compression('deflate:9'), (zipfile.ZIP_DEFLATED, 9))
+        assert_equal(parse_compression('Deflate'), (zipfile.ZIP_DEFLATED, 6))
+
+    def test_rejects_invalid_specs(self):
+        for spec in ('zstd', 'stored:1', 'deflate:10'):
+            with pytest.raises(ValueError):
+                parse_compression(spec)
+
+    def test_overrides_by_extension(self):
+        policy = CompressionPolicy('deflate:9', '.pyc=stored, xml=deflate:1')
+        assert_equal(policy.get('res/foo.pyc'), (zipfile.ZIP_STORED, 0))
+        assert_equal(policy.get('res/foo.XML'), (zipfile.ZIP_DEFLATED, 1))
+        assert_equal(policy.get('res/foo.dds'), (zipfile.ZIP_DEFLATED, 9))
+
+    def test_directories_are_stored(self):
+        assert_equal(CompressionPolicy('deflate').get('res/'), (zipfile.ZIP_STORED, 0))
+
+class WriteMemberTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(WriteMemberTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+        self.source_path = os.path.join(self.test_dir, 'source.txt')
+        self.write_file(self.source_path, 'source contents ' * 1000)
+
+    def get_methods(self):
+        methods = ['stored', 'deflate:1', 'deflate:9']
+        if sys.version_info >= (3, 3):
+            methods += ['bzip2', 'lzma']
+        return methods
+
+    def test_written_members_are_readable(self):
+        zip_path = os.path.join(self.test_dir, 'test.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_file:
+            for method in self.get_methods():
+                zinfo = zipinfo_from_file(self.source_path, method + '/file')
+                set_compression(zinfo, *parse_compression(method))
+                write_member(zip_file, zinfo, path=self.source_path)
+                zinfo = zipinfo_from_data(method + '/data', b'data contents')
+                set_compression(zinfo, *parse_compression(method))
+                write_member(zip_file, zinfo, data=b'data contents')
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            for method in self.get_methods():
+                assert_equal(zip_file.read(method + '/file'), b'source contents ' * 1000)
+                assert_equal(zip_file.read(method + '/data'), b'data contents')
+                assert_equal(get_compression(zip_file.getinfo(method + '/file')), parse_compression(method))
+
+    def test_copies_raw_members(self):
+        source_zip_path = os.path.join(self.test_dir, 'source.zip')
+        target_zip_path = os.path.join(self.test_dir, 'target.zip')
+        with zipfile.ZipFile(source_zip_path, 'w') as zip_file:
+            zinfo = zipinfo_from_file(self.source_path, 'file')
+            set_compression(zinfo, zipfile.ZIP_DEFLATED, 9)
+            write_member(zip_file, zinfo, path=self.source_path)
+        with zipfile.ZipFile(source_zip_path, 'r') as source_zip:
+            with zipfile.ZipFile(target_zip_path, 'w') as target_zip:
+                source_info = source_zip.getinfo('file')
+                zinfo = zipinfo_from_file(self.source_path, 'copied')
+                set_compression(zinfo, zipfile.ZIP_DEFLATED, 9)
+                copy_raw_member(source_zip, source_info, target_zip, zinfo)
+        with zipfile.ZipFile(target_zip_path, 'r') as zip_file:
+            assert_equal(zip_file.read('copied'), b'source contents ' * 1000)
+            assert_equal(zip_file.getinfo('copied').compress_size, source_info.compress_size)
+
+    def test_threaded_output_equals_single_threaded_output(self):
+        paths = []
+        for index in range(20):
+            path = os.path.join(self.test_dir, 'file%d.xml' % index)
+            self.write_file(path, '<item index="%d"/>' % index * (index * 500))
+            paths.append(path)
+        contents = []
+        for threads, memory_limit in ((1, 0), (4, 100000), (4, 1)):
+            zip_path = os.path.join(self.test_dir, 'test%d_%d.zip' % (threads, memory_limit))
+            members = []
+            for index, path in enumerate(paths):
+                zinfo = zipinfo_from_file(path, os.path.basename(path))
+                set_compression(zinfo, zipfile.ZIP_DEFLATED if index % 3 else zipfile.ZIP_STORED, 6)
+                members.append(Member(zinfo, path, None, None))
+            with zipfile.ZipFile(zip_path, 'w') as zip_file:
+                total_size = write_members(zip_file, members, threads, memory_limit)
+            assert_equal(total_size, sum(os.path.getsize(path) for path in paths))
+            with open(zip_path, 'rb') as zip_file:
+                contents.append(zip_file.read())
+        assert_equal(contents[0], contents[1])
+        assert_equal(contents[0], contents[2])
+
+    def test_zip64_entry_count(self):
+        zip_path = os.path.join(self.test_dir, 'test.zip')
+        members = []
+        for index in range(70000):
+            zinfo = zipinfo_from_data('res/%d' % index, b'x')
+            members.append(Member(zinfo, None, b'x', None))
+        with zipfile.ZipFile(zip_path, 'w', allowZip64=True) as zip_file:
+            write_members(zip_file, members)
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            assert_equal(len(zip_file.infolist()), 70000)
+            assert_equal(zip_file.read('res/69999'), b'x')
+
+if __name__ == '__main__':
+    unittest.main()
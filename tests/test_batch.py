@@ -0,0 +1,115 @@
+"""
+Unit tests for batch builder.
+"""
+
+import unittest
+import os
+import sys
+import zipfile
+
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.batch import get_build_options, load_config, run_batch
+
+SETUP_PY = '''
+from setuptools import setup
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod
+setup(name=%r, version='1.0', author='tester', description='test', py_modules=['%s'],
+      cmdclass={'bdist_wotmod': bdist_wotmod})
+'''
+
+class LoadConfigTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(LoadConfigTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+
+    def test_ini_config(self):
+        self.write_file((self.test_dir, 'projects.cfg'), '\n'.join([
+            '[batch]',
+            'dist_dir = out',
+            'jobs = 2',
+            '[project:foo]',
+            'path = mods/foo',
+            'install_lib = res/scripts/common',
+            '[project]',
+            'path = mods/bar',
+        ]))
+        batch, projects = load_config(os.path.join(self.test_dir, 'projects.cfg'))
+        assert_equal(batch['dist_dir'], os.path.join(self.test_dir, 'out'))
+        assert_equal(batch['jobs'], '2')
+        assert_equal([project['name'] for project in projects], ['foo', 'bar'])
+        assert_equal(projects[0]['path'], os.path.join(self.test_dir, 'mods/foo'))
+        assert_equal(projects[0]['options'], {'install_lib': 'res/scripts/common'})
+
+    @pytest.mark.skipif(sys.version_info < (3, 11), reason='Requires tomllib')
+    def test_toml_config(self):
+        self.write_file((self.test_dir, 'projects.toml'), '\n'.join([
+            '[batch]',
+            'jobs = 2',
+            '[[project]]',
+            'path = "mods/foo"',
+            'options = { install_lib = "res/scripts/common", reproducible = true }',
+        ]))
+        batch, projects = load_config(os.path.join(self.test_dir, 'projects.toml'))
+        assert_equal(batch['jobs'], 2)
+        assert_equal(projects[0]['name'], 'foo')
+        assert_equal(get_build_options(projects[0], jobs=2), {
+            'install_lib': 'res/scripts/common', 'reproducible': 1, 'jobs': '2'})
+
+    def test_boolean_options_from_ini_config(self):
+        self.write_file((self.test_dir, 'projects.cfg'), '\n'.join([
+            '[project:foo]',
+            'path = mods/foo',
+            'incremental = 1',
+            'reproducible = Yes',
+            'prune = false',
+            'exclude-sources = 0',
+            'mod_version = 1.0',
+            'dist_dir = elsewhere',
+        ]))
+        batch, projects = load_config(os.path.join(self.test_dir, 'projects.cfg'))
+        assert_equal(get_build_options(projects[0], python27='python2.7'), {
+            'incremental': 1, 'mod_version': '1.0', 'reproducible': 1, 'python27': 'python2.7'})
+
+class RunBatchTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(RunBatchTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+
+    def create_project(self, name, source):
+        project_dir = os.path.join(self.test_dir, name)
+        os.mkdir(project_dir)
+        self.write_file((project_dir, 'setup.py'), SETUP_PY % (name, name))
+        self.write_file((project_dir, name + '.py'), source)
+        return {'name': name, 'path': project_dir, 'options': {}}
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_failing_project_does_not_stop_others(self):
+        projects = [
+            self.create_project('good', 'x = 1'),
+            self.create_project('bad', 'def'),
+            self.create_project('other', 'y = 2'),
+        ]
+        dist_dir = os.path.join(self.test_dir, 'dist')
+        stdout = sys.stdout
+        results = run_batch(projects, dist_dir, jobs=2, python27=os.environ.get('BDIST_WOTMOD_PYTHON27'))
+        assert_equal(sys.stdout, stdout)
+        assert_equal([result['ok'] for result in results], [True, False, True])
+        with open(results[1]['log']) as log_file:
+            self.assertIn('bad.py', log_file.read())
+        with open(results[0]['log']) as log_file:
+            self.assertNotIn('bad.py', log_file.read())
+        assert_equal(sorted(os.listdir(dist_dir)), ['logs', 'tester.good_01.00.00.wotmod',
+                                                    'tester.other_01.00.00.wotmod'])
+        for name in ('good', 'other'):
+            with zipfile.ZipFile(os.path.join(dist_dir, 'tester.%s_01.00.00.wotmod' % name)) as zip_file:
+                self.assertIn('res/scripts/client/gui/mods/%s.pyc' % name, zip_file.namelist())
+
+if __name__ == '__main__':
+    unittest.main()
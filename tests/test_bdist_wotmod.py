@@ -3,19 +3,29 @@ Unit tests for bdist_wotmod command.
 """
 
 import unittest
+import io
+import json
 import sys
 import os
+import pstats
+import struct
+import threading
+import time
 import zipfile
 import xml.etree.ElementTree as ET
 
 import mock
+from distutils.errors import DistutilsByteCompileError, DistutilsExecError, DistutilsOptionError
 from setuptools import Distribution
 from nose.tools import assert_equal
 import pytest
 
 from utils import TempdirManager, get_file_in_zip_contents
 
-from setuptools_wotmod.bdist_wotmod import bdist_wotmod
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod, get_vendored_entries, run_in_parallel
+from setuptools_wotmod.instrumentation import add_phase_hook, remove_phase_hook
+from setuptools_wotmod.remote_cache import CacheServer
+from setuptools_wotmod.resources import ResourceManifest, parse_manifest
 
 @pytest.mark.filterwarnings("ignore:bdist_wotmod")
 @pytest.mark.filterwarnings("ignore:Normalizing .+ to .+")
@@ -101,6 +111,575 @@ class BuildWotmodTestCase(TempdirManager, unittest.TestCase):
         except AssertionError as err:
             assert 'is not valid Python 2.7 byte-compiled file' in str(err), err
 
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_parallel_byte_compile(self):
+        for server_timeout in (10, 0):
+            modules = ['mod%d' % index for index in range(5)]
+            for module in modules:
+                self.write_file((self.pkg_dir, module + '.py'), 'print "%s"' % module)
+            dist = create_distribution(py_modules=modules)
+            cmd = bdist_wotmod(dist)
+            cmd.jobs = 3
+            cmd.compile_server_timeout = server_timeout
+            cmd.ensure_finalized()
+            cmd.run()
+            wotmod_path = os.path.join(self.pkg_dir, 'dist', 'jhakonen.foo_00.01.00.wotmod')
+            for module in modules:
+                self.assertFileInZip(wotmod_path, 'res/scripts/client/gui/mods/%s.pyc' % module)
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_parallel_byte_compile_failure(self):
+        for server_timeout, error in ((10, DistutilsByteCompileError), (0, DistutilsExecError)):
+            self.write_file((self.pkg_dir, 'good.py'), 'x = 1')
+            self.write_file((self.pkg_dir, 'bad.py'), 'def')
+            dist = create_distribution(py_modules=['good', 'bad'])
+            cmd = bdist_wotmod(dist)
+            cmd.jobs = 2
+            cmd.compile_server_timeout = server_timeout
+            cmd.ensure_finalized()
+            with pytest.raises(error):
+                cmd.build_files()
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_incremental_build_compiles_only_changed_modules(self):
+        def build(py_modules):
+            cmd = bdist_wotmod(create_distribution(py_modules=py_modules))
+            cmd.incremental = 1
+            cmd.ensure_finalized()
+            cmd.run()
+        self.write_file((self.pkg_dir, 'bar.py'), 'x = 1')
+        build(['foo', 'bar'])
+        foo_pyc = os.path.join(self.pkg_dir, 'build', 'lib', 'foo.pyc')
+        bar_pyc = os.path.join(self.pkg_dir, 'build', 'lib', 'bar.pyc')
+        os.utime(foo_pyc, (1000000000, 1000000000))
+        os.utime(bar_pyc, (1000000000, 1000000000))
+        self.write_file((self.pkg_dir, 'bar.py'), 'x = 2')
+        # build_py copies only sources which are newer by at least a second
+        bar_py = os.path.join(self.pkg_dir, 'bar.py')
+        os.utime(bar_py, (os.stat(bar_py).st_atime + 2, os.stat(bar_py).st_mtime + 2))
+        build(['foo', 'bar'])
+        self.assertEqual(os.stat(foo_pyc).st_mtime, 1000000000)
+        self.assertNotEqual(os.stat(bar_pyc).st_mtime, 1000000000)
+        # Modules removed from the project are removed from the build as well
+        build(['foo'])
+        self.assertFalse(os.path.exists(bar_pyc))
+        wotmod_path = os.path.join(self.pkg_dir, 'dist', 'jhakonen.foo_00.01.00.wotmod')
+        with zipfile.ZipFile(wotmod_path, 'r') as zip_file:
+            self.assertNotIn('res/scripts/client/gui/mods/bar.pyc', zip_file.namelist())
+            self.assertNotIn('res/scripts/client/gui/mods/bar.py', zip_file.namelist())
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_pyc_cache_is_shared_between_builds(self):
+        cache_dir = self.mkdtemp()
+        def build():
+            cmd = bdist_wotmod(create_distribution(py_modules=['foo']))
+            cmd.pyc_cache = 1
+            cmd.cache_dir = cache_dir
+            cmd.ensure_finalized()
+            cmd.run()
+            return cmd.get_output_file_path()
+        first = get_file_in_zip_contents(build(), 'res/scripts/client/gui/mods/foo.pyc')
+        # Build an identical project elsewhere
+        other_dir = self.mkdtemp()
+        self.write_file((other_dir, 'foo.py'), '#')
+        os.chdir(other_dir)
+        second = get_file_in_zip_contents(build(), 'res/scripts/client/gui/mods/foo.pyc')
+        # Cached module gets the modification time of the other source
+        assert_equal(first[:4] + first[8:], second[:4] + second[8:])
+        with open(os.path.join(cache_dir, 'pyc', 'stats.json')) as stats_file:
+            stats = json.load(stats_file)
+        assert_equal((stats['hits'], stats['misses']), (1, 1))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_optimized_package(self):
+        self.write_file((self.pkg_dir, 'foo.py'), 'def foo():\n    "foo docstring"\n    assert False\n')
+        self.write_file((self.pkg_dir, 'data.xml'), '<root>\n  <!-- comment -->\n  <item>1</item>\n</root>\n')
+        report_path = os.path.join(self.pkg_dir, 'size-report.json')
+        packages = {}
+        for direct in (0, 1):
+            cmd = bdist_wotmod(create_distribution(py_modules=['foo'], data_files=['data.xml']))
+            cmd.direct = direct
+            cmd.optimize = 2
+            cmd.exclude_sources = 1
+            cmd.minify_data = 1
+            cmd.size_report = report_path
+            cmd.ensure_finalized()
+            cmd.run()
+            with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+                packages[direct] = dict((name, zip_file.read(name)) for name in zip_file.namelist())
+            os.remove(cmd.get_output_file_path())
+        assert_equal(packages[0], packages[1])
+        self.assertNotIn('res/scripts/client/gui/mods/foo.py', packages[1])
+        self.assertNotIn('res/scripts/client/gui/mods/foo.pyo', packages[1])
+        self.assertNotIn(b'foo docstring', packages[1]['res/scripts/client/gui/mods/foo.pyc'])
+        assert_equal(packages[1]['res/mods/jhakonen.foo/data.xml'], b'<root><item>1</item></root>')
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        assert_equal(report['types']['.py']['after'], 0)
+        # Modules are compiled only with optimizations
+        build_lib = os.path.join(self.pkg_dir, 'build', 'lib')
+        assert_equal(sorted(name for name in os.listdir(build_lib) if name.startswith('foo.')), ['foo.py', 'foo.pyo'])
+        assert_equal(report['total']['saved'], sum(sums['saved'] for sums in report['types'].values()))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_pruned_package(self):
+        self.write_file((self.pkg_dir, 'mod_foo.py'),
+                        'from foo import used\nfrom gui.mods.sibling import x\nimport gui.mods.sibling2\n')
+        self.write_file((self.pkg_dir, 'sibling.py'), 'x = 1\n')
+        self.write_file((self.pkg_dir, 'sibling2.py'), '')
+        os.mkdir(os.path.join(self.pkg_dir, 'foo'))
+        self.write_file((self.pkg_dir, 'foo', '__init__.py'), '')
+        self.write_file((self.pkg_dir, 'foo', 'used.py'), 'import helper\n')
+        self.write_file((self.pkg_dir, 'foo', 'helper.py'), '')
+        self.write_file((self.pkg_dir, 'foo', 'unused.py'), 'import foo.used\n')
+        os.mkdir(os.path.join(self.pkg_dir, 'plugins'))
+        self.write_file((self.pkg_dir, 'plugins', '__init__.py'), '')
+        packages = {}
+        for direct in (0, 1):
+            cmd = bdist_wotmod(create_distribution(py_modules=['mod_foo', 'sibling', 'sibling2'],
+                                                   packages=['foo', 'plugins']))
+            cmd.direct = direct
+            cmd.prune = 1
+            cmd.prune_keep = 'plugins'
+            cmd.ensure_finalized()
+            cmd.run()
+            with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+                packages[direct] = sorted(name for name in zip_file.namelist() if name.endswith('.pyc'))
+            os.remove(cmd.get_output_file_path())
+        assert_equal(packages[0], packages[1])
+        assert_equal(packages[1], [
+            'res/scripts/client/gui/mods/foo/__init__.pyc',
+            'res/scripts/client/gui/mods/foo/helper.pyc',
+            'res/scripts/client/gui/mods/foo/used.pyc',
+            'res/scripts/client/gui/mods/mod_foo.pyc',
+            'res/scripts/client/gui/mods/plugins/__init__.pyc',
+            'res/scripts/client/gui/mods/sibling.pyc',
+            'res/scripts/client/gui/mods/sibling2.pyc',
+        ])
+        self.assertFalse(os.path.exists(os.path.join('build', 'lib', 'foo', 'unused.pyc')))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_incremental_pruned_build_keeps_pruned_modules(self):
+        self.write_file((self.pkg_dir, 'mod_foo.py'), 'import used\n')
+        self.write_file((self.pkg_dir, 'used.py'), '')
+        self.write_file((self.pkg_dir, 'unused.py'), '')
+        unused_paths = [os.path.join(self.pkg_dir, 'build', 'lib', name) for name in ('unused.py', 'unused.pyc')]
+        for prune in (0, 1):
+            cmd = bdist_wotmod(create_distribution(py_modules=['mod_foo', 'used', 'unused']))
+            cmd.incremental = 1
+            cmd.direct = 1
+            cmd.prune = prune
+            cmd.ensure_finalized()
+            cmd.run()
+            for path in unused_paths:
+                self.assertTrue(os.path.exists(path))
+        with open(os.path.join(self.pkg_dir, 'build', 'wotmod-compile-manifest.json')) as manifest_file:
+            self.assertIn('%s|0' % os.path.normpath(os.path.join('build', 'lib', 'unused.py')),
+                          json.load(manifest_file))
+        with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+            self.assertNotIn('res/scripts/client/gui/mods/unused.pyc', zip_file.namelist())
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_resource_manifest(self):
+        manifests = {}
+        for direct in (0, 1):
+            cmd = bdist_wotmod(create_distribution(data_files=['datafile', ('icons', [])]))
+            cmd.direct = direct
+            cmd.resource_manifest = 1
+            cmd.ensure_finalized()
+            cmd.run()
+            with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+                manifests[direct] = parse_manifest(zip_file.read('res/mods/jhakonen.foo/resources.manifest'))
+                datafile_crc = zip_file.getinfo('res/mods/jhakonen.foo/datafile').CRC
+            os.remove(cmd.get_output_file_path())
+        assert_equal(manifests[0], manifests[1])
+        manifest = ResourceManifest(manifests[1])
+        assert_equal(manifest.list_directory('mods/jhakonen.foo'), ['datafile', 'icons'])
+        assert_equal(manifest.get_entry('mods/jhakonen.foo/datafile'),
+                     ('mods/jhakonen.foo/datafile', 'f', len('datafile contents'), datafile_crc))
+        assert_equal(manifest.list_directory('scripts/client/gui/mods'), ['foo.py', 'foo.pyc'])
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_isolated_build(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.isolated = 1
+        cmd.ensure_finalized()
+        # Nothing is created before the run starts
+        self.assertIsNone(cmd.isolated_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.pkg_dir, 'build')))
+        dirs = []
+        def hook(event, phase, command, stats):
+            if event == 'start' and phase == 'build_files':
+                dirs.extend([command.isolated_dir, command.bdist_dir,
+                             command.get_finalized_command('build').build_lib])
+        add_phase_hook(hook)
+        try:
+            cmd.run()
+        finally:
+            remove_phase_hook(hook)
+        isolated_dir, bdist_dir, build_lib = dirs
+        assert_equal(os.path.abspath(os.path.dirname(isolated_dir)), os.path.join(self.pkg_dir, 'build'))
+        self.assertTrue(bdist_dir.startswith(isolated_dir))
+        self.assertTrue(build_lib.startswith(isolated_dir))
+        self.assertFalse(os.path.exists(isolated_dir))
+        assert_equal(os.listdir(os.path.join(self.pkg_dir, 'build')), [])
+        assert_equal(os.listdir(os.path.join(self.pkg_dir, 'dist')), ['jhakonen.foo_00.01.00.wotmod'])
+        self.assertFileInZip(cmd.get_output_file_path(), 'res/scripts/client/gui/mods/foo.pyc')
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_matrix(self):
+        dist = create_distribution(data_files=['datafile'])
+        dist.command_options['bdist_wotmod:client'] = {}
+        dist.command_options['bdist_wotmod:common'] = {
+            'install_lib': ('setup.cfg', 'res/scripts/common'),
+            'version-padding': ('setup.cfg', '3'),
+            'mod_id': ('setup.cfg', 'foo_common'),
+        }
+        cmd = bdist_wotmod(dist)
+        cmd.matrix = 'client, common'
+        cmd.ensure_finalized()
+        cmd.run()
+        dist_dir = os.path.join(self.pkg_dir, 'dist')
+        assert_equal(sorted(os.listdir(dist_dir)), [
+            'jhakonen.foo_00.01.00.wotmod', 'jhakonen.foo_common_000.001.000.wotmod'])
+        assert_equal([phase['name'] for phase in cmd.recorder.phases].count('build_files'), 1)
+        variant_phases = cmd.recorder.phases[-1]['variants']
+        assert_equal(sorted(variant_phases), ['client', 'common'])
+        for phases in variant_phases.values():
+            assert_equal([phase['name'] for phase in phases], ['create_wotmod_package'])
+        client_path = os.path.join(dist_dir, 'jhakonen.foo_00.01.00.wotmod')
+        common_path = os.path.join(dist_dir, 'jhakonen.foo_common_000.001.000.wotmod')
+        self.assertFileInZip(client_path, 'res/scripts/client/gui/mods/foo.pyc')
+        self.assertFileInZip(client_path, 'res/mods/jhakonen.foo/datafile')
+        self.assertFileInZip(common_path, 'res/scripts/common/foo.pyc')
+        self.assertFileInZip(common_path, 'res/mods/jhakonen.foo_common/datafile')
+        metaxml = get_file_in_zip_contents(common_path, 'meta.xml')
+        self.assertXmlXPath(metaxml, 'id', 'jhakonen.foo_common')
+        self.assertXmlXPath(metaxml, 'version', '000.001.000')
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_pruned_matrix(self):
+        self.write_file((self.pkg_dir, 'mod_foo.py'), 'import used\n')
+        self.write_file((self.pkg_dir, 'used.py'), '')
+        self.write_file((self.pkg_dir, 'unused.py'), '')
+        dist = create_distribution(py_modules=['mod_foo', 'used', 'unused'])
+        dist.command_options['bdist_wotmod:client'] = {}
+        dist.command_options['bdist_wotmod:common'] = {
+            'install_lib': ('setup.cfg', 'res/scripts/common'),
+            'mod_id': ('setup.cfg', 'foo_common'),
+        }
+        cmd = bdist_wotmod(dist)
+        cmd.matrix = 'client, common'
+        cmd.prune = 1
+        cmd.ensure_finalized()
+        cmd.run()
+        packages = {}
+        for name in ('foo', 'foo_common'):
+            path = os.path.join(self.pkg_dir, 'dist', 'jhakonen.%s_00.01.00.wotmod' % name)
+            with zipfile.ZipFile(path, 'r') as zip_file:
+                packages[name] = sorted(name for name in zip_file.namelist() if name.endswith('.py')
+                                        or name.endswith('.pyc'))
+        assert_equal(packages['foo'], [
+            'res/scripts/client/gui/mods/mod_foo.py', 'res/scripts/client/gui/mods/mod_foo.pyc',
+            'res/scripts/client/gui/mods/used.py', 'res/scripts/client/gui/mods/used.pyc',
+        ])
+        # Nothing is pruned from the variant without entry modules, so all of
+        # its modules must have been compiled
+        assert_equal(packages['foo_common'], [
+            'res/scripts/common/mod_foo.py', 'res/scripts/common/mod_foo.pyc',
+            'res/scripts/common/unused.py', 'res/scripts/common/unused.pyc',
+            'res/scripts/common/used.py', 'res/scripts/common/used.pyc',
+        ])
+
+    def test_matrix_variant_requires_section(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.matrix = 'client'
+        self.assertRaises(DistutilsOptionError, cmd.ensure_finalized)
+        self.dist.command_options['bdist_wotmod:client'] = {'compression': ('setup.cfg', 'deflate')}
+        self.assertRaises(DistutilsOptionError, cmd.ensure_finalized)
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_remote_cache(self):
+        server = CacheServer(self.mkdtemp(), ('127.0.0.1', 0))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        def build(remote_cache):
+            # Each build has its own local cache, like on another machine
+            cmd = bdist_wotmod(create_distribution(py_modules=['foo'], data_files=['datafile']))
+            cmd.remote_cache = remote_cache
+            cmd.cache_dir = self.mkdtemp()
+            cmd.ensure_finalized()
+            cmd.run()
+            with open(cmd.get_output_file_path(), 'rb') as package_file:
+                return package_file.read(), [phase['name'] for phase in cmd.recorder.phases], cmd.remote
+        try:
+            first, phases, _ = build(server.get_url())
+            self.assertIn('build_files', phases)
+            second, phases, _ = build(server.get_url())
+            assert_equal(phases, ['fetch_cached_package'])
+            assert_equal(first, second)
+            # Changed sources are built locally, compiled modules are fetched
+            self.write_file((self.pkg_dir, 'datafile'), 'changed')
+            foo_py = os.path.join(self.pkg_dir, 'foo.py')
+            os.utime(foo_py, (os.stat(foo_py).st_atime + 2, os.stat(foo_py).st_mtime + 2))
+            _, phases, remote = build(server.get_url())
+            self.assertIn('build_files', phases)
+            assert_equal((remote.hits, remote.misses), (1, 1))
+            wotmod_path = os.path.join(self.pkg_dir, 'dist', 'jhakonen.foo_00.01.00.wotmod')
+            assert_equal(get_file_in_zip_contents(wotmod_path, 'res/mods/jhakonen.foo/datafile'), b'changed')
+        finally:
+            server.shutdown()
+            server.server_close()
+        # Unreachable cache doesn't fail the build
+        build(server.get_url())
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_direct_package_matches_staged_package(self):
+        os.mkdir(os.path.join(self.pkg_dir, 'bar'))
+        self.write_file((self.pkg_dir, 'bar', '__init__.py'), '#')
+        self.write_file((self.pkg_dir, 'bar', 'data.xml'), '<root/>')
+        data_files = ['datafile', ('sub/dir', ['datafile', 'README']), ('empty', [])]
+        packages = {}
+        for direct in (0, 1):
+            dist = create_distribution(data_files=data_files, packages=['bar'],
+                                       package_data={'bar': ['*.xml']})
+            dist.get_command_obj('install_data').warn = mock.Mock()
+            cmd = bdist_wotmod(dist)
+            cmd.direct = direct
+            cmd.ensure_finalized()
+            cmd.run()
+            with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+                packages[direct] = dict((info.filename, (info.external_attr & (0o40000 << 16),
+                                         zip_file.read(info.filename)))
+                                        for info in zip_file.infolist())
+            os.remove(cmd.get_output_file_path())
+        self.assertEqual(packages[0], packages[1])
+        self.assertIn('res/mods/jhakonen.foo/empty/', packages[1])
+        self.assertIn('res/scripts/client/gui/mods/bar/data.xml', packages[1])
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_glob_data_files(self):
+        for path in (('assets', 'a'), ('assets', 'a', 'b')):
+            os.makedirs(os.path.join(self.pkg_dir, *path))
+        self.write_file((self.pkg_dir, 'assets', 'top.dds'), 'top')
+        self.write_file((self.pkg_dir, 'assets', 'a', 'b', 'deep.dds'), 'deep')
+        self.write_file((self.pkg_dir, 'assets', 'a', 'skipped.txt'), 'skipped')
+        data_files = [('textures', ['datafile', 'assets/**/*.dds']), 'assets/a/*.txt']
+        packages = {}
+        for direct in (0, 1):
+            dist = create_distribution(data_files=data_files)
+            dist.get_command_obj('install_data').warn = mock.Mock()
+            cmd = bdist_wotmod(dist)
+            cmd.direct = direct
+            cmd.ensure_finalized()
+            cmd.run()
+            with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+                packages[direct] = sorted(name for name in zip_file.namelist() if name.startswith('res/mods/'))
+            os.remove(cmd.get_output_file_path())
+        assert_equal(packages[0], packages[1])
+        assert_equal([name for name in packages[1] if not name.endswith('/')], [
+            'res/mods/jhakonen.foo/skipped.txt',
+            'res/mods/jhakonen.foo/textures/a/b/deep.dds',
+            'res/mods/jhakonen.foo/textures/datafile',
+            'res/mods/jhakonen.foo/textures/top.dds',
+        ])
+
+    def test_staged_data_files_are_linked(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.ensure_finalized()
+        target = os.path.join(self.mkdtemp(), 'datafile')
+        cmd.stage_file(os.path.join(self.pkg_dir, 'datafile'), target)
+        with open(target) as target_file:
+            assert_equal(target_file.read(), 'datafile contents')
+        if hasattr(os, 'link') and os.stat(target).st_nlink == 2:
+            assert_equal(os.stat(target).st_ino, os.stat(os.path.join(self.pkg_dir, 'datafile')).st_ino)
+        cmd.stage_links = 'copy'
+        cmd.stage_file(os.path.join(self.pkg_dir, 'datafile'), target)
+        assert_equal(os.stat(target).st_nlink, 1)
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_rebuild_updates_deployed_package(self):
+        deploy_dir = self.mkdtemp()
+        cmd = bdist_wotmod(self.dist)
+        cmd.watch = 1
+        cmd.deploy_dir = deploy_dir
+        cmd.ensure_finalized()
+        cmd.build_package()
+        deployed_path = os.path.join(deploy_dir, os.path.basename(cmd.get_output_file_path()))
+        self.assertFileInZip(deployed_path, 'res/mods/jhakonen.foo/datafile', b'datafile contents')
+        self.write_file((self.pkg_dir, 'datafile'), 'new datafile contents')
+        self.write_file((self.pkg_dir, 'foo.py'), 'x = 1')
+        cmd.rebuild([os.path.join(self.pkg_dir, 'datafile'), os.path.join(self.pkg_dir, 'foo.py')])
+        self.assertFileInZip(deployed_path, 'res/mods/jhakonen.foo/datafile', b'new datafile contents')
+        self.assertFileInZip(deployed_path, 'res/scripts/client/gui/mods/foo.py', b'x = 1')
+        assert_equal(os.listdir(deploy_dir), [os.path.basename(deployed_path)])
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_unpacked_deploy(self):
+        deploy_dir = self.mkdtemp()
+        cmd = bdist_wotmod(self.dist)
+        cmd.deploy_dir = deploy_dir
+        cmd.deploy_mode = 'unpacked'
+        cmd.ensure_finalized()
+        cmd.run()
+        self.assertFalse(os.path.exists(cmd.get_output_file_path()))
+        self.assertTrue(os.path.isfile(os.path.join(deploy_dir, 'scripts', 'client', 'gui', 'mods', 'foo.pyc')))
+        with open(os.path.join(deploy_dir, 'mods', 'jhakonen.foo', 'datafile')) as data_file:
+            assert_equal(data_file.read(), 'datafile contents')
+
+    def test_unpacked_deploy_requires_deploy_dir(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.deploy_mode = 'unpacked'
+        with pytest.raises(DistutilsOptionError):
+            cmd.ensure_finalized()
+
+    def test_updated_package_equals_full_rebuild(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.direct = 1
+        cmd.ensure_finalized()
+        cmd.build_files()
+        wotmod_path = cmd.get_output_file_path()
+        with mock.patch('time.time', return_value=1500000000):
+            cmd.create_wotmod_package(cmd.get_direct_entries())
+        self.write_file((self.pkg_dir, 'datafile'), 'new datafile contents')
+        cmd.update = 1
+        with mock.patch('time.time', return_value=1500000000):
+            cmd.create_wotmod_package(cmd.get_direct_entries())
+        with open(wotmod_path, 'rb') as wotmod_file:
+            updated_contents = wotmod_file.read()
+        os.remove(wotmod_path)
+        with mock.patch('time.time', return_value=1500000000):
+            cmd.create_wotmod_package(cmd.get_direct_entries())
+        with open(wotmod_path, 'rb') as wotmod_file:
+            rebuilt_contents = wotmod_file.read()
+        self.assertEqual(updated_contents, rebuilt_contents)
+        self.assertFileInZip(wotmod_path, 'res/mods/jhakonen.foo/datafile', b'new datafile contents')
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_compression_overrides(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.compression = 'deflate:9'
+        cmd.compression_overrides = '.pyc=stored'
+        cmd.ensure_finalized()
+        cmd.run()
+        with zipfile.ZipFile(cmd.get_output_file_path(), 'r') as zip_file:
+            assert_equal(zip_file.getinfo('meta.xml').compress_type, zipfile.ZIP_DEFLATED)
+            assert_equal(zip_file.getinfo('res/scripts/client/gui/mods/foo.pyc').compress_type,
+                         zipfile.ZIP_STORED)
+            assert_equal(zip_file.getinfo('res/').compress_type, zipfile.ZIP_STORED)
+            self.assertIsNone(zip_file.testzip())
+
+    def test_invalid_compression(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.compression = 'foo'
+        with pytest.raises(DistutilsOptionError):
+            cmd.ensure_finalized()
+
+    @mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '1500000000'})
+    def test_reproducible_packages_are_identical(self):
+        contents = []
+        for mtime in (1400000000, 1600000000):
+            for name in ('foo.py', 'datafile', 'README'):
+                os.utime(os.path.join(self.pkg_dir, name), (mtime, mtime))
+            # Compiled files store source modification time
+            for name in ('foo.py', 'foo.pyc'):
+                if os.path.exists(os.path.join(self.pkg_dir, 'build', 'lib', name)):
+                    os.remove(os.path.join(self.pkg_dir, 'build', 'lib', name))
+            cmd = bdist_wotmod(create_distribution(data_files=['datafile']))
+            cmd.reproducible = 1
+            cmd.compression = 'deflate'
+            cmd.ensure_finalized()
+            cmd.build_files()
+            wotmod_path = cmd.create_wotmod_package(cmd.get_direct_entries())
+            with open(wotmod_path, 'rb') as wotmod_file:
+                contents.append(wotmod_file.read())
+            os.remove(wotmod_path)
+        self.assertEqual(contents[0], contents[1])
+        with open(wotmod_path, 'wb') as wotmod_file:
+            wotmod_file.write(contents[0])
+        with zipfile.ZipFile(wotmod_path, 'r') as zip_file:
+            names = zip_file.namelist()
+            self.assertEqual(names, sorted(names))
+            assert_equal(zip_file.getinfo('meta.xml').date_time, (2017, 7, 14, 2, 40, 0))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    @pytest.mark.skipif(not hasattr(time, 'tzset'), reason='Requires time.tzset()')
+    @mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '1500000000'})
+    def test_reproducible_packages_do_not_depend_on_time_zone(self):
+        contents = []
+        try:
+            for tz in ('UTC', 'EST+05EDT,M3.2.0,M11.1.0'):
+                with mock.patch.dict(os.environ, {'TZ': tz}):
+                    time.tzset()
+                    cmd = bdist_wotmod(create_distribution())
+                    cmd.reproducible = 1
+                    cmd.ensure_finalized()
+                    cmd.run()
+                with open(cmd.get_output_file_path(), 'rb') as wotmod_file:
+                    contents.append(wotmod_file.read())
+                os.remove(cmd.get_output_file_path())
+        finally:
+            time.tzset()
+        self.assertEqual(contents[0], contents[1])
+        with zipfile.ZipFile(io.BytesIO(contents[0]), 'r') as zip_file:
+            pyc_data = zip_file.read('res/scripts/client/gui/mods/foo.pyc')
+        assert_equal(struct.unpack('<I', pyc_data[4:8])[0], 1500000000)
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_timings_and_profile(self):
+        cmd = bdist_wotmod(self.dist)
+        cmd.timings = os.path.join(self.pkg_dir, 'timings.json')
+        cmd.profile = os.path.join(self.pkg_dir, 'build.prof')
+        cmd.ensure_finalized()
+        cmd.run()
+        with open(cmd.timings) as timings_file:
+            timings = json.load(timings_file)
+        assert_equal([phase['name'] for phase in timings['phases']], [
+            'build_files', 'verify_pyc_files', 'build_dependencies', 'install_files',
+            'create_metaxml', 'include_other_documents', 'extract_vendored_packages',
+            'create_wotmod_package'])
+        package_phase = timings['phases'][-1]
+        assert_equal(package_phase['bytes'], os.path.getsize(cmd.get_output_file_path()))
+        self.assertGreater(package_phase['files'], 0)
+        self.assertGreaterEqual(timings['total']['wall_time'], package_phase['wall_time'])
+        self.assertTrue(pstats.Stats(cmd.profile).total_calls > 0)
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_phase_hooks(self):
+        events = []
+        hook = lambda event, phase, command, stats: events.append((event, phase))
+        add_phase_hook(hook)
+        try:
+            cmd = bdist_wotmod(self.dist)
+            cmd.direct = 1
+            cmd.ensure_finalized()
+            cmd.run()
+        finally:
+            remove_phase_hook(hook)
+        assert_equal(events[:2], [('start', 'build_files'), ('end', 'build_files')])
+        assert_equal(events[-1], ('end', 'create_wotmod_package'))
+
 @pytest.mark.filterwarnings("ignore:bdist_wotmod")
 @pytest.mark.filterwarnings("ignore:Normalizing .+ to .+")
 class GetOutputFilePathTestCase(TempdirManager, unittest.TestCase):
@@ -140,6 +719,44 @@ class GetOutputFilePathTestCase(TempdirManager, unittest.TestCase):
         cmd = self.create_command(version='0.1.2-rc1')
         assert_equal(cmd.get_output_file_path(), os.path.join(self.test_dir, 'jhakonen.foo_00.01.02.wotmod'))
 
+class GetVendoredEntriesTestCase(TempdirManager, unittest.TestCase):
+
+    def test_extracts_members_to_files(self):
+        test_dir = self.mkdtemp()
+        package_paths = []
+        for name, members in (('a', ['res/a.txt', 'res/shared.txt']), ('b', ['res/b/', 'res/shared.txt'])):
+            package_paths.append(os.path.join(test_dir, name + '.wotmod'))
+            with zipfile.ZipFile(package_paths[-1], 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr('meta.xml', '<root/>')
+                for member in members:
+                    zinfo = zipfile.ZipInfo(member, (2017, 7, 14, 2, 40, 0))
+                    zip_file.writestr(zinfo, '' if member.endswith('/') else 'data of %s in %s' % (member, name))
+        extract_dir = os.path.join(test_dir, 'extracted')
+        entries = get_vendored_entries(package_paths, extract_dir)
+        assert_equal([entry.archive_path for entry in entries], ['res/a.txt', 'res/shared.txt'])
+        for entry in entries:
+            assert_equal(entry.path, os.path.join(extract_dir, *entry.archive_path.split('/')))
+            self.assertIsNone(entry.data)
+            with open(entry.path) as entry_file:
+                assert_equal(entry_file.read(), 'data of %s in a' % entry.archive_path)
+            assert_equal(time.localtime(os.path.getmtime(entry.path))[0:6], (2017, 7, 14, 2, 40, 0))
+
+class RunInParallelTestCase(unittest.TestCase):
+
+    def test_number_of_threads_is_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        def func(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return item * 2
+        assert_equal(run_in_parallel(func, list(range(20)), 3), [item * 2 for item in range(20)])
+        assert_equal(running[1], 3)
+
 def create_distribution(**kwargs):
     dist = Distribution(dict({
         'name': 'foo',
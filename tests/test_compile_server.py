@@ -0,0 +1,59 @@
+"""
+Unit tests for Python 2.7 compile server.
+"""
+
+import unittest
+import os
+import time
+
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.bdist_wotmod import is_python27_pyc_file
+from setuptools_wotmod.compile_server import get_address_file_path, get_compile_server
+
+PYTHON27 = os.environ.get('BDIST_WOTMOD_PYTHON27')
+
+@pytest.mark.skipif(not PYTHON27, reason='Requires BDIST_WOTMOD_PYTHON27')
+class CompileServerTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(CompileServerTestCase, self).setUp()
+        self.src_dir = self.mkdtemp()
+
+    def test_compiles_files_to_python27_pyc(self):
+        self.write_file((self.src_dir, 'foo.py'), 'print "foo"\n')
+        self.write_file((self.src_dir, 'bar.py'), 'x = 1\n')
+        server = get_compile_server(PYTHON27, 0, 10)
+        results = server.compile([os.path.join(self.src_dir, 'foo.py'),
+                                  os.path.join(self.src_dir, 'bar.py')], True, self.src_dir + os.sep)
+        self.assertEqual([error for _, error in results], [None, None])
+        self.assertTrue(is_python27_pyc_file(os.path.join(self.src_dir, 'foo.pyc')))
+        self.assertTrue(is_python27_pyc_file(os.path.join(self.src_dir, 'bar.pyc')))
+
+    def test_reports_errors_per_file(self):
+        self.write_file((self.src_dir, 'good.py'), 'x = 1\n')
+        self.write_file((self.src_dir, 'bad.py'), 'def\n')
+        server = get_compile_server(PYTHON27, 0, 10)
+        results = dict(server.compile([os.path.join(self.src_dir, 'good.py'),
+                                       os.path.join(self.src_dir, 'bad.py')], True, None))
+        self.assertIsNone(results[os.path.join(self.src_dir, 'good.py')])
+        self.assertIn('SyntaxError', results[os.path.join(self.src_dir, 'bad.py')])
+
+    def test_server_is_reused(self):
+        first = get_compile_server(PYTHON27, 0, 10)
+        second = get_compile_server(PYTHON27, 0, 10, reconnect=True)
+        self.assertEqual(first.port, second.port)
+
+    def test_server_shuts_down_when_idle(self):
+        server = get_compile_server(PYTHON27, 0, 0.5, slot=99)
+        address_file = get_address_file_path(PYTHON27, 0, slot=99)
+        self.assertTrue(os.path.exists(address_file))
+        deadline = time.time() + 10
+        while os.path.exists(address_file) and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertFalse(os.path.exists(address_file))
+
+if __name__ == '__main__':
+    unittest.main()
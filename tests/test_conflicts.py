@@ -0,0 +1,74 @@
+"""
+Unit tests for conflict analyzer.
+"""
+
+import unittest
+import os
+import zipfile
+
+from nose.tools import assert_equal
+import mock
+
+from utils import TempdirManager
+
+from setuptools_wotmod import conflicts
+from setuptools_wotmod.conflicts import analyze
+
+class ConflictsTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(ConflictsTestCase, self).setUp()
+        self.mods_dir = self.mkdtemp()
+        self.index_path = os.path.join(self.mkdtemp(), 'index.json')
+
+    def create_package(self, filename, names):
+        path = os.path.join(self.mods_dir, filename)
+        with zipfile.ZipFile(path, 'w') as zip:
+            zip.writestr('meta.xml', '<root/>')
+            for name in names:
+                zip.writestr(name, name)
+        return path
+
+    def test_reports_collisions_between_mods(self):
+        foo = self.create_package('com.example.foo_01.00.00.wotmod', ['res/scripts/a.pyc', 'res/scripts/b.pyc'])
+        bar = self.create_package('com.example.bar_01.00.00.wotmod', ['res/scripts/b.pyc'])
+        report = analyze(self.mods_dir, self.index_path)
+        assert_equal(report['collisions'], [{'path': 'res/scripts/b.pyc', 'packages': [bar, foo]}])
+        assert_equal(report['duplicates'], [])
+
+    def test_reports_duplicate_mod_versions(self):
+        self.create_package('com.example.foo_01.00.00.wotmod', ['res/scripts/a.pyc'])
+        self.create_package('com.example.foo_01.00.00-rc1.wotmod', ['res/scripts/a.pyc'])
+        report = analyze(self.mods_dir, self.index_path)
+        assert_equal(report['collisions'], [])
+        assert_equal(len(report['duplicates']), 1)
+        assert_equal(report['duplicates'][0]['loaded'], 'com.example.foo_01.00.00.wotmod')
+        assert_equal(report['duplicates'][0]['versions'], ['01.00.00', '01.00.00-rc1'])
+
+    def test_sizes_per_mod(self):
+        self.create_package('com.example.foo_01.00.00.wotmod', ['res/scripts/a.pyc'])
+        report = analyze(self.mods_dir, self.index_path)
+        assert_equal(report['mods'][0]['id'], 'com.example.foo')
+        assert_equal(report['mods'][0]['uncompressed_size'], len('<root/>') + len('res/scripts/a.pyc'))
+        assert_equal(report['mods'][0]['size'],
+                     os.path.getsize(os.path.join(self.mods_dir, 'com.example.foo_01.00.00.wotmod')))
+
+    def test_only_changed_packages_are_indexed_again(self):
+        self.create_package('com.example.foo_01.00.00.wotmod', ['res/scripts/a.pyc'])
+        analyze(self.mods_dir, self.index_path)
+        bar = self.create_package('com.example.bar_01.00.00.wotmod', ['res/scripts/a.pyc'])
+        with mock.patch.object(conflicts, 'index_package', wraps=conflicts.index_package) as index_package:
+            report = analyze(self.mods_dir, self.index_path)
+        index_package.assert_called_once_with(bar)
+        assert_equal(len(report['collisions']), 1)
+
+    def test_removed_packages_are_dropped_from_index(self):
+        foo = self.create_package('com.example.foo_01.00.00.wotmod', ['res/scripts/a.pyc'])
+        analyze(self.mods_dir, self.index_path)
+        os.remove(foo)
+        report = analyze(self.mods_dir, self.index_path)
+        assert_equal(report['packages'], [])
+        assert_equal(conflicts.PackageIndex(self.index_path).entries, {})
+
+if __name__ == '__main__':
+    unittest.main()
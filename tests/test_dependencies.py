@@ -0,0 +1,108 @@
+"""
+Unit tests for building install_requires dependencies.
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.dependencies import (build_dependency, find_source, parse_requirements,
+                                            split_source_name)
+from setuptools.extern.packaging.version import Version
+
+DEPENDENCY_SETUP_PY = '''
+from setuptools import setup
+setup(name='dep', version=%r, author='tester', description='test', py_modules=['dep'])
+'''
+
+PYTHON27 = os.environ.get('BDIST_WOTMOD_PYTHON27')
+
+MOD_SETUP_PY = '''
+from setuptools import setup
+from setuptools_wotmod.bdist_wotmod import bdist_wotmod
+setup(name='mod', version='1.0', author='tester', description='test', py_modules=['mod'],
+      install_requires=['dep<2', 'other; python_version >= "3"'],
+      cmdclass={'bdist_wotmod': bdist_wotmod})
+'''
+
+class DependenciesTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(DependenciesTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+        self.index_dir = os.path.join(self.test_dir, 'index')
+        self.cache_dir = os.path.join(self.test_dir, 'cache')
+        os.mkdir(self.index_dir)
+        self.create_sdist('1.0')
+        self.create_sdist('2.0')
+
+    def create_sdist(self, version):
+        project_dir = os.path.join(self.test_dir, 'dep-%s' % version)
+        os.mkdir(project_dir)
+        self.write_file((project_dir, 'setup.py'), DEPENDENCY_SETUP_PY % version)
+        self.write_file((project_dir, 'dep.py'), 'VERSION = %r\n' % version)
+        with tarfile.open(os.path.join(self.index_dir, 'dep-%s.tar.gz' % version), 'w:gz') as archive:
+            archive.add(project_dir, 'dep-%s' % version)
+
+    def build_mod(self, *args):
+        mod_dir = os.path.join(self.test_dir, 'mod')
+        if not os.path.isdir(mod_dir):
+            os.mkdir(mod_dir)
+            self.write_file((mod_dir, 'setup.py'), MOD_SETUP_PY)
+            self.write_file((mod_dir, 'mod.py'), 'import dep\n')
+        env = dict(os.environ, BDIST_WOTMOD_CACHE_DIR=self.cache_dir)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        subprocess.check_call([sys.executable, 'setup.py', 'bdist_wotmod',
+                               '--dependency-dir=%s' % self.index_dir] + list(args),
+                              cwd=mod_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return os.path.join(mod_dir, 'dist')
+
+    def test_split_source_name(self):
+        assert_equal(split_source_name('Py_Dash-4.2.1.tar.gz'), ('py-dash', Version('4.2.1')))
+        assert_equal(split_source_name('README.txt'), None)
+
+    def test_markers_are_evaluated_for_game_environment(self):
+        requirements = parse_requirements(['dep<2', 'other; python_version >= "3"', 'win; sys_platform == "win32"'])
+        assert_equal([requirement.name for requirement in requirements], ['dep', 'win'])
+
+    def test_finds_newest_matching_source(self):
+        version, path = find_source(self.index_dir, parse_requirements(['dep<2'])[0])
+        assert_equal(version, Version('1.0'))
+        assert_equal(os.path.basename(path), 'dep-1.0.tar.gz')
+
+    @pytest.mark.skipif(not PYTHON27, reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_built_dependency_is_cached(self):
+        requirement = parse_requirements(['dep'])[0]
+        first = build_dependency(requirement, self.index_dir, self.cache_dir, {})
+        assert_equal([os.path.basename(path) for path in first], ['tester.dep_02.00.00.wotmod'])
+        mtime = os.path.getmtime(first[0])
+        second = build_dependency(requirement, self.index_dir, self.cache_dir, {})
+        assert_equal(second, first)
+        assert_equal(os.path.getmtime(second[0]), mtime)
+
+    @pytest.mark.skipif(not PYTHON27, reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_separate_dependency_packages(self):
+        dist_dir = self.build_mod()
+        assert_equal(sorted(os.listdir(dist_dir)), ['tester.dep_01.00.00.wotmod', 'tester.mod_01.00.00.wotmod'])
+
+    @pytest.mark.skipif(not PYTHON27, reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_vendored_dependencies(self):
+        dist_dir = self.build_mod('--bundle-dependencies=vendor', '--direct')
+        assert_equal(os.listdir(dist_dir), ['tester.mod_01.00.00.wotmod'])
+        with zipfile.ZipFile(os.path.join(dist_dir, 'tester.mod_01.00.00.wotmod')) as package:
+            names = package.namelist()
+            self.assertIn('res/scripts/common/dep.pyc', names)
+            self.assertIn('res/scripts/client/gui/mods/mod.pyc', names)
+            assert_equal(names.count('meta.xml'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Unit tests for syncing package contents unpacked to a directory.
+"""
+
+import unittest
+import os
+
+from nose.tools import assert_equal
+import mock
+
+from utils import TempdirManager
+
+from setuptools_wotmod import deploy
+from setuptools_wotmod.bdist_wotmod import PackageEntry
+from setuptools_wotmod.deploy import sync_entries
+
+class SyncEntriesTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(SyncEntriesTestCase, self).setUp()
+        self.src_dir = self.mkdtemp()
+        self.target_dir = self.mkdtemp()
+        self.write_file((self.src_dir, 'foo.pyc'), 'foo')
+        self.write_file((self.src_dir, 'big.dds'), 'x' * (deploy.PARALLEL_COPY_SIZE + 1))
+        self.entries = [
+            PackageEntry('res/', None, None),
+            PackageEntry('res/scripts/', None, None),
+            PackageEntry('res/scripts/foo.pyc', os.path.join(self.src_dir, 'foo.pyc'), None),
+            PackageEntry('res/mods/big.dds', os.path.join(self.src_dir, 'big.dds'), None),
+            PackageEntry('meta.xml', None, b'<root/>'),
+        ]
+
+    def sync(self, entries=None):
+        return sync_entries(self.entries if entries is None else entries, self.target_dir, 'com.example.foo')
+
+    def read_target(self, *parts):
+        with open(os.path.join(self.target_dir, *parts)) as target_file:
+            return target_file.read()
+
+    def test_writes_package_layout(self):
+        assert_equal(self.sync(), {'copied': 3, 'skipped': 0, 'removed': 0})
+        assert_equal(self.read_target('scripts', 'foo.pyc'), 'foo')
+        assert_equal(len(self.read_target('mods', 'big.dds')), deploy.PARALLEL_COPY_SIZE + 1)
+        assert_equal(self.read_target('.wotmod', 'com.example.foo', 'meta.xml'), '<root/>')
+
+    def test_unchanged_files_are_not_read(self):
+        self.sync()
+        with mock.patch.object(deploy, 'hash_file') as hash_file:
+            assert_equal(self.sync(), {'copied': 0, 'skipped': 3, 'removed': 0})
+        assert_equal(hash_file.call_count, 0)
+
+    def test_changed_files_are_copied(self):
+        self.sync()
+        self.write_file((self.src_dir, 'foo.pyc'), 'changed')
+        assert_equal(self.sync(), {'copied': 1, 'skipped': 2, 'removed': 0})
+        assert_equal(self.read_target('scripts', 'foo.pyc'), 'changed')
+
+    def test_stale_files_are_removed(self):
+        self.sync()
+        self.write_file((self.target_dir, 'scripts', 'other.pyc'), 'not ours')
+        assert_equal(self.sync(self.entries[3:]), {'copied': 0, 'skipped': 2, 'removed': 1})
+        self.assertFalse(os.path.exists(os.path.join(self.target_dir, 'scripts', 'foo.pyc')))
+        assert_equal(self.read_target('scripts', 'other.pyc'), 'not ours')
+
+    def test_modified_targets_are_not_removed(self):
+        self.sync()
+        self.write_file((self.target_dir, 'scripts', 'foo.pyc'), 'edited in place')
+        os.utime(os.path.join(self.target_dir, 'scripts', 'foo.pyc'), (1e9, 1e9))
+        assert_equal(self.sync(self.entries[3:])['removed'], 0)
+        assert_equal(self.read_target('scripts', 'foo.pyc'), 'edited in place')
+
+    def test_empty_directories_are_removed(self):
+        self.sync()
+        self.sync(self.entries[3:])
+        self.assertFalse(os.path.exists(os.path.join(self.target_dir, 'scripts')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Unit tests for comparing wotmod packages.
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+import zipfile
+
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.cli import main
+from setuptools_wotmod.diff import diff_packages
+from setuptools_wotmod.marshal27 import Code27, load_pyc, loads
+
+def compile_py27(source, mtime=b'\x00\x00\x00\x00'):
+    """
+    Returns contents of pyc file compiled from source with Python 2.7.
+    """
+    python = os.environ.get('BDIST_WOTMOD_PYTHON27', sys.executable)
+    script = ('import imp, marshal, sys\n'
+              'code = compile(sys.stdin.read(), "foo.py", "exec")\n'
+              'sys.stdout.write(imp.get_magic() + "\\0\\0\\0\\0" + marshal.dumps(code))\n')
+    process = subprocess.Popen([python, '-c', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    data = process.communicate(source.encode('utf-8'))[0]
+    return data[:4] + mtime + data[8:]
+
+class Marshal27TestCase(unittest.TestCase):
+
+    def test_loads_values(self):
+        data = (b'(\x06\x00\x00\x00'
+                b'i\xff\xff\xff\xff'
+                b'l\x02\x00\x00\x00\x00\x00\x01\x00'
+                b't\x03\x00\x00\x00abc'
+                b'R\x00\x00\x00\x00'
+                b'u\x02\x00\x00\x00\xc3\xa4'
+                b'{i\x01\x00\x00\x00N0')
+        assert_equal(loads(data), (-1, 32768, b'abc', b'abc', u'\xe4', {1: None}))
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_load_pyc(self):
+        header, code = load_pyc(compile_py27('def foo(a, b=1.5):\n    return [a, b, u"x", None]\n'))
+        assert_equal(header[:4], b'\x03\xf3\x0d\x0a')
+        assert_equal(code.name, b'<module>')
+        foo = [const for const in code.consts if isinstance(const, Code27)][0]
+        assert_equal((foo.name, foo.argcount, foo.varnames), (b'foo', 2, (b'a', b'b')))
+        self.assertIn(u'x', foo.consts)
+
+class DiffTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(DiffTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+
+    def create_package(self, filename, members):
+        path = os.path.join(self.test_dir, filename)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip:
+            zip.writestr('res/', b'')
+            for name, data in sorted(members.items()):
+                zip.writestr(name, data)
+        return path
+
+    def test_compares_central_directories(self):
+        old = self.create_package('old.wotmod', {
+            'meta.xml': b'<root>\n  <id>foo</id>\n  <version>01.00.00</version>\n</root>\n',
+            'res/mods/foo/same.bin': b'\x00\x01',
+            'res/mods/foo/removed.txt': b'removed',
+            'res/mods/foo/changed.bin': b'\x00\x01',
+        })
+        new = self.create_package('new.wotmod', {
+            'meta.xml': b'<root>\n  <id>foo</id>\n  <version>01.01.00</version>\n</root>\n',
+            'res/mods/foo/same.bin': b'\x00\x01',
+            'res/mods/foo/added.txt': b'added',
+            'res/mods/foo/changed.bin': b'\x00\x02\x03',
+        })
+        report = diff_packages(old, new)
+        assert_equal(report['added'], [{'path': 'res/mods/foo/added.txt', 'size': 5}])
+        assert_equal(report['removed'], [{'path': 'res/mods/foo/removed.txt', 'size': 7}])
+        assert_equal([change['path'] for change in report['changed']], ['meta.xml', 'res/mods/foo/changed.bin'])
+        assert_equal(report['changed'][0]['diff'][2:], [
+            '@@ -1,4 +1,4 @@', ' <root>', '   <id>foo</id>', '-  <version>01.00.00</version>',
+            '+  <version>01.01.00</version>', ' </root>'])
+        assert_equal(report['changed'][1]['diff'], None)
+        assert_equal(report['unchanged'], 1)
+        assert_equal(report['size']['delta'], -1)
+        assert_equal(report['size']['package_delta'], os.path.getsize(new) - os.path.getsize(old))
+
+    def test_without_content_nothing_is_decompressed(self):
+        old = self.create_package('old.wotmod', {'meta.xml': b'<root/>'})
+        new = self.create_package('new.wotmod', {'meta.xml': b'<root></root>'})
+        report = diff_packages(old, new, content=False)
+        assert_equal(report['changed'], [{'path': 'meta.xml', 'old_size': 7, 'new_size': 13, 'diff': None}])
+
+    @pytest.mark.skipif(sys.version_info >= (3, 0) and 'BDIST_WOTMOD_PYTHON27' not in os.environ,
+                        reason='Requires BDIST_WOTMOD_PYTHON27')
+    def test_compares_code_objects_of_pyc_files(self):
+        source = 'class Foo(object):\n    def bar(self):\n        return 1\n\ndef baz():\n    pass\n'
+        old = self.create_package('old.wotmod', {
+            'res/foo.pyc': compile_py27(source),
+            'res/same.pyc': compile_py27('x = 1\n', b'\x01\x00\x00\x00'),
+        })
+        new = self.create_package('new.wotmod', {
+            'res/foo.pyc': compile_py27(source.replace('return 1', 'return 2').replace('def baz', 'def qux')),
+            'res/same.pyc': compile_py27('x = 1\n', b'\x02\x00\x00\x00'),
+        })
+        changes = dict((change['path'], change['diff']) for change in diff_packages(old, new)['changed'])
+        assert_equal(changes['res/foo.pyc'], [
+            'code changed: <module> (constants, names)',
+            'code changed: Foo.bar (constants)',
+            'code removed: baz',
+            'code added: qux',
+        ])
+        assert_equal(changes['res/same.pyc'], ['code identical, only modification time in header differs'])
+
+    def test_command_returns_one_if_packages_differ(self):
+        old = self.create_package('old.wotmod', {'meta.xml': b'<root/>'})
+        new = self.create_package('new.wotmod', {'meta.xml': b'<root/>', 'res/foo.txt': b'foo'})
+        assert_equal(main(['diff', old, old]), 0)
+        assert_equal(main(['diff', '--json', old, new]), 1)
@@ -0,0 +1,42 @@
+"""
+Unit tests for advisory file locks.
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+
+from nose.tools import assert_equal, assert_raises
+
+from utils import TempdirManager
+
+from setuptools_wotmod.locking import FileLock, LockTimeout
+
+class FileLockTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(FileLockTestCase, self).setUp()
+        self.path = os.path.join(self.mkdtemp(), 'cache', 'cache.lock')
+
+    def test_excludes_other_holders(self):
+        with FileLock(self.path):
+            assert_raises(LockTimeout, FileLock(self.path, timeout=0.1).acquire)
+        with FileLock(self.path, timeout=0.1):
+            pass
+        self.assertTrue(os.path.isfile(self.path))
+
+    def test_excludes_other_processes(self):
+        script = ('import sys; from setuptools_wotmod.locking import FileLock\n'
+                  'lock = FileLock(sys.argv[1]); lock.acquire()\n'
+                  'sys.stdout.write("locked\\n"); sys.stdout.flush(); sys.stdin.read()\n')
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        process = subprocess.Popen([sys.executable, '-c', script, self.path], env=env,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert_equal(process.stdout.readline(), b'locked\n')
+            assert_raises(LockTimeout, FileLock(self.path, timeout=0.1).acquire)
+        finally:
+            process.communicate()
+        with FileLock(self.path, timeout=5):
+            pass
@@ -0,0 +1,81 @@
+"""
+Unit tests for package size optimizations.
+"""
+
+import unittest
+import os
+
+from nose.tools import assert_equal
+
+from utils import TempdirManager
+
+from setuptools_wotmod.bdist_wotmod import PackageEntry
+from setuptools_wotmod.optimize import minify_json, minify_xml, optimize_entries
+
+class MinifyTestCase(unittest.TestCase):
+
+    def test_minify_xml_removes_comments_and_whitespace_between_elements(self):
+        data = b'<?xml version="1.0"?>\n<!-- comment -->\n<root>\n  <a x="1"> text </a>\n  <b/>\n</root>\n'
+        assert_equal(minify_xml(data), b'<root><a x="1"> text </a><b /></root>')
+
+    def test_minify_xml_skips_invalid_and_namespaced_documents(self):
+        assert_equal(minify_xml(b'\x45\x4e\xa1\x62'), None)
+        assert_equal(minify_xml(b'<root xmlns:a="urn:a">\n  <a:b/>\n</root>'), None)
+
+    def test_minify_json_keeps_member_order(self):
+        assert_equal(minify_json(b'{\n  "b": [1, 2],\n  "a": "\xc3\xa4"\n}'), b'{"b":[1,2],"a":"\xc3\xa4"}')
+        assert_equal(minify_json(b'{invalid'), None)
+
+class OptimizeEntriesTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(OptimizeEntriesTestCase, self).setUp()
+        self.tmp_dir = self.mkdtemp()
+        self.entries = [PackageEntry('res/', None, None), PackageEntry('res/mods/', None, None)]
+        for name, content in [('foo.py', 'x = 1\n'), ('foo.pyc', 'pyc-data'), ('foo.pyo', 'pyo'),
+                              ('data.json', '{ "a": 1 }'), ('data.xml', '<a>\n  <b/>\n</a>')]:
+            self.write_file((self.tmp_dir, name), content)
+            self.entries.append(PackageEntry('res/mods/' + name, os.path.join(self.tmp_dir, name), None))
+        self.entries.append(PackageEntry('meta.xml', None, b'<root>\n  <id>foo</id>\n</root>'))
+
+    def get_contents(self, entries):
+        contents = {}
+        for entry in entries:
+            if entry.path is not None:
+                with open(entry.path, 'rb') as entry_file:
+                    contents[entry.archive_path] = entry_file.read()
+            else:
+                contents[entry.archive_path] = entry.data
+        return contents
+
+    def test_without_optimizations_only_optimized_modules_are_left_out(self):
+        entries, report = optimize_entries(self.entries)
+        assert_equal(sorted(self.get_contents(entries)), [
+            'meta.xml', 'res/', 'res/mods/', 'res/mods/data.json', 'res/mods/data.xml',
+            'res/mods/foo.py', 'res/mods/foo.pyc'])
+        assert_equal(report['total']['saved'], 0)
+
+    def test_optimized_modules_are_packaged_as_compiled_modules(self):
+        entries = [entry for entry in self.entries if not entry.archive_path.endswith('.pyc')]
+        entries, report = optimize_entries(entries, optimize=2, exclude_sources=True)
+        contents = self.get_contents(entries)
+        self.assertNotIn('res/mods/foo.py', contents)
+        self.assertNotIn('res/mods/foo.pyo', contents)
+        assert_equal(contents['res/mods/foo.pyc'], b'pyo')
+
+    def test_applies_all_optimizations(self):
+        entries, report = optimize_entries(self.entries, optimize=1, exclude_sources=True, minify=True)
+        contents = self.get_contents(entries)
+        assert_equal(sorted(contents), [
+            'meta.xml', 'res/', 'res/mods/', 'res/mods/data.json', 'res/mods/data.xml', 'res/mods/foo.pyc'])
+        assert_equal(contents['res/mods/foo.pyc'], b'pyo')
+        assert_equal(contents['res/mods/data.json'], b'{"a":1}')
+        assert_equal(contents['res/mods/data.xml'], b'<a><b /></a>')
+        assert_equal(contents['meta.xml'], b'<root>\n  <id>foo</id>\n</root>')
+        # foo.py 6 -> 0, data.json 10 -> 7, data.xml 15 -> 12, foo.pyc left
+        # from an earlier build is replaced with foo.pyo
+        assert_equal(report['total']['saved'], 6 + 3 + 3)
+        assert_equal(report['types']['.py'], {'before': 6, 'after': 0, 'saved': 6})
+        assert_equal(report['types']['.pyc'], {'before': 3, 'after': 3, 'saved': 0})
+        assert_equal(report['directories']['res/mods']['saved'], 12)
+        assert_equal(report['directories']['.']['saved'], 0)
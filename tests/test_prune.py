@@ -0,0 +1,138 @@
+"""
+Unit tests for import reachability pruning.
+"""
+
+import unittest
+
+from nose.tools import assert_equal
+
+from setuptools_wotmod.prune import (ImportRef, Module, ModuleGraph, get_module_name, get_package_prefix,
+                                     is_entry_module, parse_keep_patterns, scan_imports)
+
+def create_graph(sources, packages=()):
+    return ModuleGraph([Module(name, name in packages, (lambda source=source: source))
+                        for name, source in sources.items()])
+
+class ScanImportsTestCase(unittest.TestCase):
+
+    def test_finds_import_statements(self):
+        refs, absolute_import = scan_imports(
+            'import a, b.c as d\n'
+            'from e import (f,\n    g as h)\n'
+            'from . import i\n'
+            'from ..j import *\n'
+            'if True: import k; import l\n'
+            'def foo():\n'
+            '    import m\n'
+            '# import n\n'
+            'x = "import o"\n')
+        assert_equal(refs, [
+            ImportRef('a', 0, None), ImportRef('b.c', 0, None), ImportRef('e', 0, ['f', 'g']),
+            ImportRef('', 1, ['i']), ImportRef('j', 2, ['*']), ImportRef('k', 0, None),
+            ImportRef('l', 0, None), ImportRef('m', 0, None)])
+        assert_equal(absolute_import, False)
+
+    def test_accepts_python2_syntax(self):
+        refs, _ = scan_imports(b'print "foo"\nexec "x = 1"\nimport a\ntry:\n    pass\nexcept Exception, e:\n'
+                               b'    import b\nx = 0777\n')
+        assert_equal(refs, [ImportRef('a', 0, None), ImportRef('b', 0, None)])
+
+    def test_finds_dynamic_imports_of_string_literals(self):
+        refs, _ = scan_imports('a = __import__("a")\nb = importlib.import_module(\'b.c\')\nc = __import__(name)\n')
+        assert_equal(refs, [ImportRef('a', 0, None), ImportRef('b.c', 0, None)])
+
+    def test_detects_absolute_import(self):
+        _, absolute_import = scan_imports('from __future__ import print_function, absolute_import\n')
+        assert_equal(absolute_import, True)
+
+    def test_falls_back_to_scanning_lines(self):
+        refs, _ = scan_imports('import a\nx = (\nfrom b import c\n')
+        assert_equal(refs, [ImportRef('a', 0, None), ImportRef('b', 0, ['c'])])
+
+class ModuleGraphTestCase(unittest.TestCase):
+
+    def test_resolves_implicit_relative_imports(self):
+        graph = create_graph({
+            'pkg': '', 'pkg.a': 'import b', 'pkg.b': '', 'b': '',
+            'absolute': '', 'absolute.a': 'from __future__ import absolute_import\nimport b', 'absolute.b': '',
+        }, packages=['pkg', 'absolute'])
+        assert_equal(sorted(graph.get_imports('pkg.a')), ['pkg', 'pkg.b'])
+        assert_equal(sorted(graph.get_imports('absolute.a')), ['b'])
+
+    def test_resolves_explicit_relative_imports(self):
+        graph = create_graph({
+            'pkg': 'from . import a', 'pkg.a': 'from .sub import c\nfrom . import b', 'pkg.b': '',
+            'pkg.sub': '', 'pkg.sub.c': '', 'pkg.sub.d': 'from .. import b\nfrom ...pkg import a',
+        }, packages=['pkg', 'pkg.sub'])
+        assert_equal(sorted(set(graph.get_imports('pkg'))), ['pkg', 'pkg.a'])
+        assert_equal(sorted(set(graph.get_imports('pkg.a'))), ['pkg', 'pkg.b', 'pkg.sub', 'pkg.sub.c'])
+        # Import beyond the top level package resolves to nothing
+        assert_equal(sorted(set(graph.get_imports('pkg.sub.d'))), ['pkg', 'pkg.b'])
+
+    def test_star_import_reaches_submodules(self):
+        graph = create_graph({'pkg': '', 'pkg.a': '', 'pkg.b': '', 'pkg.b.c': '', 'main': 'from pkg import *'},
+                             packages=['pkg', 'pkg.b'])
+        assert_equal(sorted(graph.get_imports('main')), ['pkg', 'pkg.a', 'pkg.b'])
+
+    def test_finds_reachable_modules(self):
+        graph = create_graph({
+            'mod_foo': 'import foo.a', 'foo': '', 'foo.a': 'from foo import b', 'foo.b': '', 'foo.c': '',
+            'unused': 'import foo.c',
+        }, packages=['foo'])
+        assert_equal(graph.find_reachable(['mod_foo']), set(['mod_foo', 'foo', 'foo.a', 'foo.b']))
+
+    def test_keeps_whole_package_of_modules_without_source(self):
+        graph = ModuleGraph([
+            Module('mod_foo', False, lambda: 'import lib.a'), Module('lib', True, lambda: ''),
+            Module('lib.a', False, lambda: None), Module('lib.b', False, lambda: ''),
+            Module('other', False, lambda: ''),
+        ])
+        assert_equal(graph.find_reachable(['mod_foo']), set(['mod_foo', 'lib', 'lib.a', 'lib.b']))
+
+    def test_roots_include_kept_modules(self):
+        graph = create_graph({'mod_foo': '', 'foo': '', 'foo.plugins': '', 'foo.plugins.a': '', 'bar': ''},
+                             packages=['foo', 'foo.plugins'])
+        roots = graph.get_roots(['mod_foo'], parse_keep_patterns('foo.plugins, bar'))
+        assert_equal(sorted(roots), ['bar', 'foo.plugins', 'foo.plugins.a', 'mod_foo'])
+        assert_equal(sorted(graph.get_roots([], ['foo.plugins.*'])), ['foo.plugins.a'])
+
+    def test_resolves_absolute_imports_of_installed_modules(self):
+        graph = ModuleGraph([
+            Module('gui.mods.mod_a', False, lambda: 'from gui.mods.helper import x\nimport gui.mods.helper2'),
+            Module('gui.mods.helper', False, lambda: 'import lib.a'),
+            Module('gui.mods.helper2', False, lambda: 'import helper3'),
+            Module('gui.mods.helper3', False, lambda: ''),
+            Module('gui.mods.unused', False, lambda: ''),
+            Module('gui.mods.lib', True, lambda: ''),
+            Module('gui.mods.lib.a', False, lambda: None),
+            Module('gui.mods.lib.b', False, lambda: ''),
+        ], prefixes=['gui.mods'])
+        assert_equal(graph.find_reachable(['gui.mods.mod_a']), set([
+            'gui.mods.mod_a', 'gui.mods.helper', 'gui.mods.helper2', 'gui.mods.helper3', 'gui.mods.lib',
+            'gui.mods.lib.a', 'gui.mods.lib.b',
+        ]))
+        assert_equal(graph.get_roots([], ['lib.*']), ['gui.mods.lib.a', 'gui.mods.lib.b'])
+
+class ModuleNameTestCase(unittest.TestCase):
+
+    def test_get_module_name(self):
+        lib_dirs = ['res/scripts/client/gui/mods', 'res/scripts/common']
+        assert_equal(get_module_name('res/scripts/client/gui/mods/mod_foo.pyc', lib_dirs),
+                     ('gui.mods.mod_foo', False))
+        assert_equal(get_module_name('res/scripts/common/foo/__init__.py', lib_dirs), ('foo', True))
+        assert_equal(get_module_name('res/scripts/common/foo/bar.py', lib_dirs), ('foo.bar', False))
+        assert_equal(get_module_name('res/scripts/common/foo/data.xml', lib_dirs), (None, False))
+        assert_equal(get_module_name('res/mods/foo.py', lib_dirs), (None, False))
+        assert_equal(get_module_name('res/scripts/client/gui/mods/__init__.py', lib_dirs), (None, False))
+
+    def test_get_package_prefix(self):
+        assert_equal(get_package_prefix('res/scripts/client/gui/mods'), 'gui.mods')
+        assert_equal(get_package_prefix('/res/scripts/client/gui/mods/'), 'gui.mods')
+        assert_equal(get_package_prefix('res/scripts/common'), '')
+        assert_equal(get_package_prefix('res/mods/foo'), '')
+
+    def test_is_entry_module(self):
+        assert_equal(is_entry_module('gui.mods.mod_foo'), True)
+        assert_equal(is_entry_module('gui.mods.foo'), False)
+        assert_equal(is_entry_module('mod_foo'), False)
+        assert_equal(is_entry_module('gui.mods.pkg.mod_foo'), False)
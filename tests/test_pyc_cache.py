@@ -0,0 +1,86 @@
+"""
+Unit tests for the compiled modules cache.
+"""
+
+import unittest
+import os
+import struct
+
+from nose.tools import assert_equal
+
+from utils import TempdirManager
+
+from setuptools_wotmod.pyc_cache import PycCache, set_pyc_mtime
+
+PYC_DATA = b'\x03\xf3\x0d\x0a' + struct.pack('<I', 1234) + b'code'
+
+class PycCacheTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(PycCacheTestCase, self).setUp()
+        self.cache_dir = self.mkdtemp()
+        self.build_dir = self.mkdtemp()
+        self.cache = PycCache(self.cache_dir, 1024)
+
+    def read(self, path):
+        with open(path, 'rb') as data_file:
+            return data_file.read()
+
+    def store(self, name, data=PYC_DATA):
+        cfile = os.path.join(self.build_dir, name + '.pyc')
+        with open(cfile, 'wb') as data_file:
+            data_file.write(data)
+        key = self.cache.get_key(name, '2.7.18', 0, name + '.py')
+        self.cache.store(key, cfile)
+        return key
+
+    def test_key_depends_on_source_interpreter_optimize_and_filename(self):
+        key = self.cache.get_key('hash', '2.7.18', 0, 'foo.py')
+        assert_equal(key, self.cache.get_key('hash', '2.7.18', 0, 'foo.py'))
+        self.assertNotEqual(key, self.cache.get_key('hash2', '2.7.18', 0, 'foo.py'))
+        self.assertNotEqual(key, self.cache.get_key('hash', '2.7.17', 0, 'foo.py'))
+        self.assertNotEqual(key, self.cache.get_key('hash', '2.7.18', 1, 'foo.py'))
+        self.assertNotEqual(key, self.cache.get_key('hash', '2.7.18', 0, 'bar.py'))
+
+    def test_fetch_writes_cached_module_with_source_mtime(self):
+        key = self.store('foo')
+        cfile = os.path.join(self.build_dir, 'out.pyc')
+        self.assertTrue(self.cache.fetch(key, cfile, 5678))
+        assert_equal(self.read(cfile), set_pyc_mtime(PYC_DATA, 5678))
+        assert_equal((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_fetch_misses_unknown_key(self):
+        cfile = os.path.join(self.build_dir, 'out.pyc')
+        self.assertFalse(self.cache.fetch('0' * 40, cfile, 5678))
+        self.assertFalse(os.path.exists(cfile))
+        assert_equal((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_evicts_least_recently_used_entries(self):
+        data = PYC_DATA + b'x' * 500
+        keys = [self.store(name, data) for name in ('foo', 'bar')]
+        os.utime(self.cache.get_path(keys[0]), (1000000000, 1000000000))
+        os.utime(self.cache.get_path(keys[1]), (1000000100, 1000000100))
+        # Using an entry makes it the most recently used one
+        self.cache.fetch(keys[0], os.path.join(self.build_dir, 'out.pyc'), 0)
+        keys.append(self.store('baz', data))
+        self.cache.max_size = 1200
+        assert_equal(self.cache.evict(), 1)
+        self.assertTrue(os.path.exists(self.cache.get_path(keys[0])))
+        self.assertFalse(os.path.exists(self.cache.get_path(keys[1])))
+        self.assertTrue(os.path.exists(self.cache.get_path(keys[2])))
+
+    def test_stats_accumulate_over_builds(self):
+        key = self.store('foo')
+        cfile = os.path.join(self.build_dir, 'out.pyc')
+        self.cache.fetch(key, cfile, 0)
+        self.cache.fetch('0' * 40, cfile, 0)
+        self.cache.save_stats()
+        cache = PycCache(self.cache_dir, 1024)
+        cache.fetch(key, cfile, 0)
+        cache.save_stats()
+        stats = cache.get_stats()
+        assert_equal((stats['hits'], stats['misses'], stats['entries']), (2, 1, 1))
+        assert_equal(stats['size'], len(PYC_DATA))
+        cache.clear()
+        assert_equal(cache.get_stats()['entries'], 0)
+        assert_equal(cache.get_stats()['hits'], 0)
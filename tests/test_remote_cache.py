@@ -0,0 +1,65 @@
+"""
+Unit tests for remote cache client and reference server.
+"""
+
+import unittest
+import os
+import threading
+
+from nose.tools import assert_equal
+
+from utils import TempdirManager
+
+from setuptools_wotmod.remote_cache import CacheServer, RemoteCache
+
+KEY = 'ab' * 20
+
+class RemoteCacheTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(RemoteCacheTestCase, self).setUp()
+        self.cache_dir = self.mkdtemp()
+        self.server = CacheServer(self.cache_dir, ('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.cache = RemoteCache(self.server.get_url())
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(RemoteCacheTestCase, self).tearDown()
+
+    def test_put_and_get(self):
+        self.assertTrue(self.cache.put('pyc', KEY, b'data'))
+        assert_equal(self.cache.get('pyc', KEY), b'data')
+        assert_equal(self.cache.get('package', KEY), None)
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_dir, 'pyc', KEY[:2], KEY)))
+        assert_equal((self.cache.hits, self.cache.misses, self.cache.uploads), (1, 1, 1))
+        self.assertTrue(self.cache.enabled)
+
+    def test_counts_requests_from_several_threads(self):
+        self.assertTrue(self.cache.put('pyc', KEY, b'data'))
+        def request(index):
+            for _ in range(5):
+                self.cache.get('pyc', KEY if index % 2 else 'cd' * 20)
+        threads = [threading.Thread(target=request, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal((self.cache.hits, self.cache.misses, self.cache.uploads), (20, 20, 1))
+
+    def test_server_rejects_invalid_paths(self):
+        self.assertFalse(self.cache.put('pyc', '../../etc', b'data'))
+        assert_equal(self.cache.get('other', KEY), None)
+        assert_equal(os.listdir(self.cache_dir), [])
+
+    def test_unreachable_cache_is_disabled(self):
+        # Port which no one listens to
+        server = CacheServer(self.cache_dir, ('127.0.0.1', 0))
+        cache = RemoteCache(server.get_url(), timeout=1)
+        server.server_close()
+        assert_equal(cache.get('pyc', KEY), None)
+        self.assertFalse(cache.enabled)
+        self.assertFalse(cache.put('pyc', KEY, b'data'))
@@ -0,0 +1,73 @@
+"""
+Unit tests for resource manifest runtime helper.
+"""
+
+import unittest
+
+from nose.tools import assert_equal, assert_raises
+
+from setuptools_wotmod.resources import (DIRECTORY, FILE, ManifestEntry, ResourceManifest, format_manifest,
+                                         open_manifest, parse_manifest)
+
+ENTRIES = [
+    ManifestEntry('mods/foo/icons/a.png', FILE, 3, 0xcafe),
+    ManifestEntry('mods/foo/icons/b.png', FILE, 4, 0xffffffff),
+    ManifestEntry('mods/foo/empty', DIRECTORY, 0, 0),
+    ManifestEntry('mods/foo/data.xml', FILE, 5, 1),
+]
+
+class ManifestFormatTestCase(unittest.TestCase):
+
+    def test_format_and_parse(self):
+        data = format_manifest(ENTRIES)
+        assert_equal(data.splitlines()[:2], [b'wotmod-manifest 1', b'f\t5\t00000001\tmods/foo/data.xml'])
+        assert_equal(sorted(parse_manifest(data)), sorted(ENTRIES))
+
+    def test_parse_rejects_other_files(self):
+        assert_raises(ValueError, parse_manifest, b'<root/>')
+
+class ResourceManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.files = {'mods/foo/icons/a.png': b'aaa', 'mods/foo/icons/b.png': b'bbbb', 'mods/foo/data.xml': b'xxxxx',
+                      'mods/foo/resources.manifest': format_manifest(ENTRIES)}
+        self.reads = []
+        self.manifest = open_manifest('mods/foo/resources.manifest', self.read, cache_size=8)
+
+    def read(self, path):
+        self.reads.append(path)
+        return self.files.get(path)
+
+    def test_queries(self):
+        assert_equal(self.manifest.list_directory('mods/foo'), ['data.xml', 'empty', 'icons'])
+        assert_equal(self.manifest.list_directory('mods/foo/icons/'), ['a.png', 'b.png'])
+        assert_equal(self.manifest.list_directory('mods/foo/empty'), [])
+        assert_equal(self.manifest.list_directory('mods/bar'), [])
+        assert_equal(self.manifest.exists('mods/foo/icons'), True)
+        assert_equal(self.manifest.is_dir('mods'), True)
+        assert_equal(self.manifest.is_file('mods/foo/icons'), False)
+        assert_equal(self.manifest.is_file('mods\\foo\\data.xml'), True)
+        assert_equal(self.manifest.exists('mods/foo/missing.xml'), False)
+        assert_equal(self.manifest.get_entry('mods/foo/icons/b.png').crc, 0xffffffff)
+        assert_equal(self.manifest.walk('mods/foo/icons'), ['mods/foo/icons/a.png', 'mods/foo/icons/b.png'])
+        assert_equal(self.reads, ['mods/foo/resources.manifest'])
+
+    def test_read_file_caches_least_recently_used_contents(self):
+        assert_equal(self.manifest.read_file('mods/foo/icons/a.png'), b'aaa')
+        assert_equal(self.manifest.read_file('mods/foo/icons/b.png'), b'bbbb')
+        assert_equal(self.manifest.read_file('mods/foo/icons/a.png'), b'aaa')
+        # Exceeds cache size, b.png was used least recently
+        assert_equal(self.manifest.read_file('mods/foo/data.xml'), b'xxxxx')
+        assert_equal(self.manifest.read_file('mods/foo/icons/a.png'), b'aaa')
+        assert_equal(self.manifest.read_file('mods/foo/icons/b.png'), b'bbbb')
+        assert_equal(self.manifest.read_file('mods/foo/missing.xml'), None)
+        assert_equal(self.reads[1:], ['mods/foo/icons/a.png', 'mods/foo/icons/b.png', 'mods/foo/data.xml',
+                                      'mods/foo/icons/b.png'])
+
+    def test_open_missing_manifest(self):
+        assert_raises(IOError, open_manifest, 'mods/bar/resources.manifest', self.read)
+
+    def test_entries_without_directories(self):
+        manifest = ResourceManifest([ManifestEntry('a/b/c.txt', FILE, 1, 0)], self.read)
+        assert_equal(manifest.list_directory(''), ['a'])
+        assert_equal(manifest.is_dir('a/b'), True)
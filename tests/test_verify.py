@@ -0,0 +1,101 @@
+"""
+Unit tests for verifying built wotmod packages.
+"""
+
+import unittest
+import json
+import os
+import zipfile
+
+from nose.tools import assert_equal
+
+from utils import TempdirManager
+
+from setuptools_wotmod.cli import main
+from setuptools_wotmod.verify import verify_package, verify_packages
+
+METAXML = b'''<root>
+  <id>com.example.foo</id>
+  <version>01.00.00</version>
+  <name>foo</name>
+  <description>Foo mod</description>
+</root>'''
+
+PYC = b'\x03\xf3\x0d\x0a' + b'\x00' * 12
+
+class VerifyTestCase(TempdirManager, unittest.TestCase):
+
+    def setUp(self):
+        super(VerifyTestCase, self).setUp()
+        self.test_dir = self.mkdtemp()
+
+    def create_package(self, entries=None, filename='com.example.foo_01.00.00.wotmod', metaxml=METAXML):
+        if entries is None:
+            entries = [('res/', None), ('res/scripts/', None), ('res/scripts/foo.pyc', PYC)]
+        path = os.path.join(self.test_dir, filename)
+        with zipfile.ZipFile(path, 'w') as zip:
+            if metaxml is not None:
+                zip.writestr('meta.xml', metaxml)
+            for name, data in entries:
+                info = zipfile.ZipInfo(name)
+                if data is None:
+                    info.external_attr = 0o40755 << 16 | 0x10
+                    data = b''
+                zip.writestr(info, data)
+        return path
+
+    def test_valid_package(self):
+        result = verify_package(self.create_package())
+        assert_equal(result['errors'], [])
+        self.assertTrue(result['ok'])
+
+    def test_invalid_pyc_file(self):
+        result = verify_package(self.create_package([
+            ('res/', None), ('res/scripts/', None), ('res/scripts/foo.pyc', b'\x33\x0d\x0d\x0a')]))
+        assert_equal(result['errors'], ['res/scripts/foo.pyc: not a Python 2.7 byte-compiled file'])
+
+    def test_metaxml_must_match_file_name(self):
+        result = verify_package(self.create_package(filename='com.example.bar_01.00.01.wotmod'))
+        assert_equal(result['errors'], [
+            "meta.xml: id 'com.example.foo' does not match file name com.example.bar_01.00.01.wotmod",
+            "meta.xml: version '01.00.00' does not match file name com.example.bar_01.00.01.wotmod",
+        ])
+
+    def test_malformed_metaxml(self):
+        result = verify_package(self.create_package(metaxml=b'<root><id>'))
+        self.assertFalse(result['ok'])
+        self.assertTrue(result['errors'][0].startswith('meta.xml: not well-formed'))
+
+    def test_directory_entries(self):
+        path = self.create_package([('res/', None), ('res/scripts/foo.pyc', PYC)])
+        with zipfile.ZipFile(path, 'a') as zip:
+            zip.writestr(zipfile.ZipInfo('res/mods/'), b'')
+        result = verify_package(path)
+        assert_equal(sorted(result['errors']), [
+            'res/mods/: directory entry has no directory flag',
+            'res/scripts/foo.pyc: parent directory entry res/scripts/ is missing',
+        ])
+
+    def test_files_outside_of_res(self):
+        result = verify_package(self.create_package([('scripts/', None), ('scripts/foo.pyc', PYC)]))
+        assert_equal(result['errors'], [
+            'scripts/: outside of res/ directory',
+            'scripts/foo.pyc: outside of res/ directory',
+        ])
+
+    def test_verifies_directories_of_packages(self):
+        self.create_package()
+        self.create_package(filename='com.example.foo_01.00.01.wotmod')
+        results = verify_packages([self.test_dir], jobs=2)
+        assert_equal([result['ok'] for result in results], [True, False])
+
+    def test_json_report(self):
+        self.create_package()
+        report_path = os.path.join(self.mkdtemp(), 'report.json')
+        assert_equal(main(['verify', '--report', report_path, self.test_dir]), 0)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        assert_equal([package['ok'] for package in report['packages']], [True])
+
+if __name__ == '__main__':
+    unittest.main()
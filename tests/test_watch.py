@@ -0,0 +1,82 @@
+"""
+Unit tests for watching source directories.
+"""
+
+import unittest
+import os
+import sys
+import threading
+import time
+
+from nose.tools import assert_equal
+import pytest
+
+from utils import TempdirManager
+
+from setuptools_wotmod.watch import InotifyWatcher, PollingWatcher, wait_for_changes
+
+class WatcherTests(object):
+
+    def setUp(self):
+        super(WatcherTests, self).setUp()
+        self.test_dir = self.mkdtemp()
+        os.mkdir(os.path.join(self.test_dir, 'sub'))
+        self.write_file((self.test_dir, 'foo.py'), 'x = 1')
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        super(WatcherTests, self).tearDown()
+
+    def test_reports_changed_files(self):
+        self.watcher.watch(self.test_dir)
+        self.touch('foo.py', 'x = 2')
+        assert_equal(wait_for_changes(self.watcher, 0.3), set([os.path.join(self.test_dir, 'foo.py')]))
+
+    def test_ignores_compiled_and_temporary_files(self):
+        self.watcher.watch(self.test_dir)
+        self.touch('foo.pyc', 'x')
+        self.touch('.foo.py.swp', 'x')
+        assert_equal(self.watcher.read(0.3), set())
+
+    def test_recursive_watch(self):
+        self.watcher.watch(self.test_dir, recursive=True)
+        self.touch(os.path.join('sub', 'data.xml'), '<root/>')
+        self.assertIn(os.path.join(self.test_dir, 'sub', 'data.xml'), wait_for_changes(self.watcher, 0.3))
+
+    def test_burst_of_changes_is_debounced(self):
+        self.watcher.watch(self.test_dir)
+
+        def save_repeatedly():
+            for index in range(5):
+                self.touch('foo.py', 'x = %d' % index)
+                time.sleep(0.05)
+            self.touch('bar.py', 'y = 1')
+
+        thread = threading.Thread(target=save_repeatedly)
+        thread.start()
+        changed = wait_for_changes(self.watcher, 0.5)
+        thread.join()
+        assert_equal(changed, set([os.path.join(self.test_dir, 'foo.py'), os.path.join(self.test_dir, 'bar.py')]))
+
+    def touch(self, name, contents):
+        path = os.path.join(self.test_dir, name)
+        self.write_file(path, contents)
+        # Polling compares modification times, ensure that they differ
+        mtime = time.time() + getattr(self, 'mtime_offset', 0)
+        self.mtime_offset = getattr(self, 'mtime_offset', 0) + 2
+        os.utime(path, (mtime, mtime))
+
+class PollingWatcherTestCase(WatcherTests, TempdirManager, unittest.TestCase):
+
+    def create_watcher(self):
+        return PollingWatcher(interval=0.02)
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='Requires Linux')
+class InotifyWatcherTestCase(WatcherTests, TempdirManager, unittest.TestCase):
+
+    def create_watcher(self):
+        return InotifyWatcher()
+
+if __name__ == '__main__':
+    unittest.main()